@@ -0,0 +1,59 @@
+"""
+Analyze a directory or archive of reports without the API server.
+
+    python -m app.batch reports/ --output results.jsonl
+    python -m app.batch reports.zip --output results.parquet --format parquet
+    python -m app.batch reports/ --output results.jsonl --explain
+
+Results are written as each document finishes. Running the same command
+again after an interruption skips the documents already written.
+"""
+import sys
+import asyncio
+import argparse
+
+from app.services.batch import run_batch
+from app.services.document_executor import document_executor
+from app.services.llm_service import close_provider
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Directory (searched recursively) or .zip/.tar archive of PDFs and images")
+    parser.add_argument("--output", required=True, help="JSONL file, or directory of Parquet part files")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], help="Output format (default: from the output name)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: OUTPUT.checkpoint)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: DOC_WORKERS, the CPU count)")
+    parser.add_argument("--explain", action="store_true", help="Also generate explanations and recommendations with the model")
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ("parquet" if args.output.rstrip("/").endswith(".parquet") else "jsonl")
+    if args.workers:
+        document_executor.max_workers = max(1, args.workers)
+        document_executor.queue_limit = document_executor.max_workers * 2
+
+    def progress(stats):
+        done = stats["processed"] + stats["failed"]
+        if done % 50 == 0:
+            print(f"{done} documents ({stats['failed']} failed)", flush=True)
+
+    async def run():
+        try:
+            return await run_batch(
+                args.source, args.output, output_format, checkpoint=args.checkpoint,
+                explain=args.explain, on_progress=progress
+            )
+        finally:
+            await close_provider()
+
+    try:
+        stats = asyncio.run(run())
+    finally:
+        document_executor.shutdown()
+    print(
+        f"Processed {stats['processed']} documents ({stats['failed']} failed, {stats['skipped']} already done) "
+        f"in {stats['seconds']:.1f}s, {stats['documents_per_second']} documents/s"
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
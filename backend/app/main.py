@@ -1,13 +1,37 @@
 import os
-from typing import List
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import json
+import time
+import asyncio
+import tempfile
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Path, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI(title="MediTrend AI API")
+from app.services.document_executor import document_executor, DocumentQueueFull, DocumentTimeout
+from app.services import metrics
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await job_manager.start()
+    await batch_manager.start()
+    # Loaded in the background so /api/health answers as soon as the server is up
+    warmup_task = asyncio.create_task(warm_up())
+    yield
+    warmup_task.cancel()
+    await batch_manager.stop()
+    await job_manager.stop()
+    await close_provider()
+    document_executor.shutdown()
+    if report_store is not None:
+        report_store.close()
+
+app = FastAPI(title="MediTrend AI API", lifespan=lifespan)
 
 # CORS Configuration
 origins = [
@@ -16,6 +40,25 @@ origins = [
     "*" # For development convenience
 ]
 
+from app.services.upload_reader import read_upload, InvalidSignature, UploadTooLarge, UPLOAD_MAX_BYTES
+from app.services.pdf_parser import parse_pdf, PageLimitExceeded, PartialText
+from app.services.image_processor import process_image
+from app.services.data_extractor import extract_results, extract_report_date
+from app.services.llm_service import generate_explanations, get_health_recommendations, explanation_cache, close_provider
+from app.services.trend_analyzer import analyze_trends
+from app.services.report_store import report_store
+from app.services.document_cache import document_cache, get_parsed_document, store_parsed_document
+from app.services.jobs import JobManager, JobQueueFull
+from app.services.batch import BATCH_MAX_BYTES, BATCH_OUTPUT_DIR, is_archive, run_batch, save_archive
+from app.services.warmup import is_ready, warm_up
+from app.services.admission import AdmissionMiddleware, StageBusy
+
+# Oversized bodies and clients with too many uploads in progress are turned
+# away before the form is parsed. Batch archives have their own size limit.
+app.add_middleware(AdmissionMiddleware, route_max_bytes={"/api/batch": BATCH_MAX_BYTES + 1024 * 1024})
+
+# Added after AdmissionMiddleware so that it wraps it: the 413 and 429
+# responses need CORS headers for the browser to show them.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -24,16 +67,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Ensure uploads directory exists
-UPLOAD_DIR = "uploads"
-if not os.path.exists(UPLOAD_DIR):
-    os.makedirs(UPLOAD_DIR)
+# Print one JSON line with the stage timings of every request.
+REQUEST_LOG = os.getenv("REQUEST_LOG", "false").lower() == "true"
 
-from app.services.pdf_parser import parse_pdf
-from app.services.image_processor import process_image
-from app.services.data_extractor import extract_parameters
-from app.services.llm_service import generate_explanation, get_health_recommendations
-from app.services.trend_analyzer import analyze_trends
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """
+    Adds a Server-Timing header with the time spent in each pipeline stage and
+    records the request latency for /metrics.
+    """
+    timings = metrics.start_request()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    route_path = route.path if route is not None else "unmatched"
+    metrics.REQUEST_SECONDS.observe(elapsed, method=request.method, route=route_path, status=response.status_code)
+    response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed)
+    if REQUEST_LOG:
+        print(json.dumps({
+            "method": request.method,
+            "route": route_path,
+            "status": response.status_code,
+            "duration_ms": round(elapsed * 1000, 1),
+            "stages": [{"stage": stage, "duration_ms": round(seconds * 1000, 1)} for stage, seconds in timings]
+        }))
+    return response
+
+# Files of one /api/analyze-trends request parsed at the same time, and the
+# seconds the whole request may take before unfinished files are reported as
+# failed.
+TRENDS_FILE_CONCURRENCY = int(os.getenv("TRENDS_FILE_CONCURRENCY", "4"))
+TRENDS_DEADLINE = float(os.getenv("TRENDS_DEADLINE", "180"))
+# Most files one /api/analyze-trends request may upload.
+TRENDS_MAX_FILES = int(os.getenv("TRENDS_MAX_FILES", "20"))
 
 @app.get("/")
 async def root():
@@ -43,140 +111,576 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "MediTrend AI"}
 
-async def process_file_content(file: UploadFile):
+@app.get("/api/ready")
+async def readiness_check():
+    """
+    503 until the startup warm-up has loaded the model client and the document
+    workers, for load balancers that should hold traffic until then.
+    """
+    if not is_ready():
+        return JSONResponse(status_code=503, content={"status": "starting"}, headers={"Retry-After": "1"})
+    return {"status": "ready"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Stage latency histograms and counters in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return {"llm": explanation_cache.stats(), "documents": document_cache.stats()}
+
+async def document_text(document, sex: Optional[str] = None, age: Optional[float] = None):
+    """
+    Returns (text, parameters) for an upload that has been read. A document
+    uploaded before comes from the cache together with its ParameterResults,
+    classified for `sex` and `age`; otherwise it is parsed and parameters is
+    None.
+    """
+    cached = get_parsed_document(document.sha256, sex, age)
+    if cached is not None:
+        return cached['text'], cached['parameters']
+    
+    if document.file_ext == "pdf":
+        text = await parse_pdf(document.content)
+    else:
+        text = await process_image(document.content)
+    return text, None
+
+def extract_document_parameters(document, text: str, sex: Optional[str] = None, age: Optional[float] = None):
+    """
+    Extracts the ParameterResults from a parsed document and caches both.
+    """
+    with metrics.timer("extract_parameters"):
+        parameters = extract_results(text, sex, age)
+    # OCR errors may be temporary, so only complete parses are kept: neither
+    # errors nor the text layer of a PDF whose scanned pages failed
+    if not text.startswith("Error:") and not isinstance(text, PartialText):
+        store_parsed_document(document.sha256, text, parameters)
+    return parameters
+
+def summarize_parameters(parameters: list):
+    """
+    Returns the health score and the normal/abnormal summary of a report.
+    """
+    abnormal_count = sum(1 for p in parameters if p.status != 'normal')
+    total = len(parameters)
+    score = int(((total - abnormal_count) / total) * 100) if total > 0 else 0
+    return score, {
+        "total_tests": total,
+        "normal": total - abnormal_count,
+        "abnormal": abnormal_count
+    }
+
+# Optional sex and age of the patient. Results are judged against the
+# reference ranges for them; without them the default ranges are used.
+SexForm = Form(None, pattern="^(female|male)$")
+AgeForm = Form(None, ge=0, le=130)
+
+async def process_file_content(file: UploadFile, sex: Optional[str] = None, age: Optional[float] = None):
     """
     Helper function to process a single file and extract parameters.
-    Returns a dictionary with filename and parameters.
+    Returns a dictionary with filename and parameters (ParameterResults).
     """
     try:
         file_ext = file.filename.split(".")[-1].lower()
-        content = await file.read()
         
-        # Save file temporarily
         # Basic validation
         if len(file.filename) > 255:
             return None
 
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as f:
-            f.write(content)
-            
-        # Validate Magic Numbers / File Signature
-        # PDF: %PDF (25 50 44 46)
-        # JPG: FF D8 FF
-        # PNG: 89 50 4E 47
-        
-        is_valid = False
-        if file_ext == "pdf" and content.startswith(b'%PDF'):
-            is_valid = True
-        elif file_ext in ["jpg", "jpeg"] and content.startswith(b'\xff\xd8\xff'):
-            is_valid = True
-        elif file_ext == "png" and content.startswith(b'\x89PNG\r\n\x1a\n'):
-            is_valid = True
-            
-        if not is_valid:
-            os.remove(file_path)
+        # Read the upload in memory, checking its signature first
+        try:
+            document = await read_upload(file, file_ext)
+        except InvalidSignature:
             print(f"Invalid file signature for {file.filename}")
             return None
             
-        text = ""
-        if file_ext == "pdf":
-            text = await parse_pdf(file_path)
-        elif file_ext in ["jpg", "jpeg", "png"]:
-            text = await process_image(content)
-        else:
-            os.remove(file_path) # Cleanup if invalid
-            return None
-            
-        # Cleanup
-        os.remove(file_path)
-        
+        # The same document uploaded again is served from the cache
+        text, parameters = await document_text(document, sex, age)
         if not text:
             return None
-            
-        parameters = extract_parameters(text)
+        if parameters is None:
+            parameters = extract_document_parameters(document, text, sex, age)
+        
         return {
             "filename": file.filename,
+            "date": extract_report_date(text, file.filename),
+            "document_hash": document.sha256,
             "parameters": parameters
         }
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=f"File is too large. The limit is {UPLOAD_MAX_BYTES // (1024 * 1024)} MB.")
+    except PageLimitExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except DocumentQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="The server is busy processing other documents. Please try again shortly.",
+            headers={"Retry-After": "5"}
+        )
+    except StageBusy as e:
+        raise HTTPException(
+            status_code=503,
+            detail="The server is busy processing other documents. Please try again shortly.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except DocumentTimeout:
+        raise HTTPException(status_code=504, detail="Timed out while reading the document.")
     except Exception as e:
         print(f"Error processing {file.filename}: {e}")
         return None
 
 @app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), sex: Optional[str] = SexForm, age: Optional[float] = AgeForm):
     try:
-        result = await process_file_content(file)
+        result = await process_file_content(file, sex, age)
         if not result:
              raise HTTPException(status_code=400, detail="Could not extract text from file or unsupported format.")
         
-        parameters = result['parameters']
+        score, summary = summarize_parameters(result['parameters'])
+        parameters = [p.to_dict() for p in result['parameters']]
         
-        # Generate explanations
-        full_analysis = []
-        abnormal_count = 0
+        # Generate explanations and overall recommendations concurrently
+        abnormal_params = [p for p in parameters if p['status'] != 'normal']
         
-        for param in parameters:
-            explanation = await generate_explanation(
-                param['parameter'], 
-                param['value'], 
-                param['unit'], 
-                param['status'],
-                param['reference_range_display']
-            )
+        explanations, recommendations = await asyncio.gather(
+            generate_explanations(parameters),
+            get_health_recommendations(abnormal_params)
+        )
+        
+        full_analysis = []
+        for param, explanation in zip(parameters, explanations):
             param['explanation'] = explanation
             full_analysis.append(param)
-            if param['status'] != 'normal':
-                abnormal_count += 1
-                
-        # Get overall recommendations
-        abnormal_params = [p for p in parameters if p['status'] != 'normal']
-        recommendations = await get_health_recommendations(abnormal_params)
-        
-        # Calculate Health Score
-        total = len(parameters)
-        score = int(((total - abnormal_count) / total) * 100) if total > 0 else 0
         
         return {
             "success": True,
             "filename": result['filename'],
             "health_score": score,
-            "summary": {
-                "total_tests": total,
-                "normal": total - abnormal_count,
-                "abnormal": abnormal_count
-            },
+            "summary": summary,
             "parameters": full_analysis,
             "recommendations": recommendations
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error processing file: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def upload_events(result: dict):
+    """
+    Yields the /api/upload result as a series of events: the parameters and
+    health score first, then each explanation and the recommendations in the
+    order they complete.
+    """
+    score, summary = summarize_parameters(result['parameters'])
+    parameters = [p.to_dict() for p in result['parameters']]
+    yield {
+        "type": "report",
+        "filename": result['filename'],
+        "date": result['date'],
+        "health_score": score,
+        "summary": summary,
+        "parameters": parameters
+    }
+
+    queue = asyncio.Queue()
+
+    def on_result(index, explanation):
+        parameters[index]['explanation'] = explanation
+        queue.put_nowait({
+            "type": "explanation",
+            "index": index,
+            "parameter": parameters[index]['parameter'],
+            "explanation": explanation
+        })
+
+    async def recommend():
+        abnormal_params = [p for p in parameters if p['status'] != 'normal']
+        queue.put_nowait({"type": "recommendations", "recommendations": await get_health_recommendations(abnormal_params)})
+
+    def on_done(task):
+        if not task.cancelled() and task.exception() is not None:
+            queue.put_nowait({"type": "error", "detail": str(task.exception())})
+
+    tasks = [asyncio.create_task(generate_explanations(parameters, on_result=on_result)), asyncio.create_task(recommend())]
+    for task in tasks:
+        task.add_done_callback(on_done)
+    try:
+        # One event per explanation plus one for the recommendations
+        for _ in range(len(parameters) + 1):
+            event = await queue.get()
+            yield event
+            if event["type"] == "error":
+                return
+    finally:
+        # Stops outstanding model calls if the client went away
+        for task in tasks:
+            task.cancel()
+    yield {"type": "done"}
+
+@app.post("/api/upload/stream")
+async def upload_file_stream(request: Request, file: UploadFile = File(...),
+                             sex: Optional[str] = SexForm, age: Optional[float] = AgeForm):
+    """
+    Streaming variant of /api/upload. Sends newline-delimited JSON events, or
+    server-sent events when the client accepts text/event-stream.
+    """
+    result = await process_file_content(file, sex, age)
+    if not result:
+        raise HTTPException(status_code=400, detail="Could not extract text from file or unsupported format.")
+
+    if "text/event-stream" in request.headers.get("accept", ""):
+        async def body():
+            async for event in upload_events(result):
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        media_type = "text/event-stream"
+    else:
+        async def body():
+            async for event in upload_events(result):
+                yield json.dumps(event) + "\n"
+        media_type = "application/x-ndjson"
+
+    # Keeps proxies from buffering the stream
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+UPLOAD_JOB_STAGES = ["parse", "extract", "explain"]
+
+async def run_upload_job(job):
+    """
+    Runs the /api/upload pipeline for a queued job, publishing partial
+    results on the job as each stage finishes.
+    """
+    filename, document, sex, age = job.payload
+
+    job.start_stage("parse")
+    text, parameters = await document_text(document, sex, age)
+    if not text:
+        raise ValueError("Could not extract text from file or unsupported format.")
+    job.finish_stage("parse")
+
+    job.start_stage("extract")
+    if parameters is None:
+        parameters = extract_document_parameters(document, text, sex, age)
+    score, summary = summarize_parameters(parameters)
+    parameters = [p.to_dict() for p in parameters]
+    job.result = {
+        "filename": filename,
+        "date": extract_report_date(text, filename),
+        "health_score": score,
+        "summary": summary,
+        "parameters": parameters,
+        "recommendations": None
+    }
+    job.finish_stage("extract")
+
+    # Explanations appear on the parameters one by one as they are generated
+    job.start_stage("explain")
+    job.progress = {"explanations_done": 0, "explanations_total": len(parameters)}
+
+    def on_result(index, explanation):
+        parameters[index]['explanation'] = explanation
+        job.progress["explanations_done"] += 1
+
+    abnormal_params = [p for p in parameters if p['status'] != 'normal']
+    _, recommendations = await asyncio.gather(
+        generate_explanations(parameters, on_result=on_result),
+        get_health_recommendations(abnormal_params)
+    )
+    job.result["recommendations"] = recommendations
+    job.finish_stage("explain")
+
+job_manager = JobManager(run_upload_job, UPLOAD_JOB_STAGES)
+
+metrics.registry.register(metrics.Gauge(
+    "meditrend_documents_pending", "Documents queued or running in the document workers.", lambda: document_executor.pending
+))
+metrics.registry.register(metrics.Gauge(
+    "meditrend_jobs_queued", "Analysis jobs waiting for a job worker.", lambda: job_manager.queued
+))
+
+@app.post("/api/jobs", status_code=202)
+async def create_upload_job(request: Request, file: UploadFile = File(...),
+                            sex: Optional[str] = SexForm, age: Optional[float] = AgeForm):
+    """
+    Queue a report for analysis and return straight away. Poll the returned
+    status_url for progress and partial results.
+    """
+    file_ext = file.filename.split(".")[-1].lower()
+    if len(file.filename) > 255:
+        raise HTTPException(status_code=400, detail="Filename is too long.")
+
+    # The upload is only readable during this request, so read it now
+    try:
+        document = await read_upload(file, file_ext)
+    except InvalidSignature as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=f"File is too large. The limit is {UPLOAD_MAX_BYTES // (1024 * 1024)} MB.")
+
+    try:
+        job = job_manager.submit((file.filename, document, sex, age))
+    except JobQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many reports are waiting to be analyzed. Please try again shortly.",
+            headers={"Retry-After": "10"}
+        )
+
+    status_url = str(request.url_for("get_upload_job", job_id=job.id))
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job.id, "status": job.status, "status_url": status_url},
+        headers={"Location": status_url}
+    )
+
+@app.get("/api/jobs/{job_id}")
+async def get_upload_job(job_id: str):
+    """
+    Status, per-stage progress and partial results of a queued analysis.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    return job.to_dict()
+
+BATCH_JOB_STAGES = ["extract"]
+
+def batch_results_path(job_id: str) -> str:
+    return os.path.join(BATCH_OUTPUT_DIR, f"{job_id}.jsonl")
+
+async def run_batch_job(job):
+    """
+    Runs an uploaded archive through the batch pipeline, counting processed
+    documents in the job's progress as they are written.
+    """
+    archive, explain = job.payload
+    job.start_stage("extract")
+    output = batch_results_path(job.id)
+    try:
+        stats = await run_batch(archive, output, explain=explain, on_progress=job.progress.update)
+    finally:
+        # The archive is gone, so there is nothing to resume, whether the
+        # batch finished or not
+        _remove_file(archive)
+        _remove_file(output + ".checkpoint")
+    job.result.update(stats)
+    job.finish_stage("extract")
+
+def _remove_file(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+def remove_batch_files(job):
+    """
+    Deletes a batch's results once the job expires or the server stops, and
+    its archive if the batch never ran.
+    """
+    if job.payload is not None:
+        _remove_file(job.payload[0])
+    output = batch_results_path(job.id)
+    _remove_file(output)
+    _remove_file(output + ".checkpoint")
+
+# Each batch already keeps every document worker busy, so they run one at a time
+batch_manager = JobManager(run_batch_job, BATCH_JOB_STAGES, workers=1, cleanup=remove_batch_files)
+
+@app.post("/api/batch", status_code=202)
+async def create_batch_job(request: Request, file: UploadFile = File(...), explain: bool = Form(False)):
+    """
+    Queue a .zip or .tar archive of reports for bulk extraction. Results are
+    written to results_url as JSON lines while the batch runs; the model is
+    only used when `explain` is set.
+    """
+    os.makedirs(BATCH_OUTPUT_DIR, exist_ok=True)
+    fd, archive = tempfile.mkstemp(dir=BATCH_OUTPUT_DIR, suffix=".upload")
+    os.close(fd)
+    try:
+        await save_archive(file, archive)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=f"Archive is too large. The limit is {BATCH_MAX_BYTES // (1024 * 1024)} MB.")
+    if not is_archive(archive):
+        os.remove(archive)
+        raise HTTPException(status_code=400, detail="Upload a .zip or .tar archive of PDFs and images.")
+
+    try:
+        job = batch_manager.submit((archive, explain))
+    except JobQueueFull:
+        os.remove(archive)
+        raise HTTPException(
+            status_code=503,
+            detail="Too many batches are waiting. Please try again later.",
+            headers={"Retry-After": "60"}
+        )
+
+    status_url = str(request.url_for("get_batch_job", job_id=job.id))
+    job.result = {"results_url": str(request.url_for("get_batch_results", job_id=job.id))}
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job.id, "status": job.status, "status_url": status_url, **job.result},
+        headers={"Location": status_url}
+    )
+
+@app.get("/api/batch/{job_id}")
+async def get_batch_job(job_id: str):
+    """
+    Status and document counts of a batch.
+    """
+    job = batch_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired batch.")
+    return job.to_dict()
+
+@app.get("/api/batch/{job_id}/results")
+async def get_batch_results(job_id: str):
+    """
+    The JSON lines written so far, one per document.
+    """
+    path = batch_results_path(job_id)
+    if batch_manager.get(job_id) is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No results for this batch yet.")
+    return FileResponse(path, media_type="application/x-ndjson")
+
+def require_report_store():
+    # 501 rather than ignoring the patient: without REPORT_STORE_DB nothing is saved
+    if report_store is None:
+        raise HTTPException(status_code=501, detail="Report history is not enabled on this server.")
+    return report_store
+
 @app.post("/api/analyze-trends")
-async def analyze_trends_endpoint(files: List[UploadFile] = File(...)):
+async def analyze_trends_endpoint(files: List[UploadFile] = File(...), patient_id: Optional[str] = Form(None, max_length=128),
+                                  sex: Optional[str] = SexForm, age: Optional[float] = AgeForm):
     """
     Endpoint to upload multiple files and analyze trends.
+    With a patient_id the uploads are saved to the patient's history and the
+    trends cover every stored report; that needs the report store enabled.
     """
+    if len(files) > TRENDS_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Too many files. Upload at most {TRENDS_MAX_FILES} reports at a time.")
+    store = require_report_store() if patient_id else None
+
     reports_data = []
+    failed_files = []
     
-    for file in files:
-        result = await process_file_content(file)
-        if result and result['parameters']:
-            reports_data.append(result)
+    # Parse the files concurrently, at most TRENDS_FILE_CONCURRENCY at a time,
+    # and give up on whatever is still running once the deadline passes.
+    semaphore = asyncio.Semaphore(TRENDS_FILE_CONCURRENCY)
+
+    async def process(file: UploadFile):
+        async with semaphore:
+            return await process_file_content(file, sex, age)
+
+    tasks = [asyncio.create_task(process(file)) for file in files]
+    _, pending = await asyncio.wait(tasks, timeout=TRENDS_DEADLINE)
+    for task in pending:
+        task.cancel()
+    
+    # Collect results in upload order
+    for file, task in zip(files, tasks):
+        if task in pending:
+            failed_files.append({"filename": file.filename, "error": "Timed out before the report could be read."})
+            continue
+        error = task.exception()
+        if isinstance(error, HTTPException):
+            failed_files.append({"filename": file.filename, "error": error.detail})
+        elif error is not None:
+            failed_files.append({"filename": file.filename, "error": str(error)})
+        elif not task.result():
+            failed_files.append({"filename": file.filename, "error": "Could not extract text from file or unsupported format."})
+        elif not task.result()['parameters']:
+            failed_files.append({"filename": file.filename, "error": "No recognised lab parameters found."})
+        else:
+            reports_data.append(task.result())
+    
+    if store is not None:
+        for report in reports_data:
+            store.add_report(
+                patient_id, report['filename'], report['parameters'], report['date'], report['document_hash']
+            )
+        reports_data = store.get_reports(patient_id)
             
     if len(reports_data) < 2:
-        raise HTTPException(status_code=400, detail="Please upload at least 2 valid reports to analyze trends.")
+        raise HTTPException(status_code=400, detail={
+            "message": "Please upload at least 2 valid reports to analyze trends.",
+            "failed_files": failed_files
+        })
         
-    trend_analysis = await analyze_trends(reports_data)
+    trend_analysis = await analyze_trends(reports_data, sex, age)
     
     return {
         "success": True,
         "report_count": len(reports_data),
+        "failed_files": failed_files,
         "analysis": trend_analysis
     }
 
+PatientId = Path(..., min_length=1, max_length=128)
+
+@app.post("/api/patients/{patient_id}/reports")
+async def add_patient_report(patient_id: str = PatientId, file: UploadFile = File(...),
+                             sex: Optional[str] = SexForm, age: Optional[float] = AgeForm):
+    """
+    Parse a report once and add it to the patient's stored history.
+    """
+    store = require_report_store()
+    result = await process_file_content(file, sex, age)
+    if not result or not result['parameters']:
+        raise HTTPException(status_code=400, detail="Could not extract lab parameters from this file.")
+    
+    report_id, created = store.add_report(
+        patient_id, result['filename'], result['parameters'], result['date'], result['document_hash']
+    )
+    return {
+        "success": True,
+        "report_id": report_id,
+        "duplicate": not created,
+        "date": result['date'],
+        "parameters": [p.to_dict() for p in result['parameters']],
+        "aggregates": store.get_aggregates(patient_id)
+    }
+
+@app.get("/api/patients/{patient_id}/reports")
+async def get_patient_reports(patient_id: str = PatientId):
+    """
+    Stored report history of a patient, oldest first.
+    """
+    store = require_report_store()
+    return {"success": True, "reports": store.get_reports(patient_id)}
+
+@app.get("/api/patients/{patient_id}/trends")
+async def get_patient_trends(patient_id: str = PatientId, sex: Optional[str] = Query(None, pattern="^(female|male)$"),
+                             age: Optional[float] = Query(None, ge=0, le=130)):
+    """
+    Trends over the patient's stored history, without re-uploading or
+    re-parsing any document. With sex and age the stored values are judged
+    against the ranges for them.
+    """
+    store = require_report_store()
+    reports_data = store.get_reports(patient_id)
+    if not reports_data:
+        raise HTTPException(status_code=404, detail="No stored reports for this patient.")
+    
+    return {
+        "success": True,
+        "report_count": len(reports_data),
+        "aggregates": store.get_aggregates(patient_id),
+        "analysis": await analyze_trends(reports_data, sex, age)
+    }
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+
+    # RELOAD=false runs WEB_CONCURRENCY worker processes without the reloader
+    # for production. Jobs, batches and caches live in each worker's memory, so
+    # with several workers a client must keep talking to the same one.
+    if os.getenv("RELOAD", "true").lower() == "true":
+        uvicorn.run("app.main:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")), reload=True)
+    else:
+        uvicorn.run(
+            "app.main:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")),
+            workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+        )
@@ -0,0 +1,68 @@
+from bisect import bisect_right
+from typing import NamedTuple, Optional, Tuple
+
+class Analyte(NamedTuple):
+    """
+    What is known about a lab test before any report is read: its unit,
+    normal range and category from `patterns`. One instance per test is
+    shared by every result of that test.
+    """
+    name: str
+    unit: str
+    normal_range: Tuple[float, float]
+    category: str
+    reference_range_display: str
+
+class ReferenceRange(NamedTuple):
+    """
+    A compiled range: the status of a value is
+    labels[bisect_right(breakpoints, value)]. Built once per test and
+    demographic variant by reference_ranges and shared, or per result for a
+    range printed on the report (`printed`).
+    """
+    breakpoints: Tuple[float, ...]
+    labels: Tuple[str, ...]
+    normal_range: Tuple[float, float]
+    display: str
+    printed: bool = False
+
+    def classify(self, value: float) -> str:
+        return self.labels[bisect_right(self.breakpoints, value)]
+
+class ParameterResult(NamedTuple):
+    """
+    One extracted lab result. Only the value, status and the range it was
+    judged against are stored per result; everything else is read from the
+    shared Analyte. Converted to the JSON shape with to_dict() where results
+    leave the app.
+    """
+    analyte: Analyte
+    value: float
+    status: str
+    # None means the test's default range
+    reference: Optional[ReferenceRange] = None
+
+    @property
+    def parameter(self) -> str:
+        return self.analyte.name
+
+    @property
+    def unit(self) -> str:
+        return self.analyte.unit
+
+    @property
+    def category(self) -> str:
+        return self.analyte.category
+
+    def to_dict(self) -> dict:
+        analyte = self.analyte
+        reference = self.reference
+        return {
+            "parameter": analyte.name,
+            "value": self.value,
+            "unit": analyte.unit,
+            "status": self.status,
+            "normal_range": reference.normal_range if reference else analyte.normal_range,
+            "category": analyte.category,
+            "reference_range_display": reference.display if reference else analyte.reference_range_display
+        }
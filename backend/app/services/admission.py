@@ -0,0 +1,170 @@
+import os
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from fastapi import HTTPException
+from app.services.document_executor import DOC_WORKERS
+from app.services.metrics import registry, Counter
+
+# Largest request body on any route, checked from Content-Length (and while
+# reading bodies sent without one) before the multipart form is parsed.
+# Routes with their own larger limit, such as /api/batch, pass theirs in.
+REQUEST_MAX_BYTES = int(os.getenv("REQUEST_MAX_BYTES", str(100 * 1024 * 1024)))
+# POST requests one client may have in flight; more get 429. Off (0) by
+# default: behind a proxy or load balancer every client has the proxy's
+# address. There, set CLIENT_ADDRESS_HEADER to the header the proxy puts the
+# client address in (e.g. X-Forwarded-For; its first address is used). Only
+# do so when a proxy sets it, as clients can send any value themselves.
+CLIENT_MAX_REQUESTS = int(os.getenv("CLIENT_MAX_REQUESTS", "0"))
+CLIENT_ADDRESS_HEADER = os.getenv("CLIENT_ADDRESS_HEADER", "")
+
+# Documents parsed at once per stage. OCR (image uploads and the scanned
+# pages of PDFs) gets fewer slots than reading PDFs and cannot take every
+# document worker. Up to
+# STAGE_QUEUE_FACTOR times as many wait for a slot, for at most
+# STAGE_WAIT_SECONDS; beyond that requests are turned away with 503.
+PDF_CONCURRENCY = int(os.getenv("PDF_CONCURRENCY", str(DOC_WORKERS)))
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", str(max(1, DOC_WORKERS // 2))))
+# Model requests in flight across all reports (LLM_CONCURRENCY limits a
+# single report). Explanations that cannot get a slot use the template text.
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "20"))
+STAGE_QUEUE_FACTOR = int(os.getenv("STAGE_QUEUE_FACTOR", "4"))
+STAGE_WAIT_SECONDS = float(os.getenv("STAGE_WAIT_SECONDS", "30"))
+
+REJECTED = registry.register(Counter(
+    "meditrend_rejected_total", "Requests and stage calls turned away by admission control.", ("reason",)
+))
+
+class StageBusy(Exception):
+    """Raised when a stage has no free slot and no room to wait for one."""
+
+    def __init__(self, stage: str, retry_after: int):
+        super().__init__(f"The {stage} stage is at capacity")
+        self.stage = stage
+        self.retry_after = retry_after
+
+class StageLimiter:
+    """
+    Lets at most `limit` callers into a stage at once and up to `max_waiting`
+    more wait, each for at most `wait_timeout` seconds. Anyone else gets
+    StageBusy straight away, so queues and waiting times stay bounded.
+    """
+
+    def __init__(self, name: str, limit: int, max_waiting: Optional[int] = None,
+                 wait_timeout: float = STAGE_WAIT_SECONDS):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_waiting = self.limit * STAGE_QUEUE_FACTOR if max_waiting is None else max(0, max_waiting)
+        self.wait_timeout = wait_timeout
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = None
+        self._loop = None
+
+    def _retry_after(self) -> int:
+        return max(1, round(self.wait_timeout / 2))
+
+    @asynccontextmanager
+    async def slot(self):
+        # Created inside the event loop that uses it (the app has one; tests
+        # and scripts may run several in turn)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            REJECTED.inc(reason=f"{self.name}_queue_full")
+            raise StageBusy(self.name, self._retry_after())
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.wait_timeout)
+        except asyncio.TimeoutError:
+            REJECTED.inc(reason=f"{self.name}_wait_timeout")
+            raise StageBusy(self.name, self._retry_after())
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+pdf_stage = StageLimiter("pdf", PDF_CONCURRENCY)
+ocr_stage = StageLimiter("ocr", OCR_CONCURRENCY)
+llm_stage = StageLimiter("llm", LLM_MAX_INFLIGHT)
+
+class AdmissionMiddleware:
+    """
+    Turns requests away before any work is done on them: bodies larger than
+    the route's limit get 413 and, when CLIENT_MAX_REQUESTS is set, clients
+    with that many POSTs already in flight get 429.
+    """
+
+    def __init__(self, app, max_bytes: int = REQUEST_MAX_BYTES, route_max_bytes: Optional[Dict[str, int]] = None,
+                 client_max_requests: int = CLIENT_MAX_REQUESTS, client_header: str = CLIENT_ADDRESS_HEADER):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.route_max_bytes = route_max_bytes or {}
+        self.client_max_requests = client_max_requests
+        self.client_header = client_header.lower().encode()
+        self.in_flight: Dict[str, int] = {}
+
+    def _client(self, scope, headers: dict) -> str:
+        forwarded = headers.get(self.client_header) if self.client_header else None
+        if forwarded:
+            return forwarded.decode("latin-1").split(",")[0].strip()
+        return (scope.get("client") or ("unknown",))[0]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.route_max_bytes.get(scope["path"], self.max_bytes)
+        too_large = f"Request is too large. The limit is {max_bytes // (1024 * 1024)} MB."
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+            REJECTED.inc(reason="request_too_large")
+            await self._reject(send, 413, too_large)
+            return
+
+        client = self._client(scope, headers)
+        if self.client_max_requests and self.in_flight.get(client, 0) >= self.client_max_requests:
+            REJECTED.inc(reason="client_limit")
+            await self._reject(send, 429, "Too many requests in progress. Please wait for them to finish.", retry_after=5)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            # For bodies sent without a Content-Length. FastAPI answers an
+            # HTTPException raised while it reads the form as is.
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    REJECTED.inc(reason="request_too_large")
+                    raise HTTPException(status_code=413, detail=too_large)
+            return message
+
+        self.in_flight[client] = self.in_flight.get(client, 0) + 1
+        try:
+            await self.app(scope, limited_receive, send)
+        finally:
+            self.in_flight[client] -= 1
+            if not self.in_flight[client]:
+                del self.in_flight[client]
+
+    @staticmethod
+    async def _reject(send, status: int, detail: str, retry_after: Optional[int] = None):
+        headers = [(b"content-type", b"application/json")]
+        if retry_after is not None:
+            headers.append((b"retry-after", str(retry_after).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode()})
@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import tarfile
+import zipfile
+from typing import Callable, Iterator, Optional, Tuple, Union
+from fastapi import UploadFile
+from app.services.document_executor import DocumentExecutor, DocumentTimeout, document_executor
+from app.services.upload_reader import SIGNATURES, UPLOAD_CHUNK_BYTES, UPLOAD_MAX_BYTES, UploadTooLarge
+from app.services.pdf_parser import extract_pdf_text
+from app.services.image_processor import extract_image_text
+from app.services.data_extractor import extract_results, extract_report_date
+from app.services.llm_service import generate_explanations, get_health_recommendations
+
+# Where /api/batch keeps uploaded archives and their results, and the largest
+# archive it accepts.
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR", "batch_results")
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(1024 * 1024 * 1024)))
+# Parameter rows per Parquet part file. Documents are only checkpointed once
+# the part holding their rows has been written.
+BATCH_PARQUET_ROWS = int(os.getenv("BATCH_PARQUET_ROWS", "10000"))
+
+def _extension(name: str) -> str:
+    return name.rsplit(".", 1)[-1].lower() if "." in name else ""
+
+def _too_large(name: str, size: int, max_bytes: int) -> Callable[[], bytes]:
+    def load():
+        raise UploadTooLarge(f"{name} is {size} bytes; documents may be at most {max_bytes} bytes")
+    return load
+
+def iter_documents(source: str, max_bytes: int = UPLOAD_MAX_BYTES) -> Iterator[Tuple[str, Callable[[], Union[bytes, str]]]]:
+    """
+    Yields (name, load) for every PDF and image in a directory (searched
+    recursively) or a .zip/.tar(.gz) archive, in a stable order. `load()`
+    returns a file path for files on disk and the bytes of archive members,
+    and is only called when the document is about to be processed. For
+    documents larger than `max_bytes` (uncompressed) it raises UploadTooLarge
+    instead, so an archive of a few huge members cannot fill the memory.
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                if _extension(filename) in SIGNATURES:
+                    name, size = os.path.relpath(path, source), os.path.getsize(path)
+                    yield name, (_too_large(name, size, max_bytes) if size > max_bytes else (lambda path=path: path))
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _extension(info.filename) in SIGNATURES and not info.filename.startswith("__MACOSX/"):
+                    # zipfile stops reading a member at its declared size
+                    if info.file_size > max_bytes:
+                        yield info.filename, _too_large(info.filename, info.file_size, max_bytes)
+                    else:
+                        yield info.filename, (lambda info=info: archive.read(info))
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            for member in archive:
+                if member.isfile() and _extension(member.name) in SIGNATURES:
+                    if member.size > max_bytes:
+                        yield member.name, _too_large(member.name, member.size, max_bytes)
+                    else:
+                        yield member.name, (lambda member=member: archive.extractfile(member).read())
+    else:
+        raise ValueError(f"{source} is not a directory or a zip or tar archive")
+
+def is_archive(path: str) -> bool:
+    return zipfile.is_zipfile(path) or tarfile.is_tarfile(path)
+
+async def save_archive(file: UploadFile, path: str, max_bytes: int = BATCH_MAX_BYTES):
+    """
+    Streams an uploaded archive to `path`, enforcing the size cap while
+    reading. Removes the partial file on failure.
+    """
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+                f.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+
+def analyze_document(name: str, source: Union[bytes, str]) -> dict:
+    """
+    Parses one document and extracts its ParameterResults. Runs in a document
+    worker process; raises ValueError for files that cannot be read.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            source = f.read()
+    file_ext = _extension(name)
+    if not source.startswith(SIGNATURES[file_ext]):
+        raise ValueError(f"File does not look like a {file_ext.upper()} file")
+
+    text = extract_pdf_text(source) if file_ext == "pdf" else extract_image_text(source)
+    if not text.strip() or text.startswith("Error:"):
+        raise ValueError(text or "Could not extract text from file")
+    return {
+        "file": name,
+        "sha256": hashlib.sha256(source).hexdigest(),
+        "date": extract_report_date(text, os.path.basename(name)),
+        "parameters": extract_results(text)
+    }
+
+def load_checkpoint(path: str) -> set:
+    """
+    Names of the documents a previous run already wrote out.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+class JsonlWriter:
+    """
+    Writes one JSON line per document, flushed as soon as it is written.
+    """
+
+    def __init__(self, path: str, resume: bool):
+        self.file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def write(self, record: dict) -> list:
+        """
+        Writes a record and returns the names of the documents now safely
+        written, which may be checkpointed.
+        """
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        return [record["file"]]
+
+    def close(self) -> list:
+        self.file.close()
+        return []
+
+class ParquetWriter:
+    """
+    Writes one row per parameter into numbered part files in a directory.
+    Rows are buffered until BATCH_PARQUET_ROWS are collected; a resumed run
+    continues with the next part number.
+    """
+
+    def __init__(self, path: str, resume: bool, rows_per_part: Optional[int] = None):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow: pip install pyarrow")
+        os.makedirs(path, exist_ok=True)
+        parts = sorted(name for name in os.listdir(path) if name.startswith("part-") and name.endswith(".parquet"))
+        if parts and not resume:
+            raise ValueError(f"{path} already holds results; remove it or resume with its checkpoint")
+        self.path = path
+        self.rows_per_part = max(1, rows_per_part or BATCH_PARQUET_ROWS)
+        self.part = len(parts)
+        self.rows = []
+        self.files = []
+
+    def write(self, record: dict) -> list:
+        base = {"file": record["file"], "sha256": record.get("sha256"), "date": record.get("date"), "error": record.get("error")}
+        for parameter in record.get("parameters") or [{}]:
+            self.rows.append({
+                **base,
+                "parameter": parameter.get("parameter"),
+                "value": parameter.get("value"),
+                "unit": parameter.get("unit"),
+                "status": parameter.get("status"),
+                "category": parameter.get("category"),
+                "explanation": parameter.get("explanation"),
+            })
+        self.files.append(record["file"])
+        if len(self.rows) >= self.rows_per_part:
+            return self._flush()
+        return []
+
+    def _flush(self) -> list:
+        import pandas as pd
+
+        if not self.rows:
+            return []
+        final = os.path.join(self.path, f"part-{self.part:05d}.parquet")
+        # Written under a temporary name so a part is either complete or absent
+        pd.DataFrame(self.rows).to_parquet(final + ".tmp", index=False, engine="pyarrow")
+        os.replace(final + ".tmp", final)
+        self.part += 1
+        written, self.rows, self.files = self.files, [], []
+        return written
+
+    def close(self) -> list:
+        return self._flush()
+
+def batch_slots(executor: DocumentExecutor, concurrency: Optional[int] = None) -> int:
+    """
+    Documents a batch keeps in flight: at most one per worker, and no more
+    than leaves the other DOC_QUEUE_LIMIT slots of the shared executor to
+    interactive uploads, so they are not rejected while a batch runs.
+    """
+    limit = min(executor.max_workers, max(1, executor.queue_limit - executor.max_workers))
+    return max(1, min(concurrency or limit, limit))
+
+async def run_batch(source: str, output: str, output_format: str = "jsonl", checkpoint: Optional[str] = None,
+                    explain: bool = False, concurrency: Optional[int] = None, on_progress=None) -> dict:
+    """
+    Parses every document in `source` through the document workers and
+    writes the results to `output` as they finish. Documents listed in the
+    checkpoint file (by default `output` + ".checkpoint") are skipped, so an
+    interrupted run continues where it stopped. The model is only asked for
+    explanations and recommendations when `explain` is true.
+    """
+    checkpoint = checkpoint or output.rstrip("/") + ".checkpoint"
+    done = load_checkpoint(checkpoint)
+    writer_class = ParquetWriter if output_format == "parquet" else JsonlWriter
+    writer = writer_class(output, resume=bool(done))
+    semaphore = asyncio.Semaphore(batch_slots(document_executor, concurrency))
+    stats = {"processed": 0, "failed": 0, "skipped": 0, "parameters": 0}
+    start = time.perf_counter()
+
+    async def process(name, content):
+        try:
+            try:
+                record = await document_executor.run(analyze_document, name, content)
+                record["parameters"] = [p.to_dict() for p in record["parameters"]]
+                if explain:
+                    await explain_record(record)
+            except (ValueError, DocumentTimeout, OSError) as e:
+                record = {"file": name, "error": str(e)}
+        finally:
+            semaphore.release()
+        write(record)
+
+    def write(record):
+        stats["failed" if "error" in record else "processed"] += 1
+        stats["parameters"] += len(record.get("parameters", []))
+        checkpoint_file.write("".join(f"{written}\n" for written in writer.write(record)))
+        checkpoint_file.flush()
+        if on_progress is not None:
+            on_progress(dict(stats))
+
+    tasks = set()
+    documents = iter_documents(source)
+    with open(checkpoint, "a", encoding="utf-8") as checkpoint_file:
+        try:
+            while True:
+                # Reading and decompressing archive members blocks, so it
+                # happens in a thread, one member at a time
+                item = await asyncio.to_thread(next, documents, None)
+                if item is None:
+                    break
+                name, load = item
+                if name in done:
+                    stats["skipped"] += 1
+                    continue
+                # Loaded here, while an archive is still open
+                try:
+                    content = await asyncio.to_thread(load)
+                except UploadTooLarge as e:
+                    write({"file": name, "error": str(e)})
+                    continue
+                await semaphore.acquire()
+                task = asyncio.create_task(process(name, content))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            documents.close()
+            checkpoint_file.write("".join(f"{written}\n" for written in writer.close()))
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["documents_per_second"] = round(stats["processed"] / elapsed, 2) if elapsed else None
+    return stats
+
+async def explain_record(record: dict):
+    """
+    Adds explanations and recommendations to a batch record.
+    """
+    parameters = record["parameters"]
+    explanations, recommendations = await asyncio.gather(
+        generate_explanations(parameters),
+        get_health_recommendations([p for p in parameters if p['status'] != 'normal'])
+    )
+    for parameter, explanation in zip(parameters, explanations):
+        parameter['explanation'] = explanation
+    record["recommendations"] = recommendations
@@ -1,4 +1,9 @@
+import os
 import re
+from datetime import date
+from typing import List, NamedTuple, Optional, Tuple
+from app.models.parameter import Analyte, ParameterResult
+from app.services.reference_ranges import OPTIMAL_FROM, ReferenceRanges, compile_range
 
 # Comprehensive list of regex patterns for common lab tests
 # This is a starting list and can be expanded
@@ -141,45 +146,358 @@ patterns = {
     }
 }
 
+# Unit, range and category of every test, built once and shared by all of
+# its results
+analytes = {
+    param_name: Analyte(
+        param_name, config['unit'], config['range'], config['category'],
+        f"{config['range'][0]} - {config['range'][1]} {config['unit']}"
+    )
+    for param_name, config in patterns.items()
+}
+
+# Every range of every test, including the sex- and age-specific ones,
+# compiled into lookup tables once
+reference_ranges = ReferenceRanges(patterns)
+
 def determine_status(value, range_tuple, param_name):
-    min_val, max_val = range_tuple
-    
-    if param_name == 'HDL Cholesterol':
-        if value >= 60: return 'optimal'
-        elif value < 40: return 'low'
-        return 'normal'
-        
-    if value < min_val:
-        return 'low'
-    elif value > max_val:
-        return 'high'
-    return 'normal'
+    """
+    The status of a value against `range_tuple`. Results are classified with
+    make_result(), which also applies the sex- and age-specific ranges.
+    """
+    return compile_range(range_tuple, '', OPTIMAL_FROM.get(param_name)).classify(value)
 
-def extract_parameters(text: str):
+def make_result(param_name: str, value: float, sex: Optional[str] = None, age: Optional[float] = None,
+                printed_range: Optional[Tuple[float, float]] = None) -> ParameterResult:
     """
-    Parses the text and extracts medical parameters based on regex patterns.
-    Returns a list of dictionaries with parameter details.
+    A result of test `param_name`, classified against the range the report
+    printed for it (in the unit of `patterns`) if given, otherwise against the
+    range for the patient's sex and age, or the test's default range when
+    they are unknown.
+    """
+    if printed_range:
+        reference = compile_range(printed_range, analytes[param_name].unit, OPTIMAL_FROM.get(param_name), printed=True)
+    else:
+        reference = reference_ranges.reference(param_name, sex, age)
+    return ParameterResult(analytes[param_name], value, reference.classify(value), reference)
+
+def _alias_group(regex: str) -> str:
+    """
+    Returns the leading (?:...) alias group of a pattern regex, i.e. the part
+    that names the analyte before the value is parsed.
+    """
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(regex):
+        ch = regex[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if in_class:
+            if ch == ']':
+                in_class = False
+        elif ch == '[':
+            in_class = True
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+            if depth == 0:
+                return regex[:i + 1]
+        i += 1
+    raise ValueError(f"Pattern has no leading alias group: {regex}")
+
+def _alias_keywords(regex: str) -> tuple:
+    """
+    Returns the lower-cased literal prefix of every alias in a pattern. Each
+    match of the pattern has to start with one of them, so they can be used to
+    find candidate positions with str.find before running the regex.
+    """
+    keywords = []
+    for alias in _alias_group(regex)[3:-1].split('|'):
+        literal = re.match(r'[A-Za-z0-9 ,\-]+', alias)
+        if not literal:
+            raise ValueError(f"Alias has no literal prefix: {alias}")
+        keywords.append(literal.group(0).lower())
+    return tuple(dict.fromkeys(keywords))
+
+# Compiled once at import. Python's re engine does not optimise large
+# alternations, so instead of one combined regex the aliases are indexed as
+# plain keywords and each pattern is only tried at positions where one of its
+# keywords occurs.
+_compiled_patterns = [
+    (analytes[param_name], re.compile(config['regex'], re.IGNORECASE), _alias_keywords(config['regex']))
+    for param_name, config in patterns.items()
+]
+
+# Characters outside ASCII that re.IGNORECASE treats as equal to an ASCII
+# letter. Folding them keeps the keyword index in step with the regexes, and
+# also keeps str.lower() from changing the length of the text.
+_keyword_fold = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's', '\u212a': 'k'})
+
+# Size of the slice of text searched for keywords at a time. Once a pattern
+# matches, the rest of the document is never searched for its other aliases.
+_WINDOW = 2048
+
+def _first_match(compiled, keywords, text: str, lowered: str):
+    """
+    Returns the same match as compiled.search(text), or None.
+    """
+    start = 0
+    while start < len(text):
+        stop = start + _WINDOW
+        positions = set()
+        for keyword in keywords:
+            end = stop + len(keyword) - 1
+            pos = lowered.find(keyword, start, end)
+            while pos != -1:
+                positions.add(pos)
+                pos = lowered.find(keyword, pos + 1, end)
+        for pos in sorted(positions):
+            match = compiled.match(text, pos)
+            if match:
+                return match
+        start = stop
+    return None
+
+# Table rows reach the extractor as lines of tab-separated cells (see
+# pdf_parser). Their test names are looked up in an index of every alias in
+# `patterns`, normalised to lower-case letters and digits, so "Glucose -
+# Fasting" and "GLUCOSE FASTING" both find 'Glucose Fasting'.
+TABLE_CELL_SEPARATOR = '\t'
+
+def _name_key(name: str) -> str:
+    return re.sub(r'[^a-z0-9]', '', name.translate(_keyword_fold).lower())
+
+def _alias_index() -> dict:
+    index = {}
+    for param_name, config in patterns.items():
+        aliases = _alias_group(config['regex'])[3:-1].split('|')
+        # Drop the regex syntax inside aliases such as Glucose\s*[-\s]*Fasting
+        names = [param_name] + [re.sub(r'\\s\*|\[[^\]]*\]\*|\\', '', alias) for alias in aliases]
+        for name in names:
+            key = _name_key(name)
+            if index.setdefault(key, param_name) != param_name:
+                raise ValueError(f"Alias {name!r} names both {index[key]} and {param_name}")
+    return index
+
+alias_index = _alias_index()
+
+# A result cell: a number, optionally after < or > and followed by a flag or
+# unit ("13.5", "5.8 H", "<0.5 mg/dL"), but not a range such as "4.0-5.7"
+_value_cell = re.compile(r'\s*[<>]?=?\s*(\d+(?:\.\d+)?)(?:\s*([^\d\s.,\-\u2013].*))?\s*$')
+_range_cell = re.compile(r'\s*[<>]?=?\s*\d+(?:\.\d+)?\s*(?:-|\u2013|to)\s*\d+(?:\.\d+)?\b.*|\s*[<>]=?\s*\d+(?:\.\d+)?\s*$', re.IGNORECASE)
+_flag_cells = {'h', 'l', 'high', 'low', 'n', 'normal', 'abnormal', '*', '**', '!'}
+
+# The two ends of a printed reference range such as "4.0 - 5.7" or "70 to 99"
+_range_bounds = re.compile(r'\s*(\d+(?:\.\d+)?)\s*(?:-|\u2013|to)\s*(\d+(?:\.\d+)?)', re.IGNORECASE)
+
+class TableRow(NamedTuple):
+    parameter: str
+    value: float
+    unit: str
+    # The reference range printed in the row, in the row's unit
+    normal_range: Optional[Tuple[float, float]] = None
+
+def _without_flags(text: str) -> str:
+    """
+    A cell with flag words such as "H" or "Low" removed: "mmol/L H" gives
+    "mmol/L" and "H" gives "".
+    """
+    return ' '.join(word for word in text.split() if word.lower() not in _flag_cells)
+
+def lookup_parameter(name: str) -> Optional[str]:
+    """
+    Returns the parameter a test name from a table refers to, or None. Names
+    with a bracketed abbreviation such as "Aspartate Aminotransferase (AST)"
+    are tried whole, without the brackets, and as the abbreviation.
+    """
+    param_name = alias_index.get(_name_key(name))
+    if param_name or '(' not in name:
+        return param_name
+    for candidate in [re.sub(r'\(.*?\)', ' ', name)] + re.findall(r'\((.*?)\)', name):
+        param_name = alias_index.get(_name_key(candidate))
+        if param_name:
+            return param_name
+    return None
+
+def parse_table_row(cells: list) -> Optional[TableRow]:
+    """
+    Reads one table row as (test name, value, unit, reference range). The
+    test name is the first cell found in the alias index and the value is the
+    first result cell after it. The unit is the text after the value in the
+    same cell, or else the first later cell that is not a flag or a reference
+    range, in whichever column it comes; it is empty when the row has none.
+    The range is the first later "low - high" cell, if its low end is below
+    its high end. Returns None for rows that are not results of a known test.
+    """
+    for position, cell in enumerate(cells):
+        param_name = lookup_parameter(cell)
+        if param_name:
+            break
+    else:
+        return None
+
+    value = None
+    unit = ''
+    normal_range = None
+    for cell in cells[position + 1:]:
+        if value is None:
+            match = _value_cell.match(cell)
+            if match:
+                value = float(match.group(1))
+                unit = _without_flags(match.group(2) or '')
+            elif cell.strip():
+                return None
+        elif _range_cell.match(cell):
+            bounds = _range_bounds.match(cell)
+            if normal_range is None and bounds and float(bounds.group(1)) < float(bounds.group(2)):
+                normal_range = (float(bounds.group(1)), float(bounds.group(2)))
+        elif not unit:
+            unit = _without_flags(cell)
+        if unit and normal_range:
+            break
+    if value is None:
+        return None
+    return TableRow(param_name, value, unit, normal_range)
+
+def _split_tables(text: str):
+    """
+    Separates the table rows of a text from its free text. Returns the free
+    text and the first row found for each parameter. Lines with cells that
+    are not a result row are kept in the free text, space-joined.
+    """
+    rows = {}
+    free_lines = []
+    for line in text.split('\n'):
+        if TABLE_CELL_SEPARATOR not in line:
+            free_lines.append(line)
+            continue
+        cells = line.split(TABLE_CELL_SEPARATOR)
+        # Only the first result of each test is used, so repeated rows are
+        # dropped without being parsed
+        if lookup_parameter(cells[0]) in rows:
+            continue
+        row = parse_table_row(cells)
+        if row is None:
+            free_lines.append(line.replace(TABLE_CELL_SEPARATOR, ' '))
+        elif row.parameter not in rows:
+            rows[row.parameter] = row
+            if len(rows) == len(patterns):
+                # Nothing is left for the regexes to find
+                break
+    return '\n'.join(free_lines), rows
+
+def extract_results(text: str, sex: Optional[str] = None, age: Optional[float] = None) -> List[ParameterResult]:
+    """
+    Parses the text and extracts medical parameters. Results in table rows
+    are read cell by cell, and converted to the unit of `patterns` when the
+    row gives another one; the regex patterns are only run on the free text,
+    for the parameters no table row gave. Statuses use the reference range
+    printed in a result's table row, otherwise the ranges for `sex` and `age`
+    where known.
     """
     results = []
+    table_rows = {}
+    if TABLE_CELL_SEPARATOR in text:
+        text, table_rows = _split_tables(text)
+    lowered = text.translate(_keyword_fold).lower()
     
-    for param_name, config in patterns.items():
-        match = re.search(config['regex'], text, re.IGNORECASE)
-        if match:
+    for analyte, compiled, keywords in _compiled_patterns:
+        row = table_rows.get(analyte.name)
+        printed_range = None
+        if row:
+            value = reference_ranges.to_canonical(analyte.name, row.value, row.unit)
+            if row.normal_range:
+                printed_range = tuple(reference_ranges.to_canonical(analyte.name, bound, row.unit) for bound in row.normal_range)
+        else:
+            match = _first_match(compiled, keywords, text, lowered)
+            if not match:
+                continue
             try:
                 value = float(match.group(1))
-                status = determine_status(value, config['range'], param_name)
-                
-                result = {
-                    "parameter": param_name,
-                    "value": value,
-                    "unit": config['unit'],
-                    "status": status,
-                    "normal_range": config['range'],
-                    "category": config['category'],
-                    "reference_range_display": f"{config['range'][0]} - {config['range'][1]} {config['unit']}"
-                }
-                results.append(result)
             except ValueError:
                 continue
+
+        results.append(make_result(analyte.name, value, sex, age, printed_range))
                 
     return results
+
+def extract_parameters(text: str):
+    """
+    extract_results() in the JSON shape.
+    Returns a list of dictionaries with parameter details.
+    """
+    return [result.to_dict() for result in extract_results(text)]
+
+# Report dates. Numeric dates such as 03/04/2024 are read day-first unless
+# REPORT_DATE_DAYFIRST is false or only the other reading is a valid date.
+# Numeric dates must use the same separator twice, so ranges like
+# "10.5-12.0" are not mistaken for dates.
+REPORT_DATE_DAYFIRST = os.getenv("REPORT_DATE_DAYFIRST", "true").lower() == "true"
+
+_MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+_DATE_PATTERN = (
+    r'(?:(?P<iso_y>\d{4})(?P<iso_sep>[-/._])(?P<iso_m>\d{1,2})(?P=iso_sep)(?P<iso_d>\d{1,2})'
+    r'|(?P<num_a>\d{1,2})(?P<num_sep>[-/._])(?P<num_b>\d{1,2})(?P=num_sep)(?P<num_y>\d{4}|\d{2})(?![\d.])'
+    r'|(?P<dmy_d>\d{1,2})(?:st|nd|rd|th)?[\s\-_]*(?P<dmy_m>(?:' + '|'.join(_MONTHS) + r')[a-z]*)\.?[\s,\-_]*(?P<dmy_y>\d{4})'
+    r'|(?P<mdy_m>(?:' + '|'.join(_MONTHS) + r')[a-z]*)\.?[\s\-_]*(?P<mdy_d>\d{1,2})(?:st|nd|rd|th)?,?[\s\-_]*(?P<mdy_y>\d{4}))'
+)
+_any_date = re.compile(r'(?<!\d)' + _DATE_PATTERN, re.IGNORECASE)
+# A date following a label on the same line: one that names the sample or
+# report such as "Collected on:", or else a plain "Date" or "Report Date"
+_sample_date = re.compile(
+    r'(?:collected|collection|reported|received|sampled?|registered)\b[^\n\d]{0,40}?(?<!\d)' + _DATE_PATTERN,
+    re.IGNORECASE
+)
+_labelled_date = re.compile(r'date\b(?!\s*of\s+birth)[^\n\d]{0,40}?(?<!\d)' + _DATE_PATTERN, re.IGNORECASE)
+# Dates of birth, which are never the report date
+_birth_date = re.compile(
+    r'(?:birth|d\.?o\.?b\b|born)[^\n\d]{0,40}?(?<!\d)' + _DATE_PATTERN,
+    re.IGNORECASE
+)
+
+def _make_date(year: int, month: int, day: int):
+    if year < 100:
+        year += 2000 if year < 70 else 1900
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+def _date_from_match(match):
+    groups = match.groupdict()
+    if groups['iso_y']:
+        return _make_date(int(groups['iso_y']), int(groups['iso_m']), int(groups['iso_d']))
+    if groups['num_a']:
+        a, b, year = int(groups['num_a']), int(groups['num_b']), int(groups['num_y'])
+        first, second = (_make_date(year, b, a), _make_date(year, a, b))
+        if not REPORT_DATE_DAYFIRST:
+            first, second = second, first
+        return first or second
+    if groups['dmy_d']:
+        month = _MONTHS.index(groups['dmy_m'][:3].lower()) + 1
+        return _make_date(int(groups['dmy_y']), month, int(groups['dmy_d']))
+    month = _MONTHS.index(groups['mdy_m'][:3].lower()) + 1
+    return _make_date(int(groups['mdy_y']), month, int(groups['mdy_d']))
+
+def extract_report_date(text: str, filename: str = None):
+    """
+    Finds the date of a report. Prefers a date labelled as the sample or
+    report date (e.g. "Collected: 12/03/2024"), then one labelled "Date",
+    then any date in the text, then a date in the filename. Dates of birth
+    are skipped. Returns an ISO date string or None.
+    """
+    births = {match.end() for match in _birth_date.finditer(text or "")}
+    sources = ((_sample_date, text), (_labelled_date, text), (_any_date, text), (_any_date, filename))
+    for pattern, source in sources:
+        if not source:
+            continue
+        for match in pattern.finditer(source):
+            if source is text and match.end() in births:
+                continue
+            found = _date_from_match(match)
+            if found:
+                return found.isoformat()
+    return None
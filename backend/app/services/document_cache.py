@@ -0,0 +1,59 @@
+import os
+from typing import Optional
+from app.services.cache import SQLiteStore, TTLCache, make_key
+from app.services.data_extractor import make_result, patterns
+from app.services.reference_ranges import UNIT_FACTORS
+
+# Parsed documents kept in memory, keyed by the SHA-256 of the upload. Set
+# DOC_CACHE_DB to a file path to also keep them on disk across restarts.
+DOC_CACHE_SIZE = int(os.getenv("DOC_CACHE_SIZE", "256"))
+DOC_CACHE_TTL = float(os.getenv("DOC_CACHE_TTL", str(24 * 3600)))
+DOC_CACHE_DB = os.getenv("DOC_CACHE_DB", "")
+
+# Version of the parsers and the extractor. Bump it with any change to how
+# text is read from documents or how values are found in it; together with
+# the patterns and unit conversions it is part of every key, so results from
+# an older extractor are never served, also from DOC_CACHE_DB.
+PARSER_VERSION = 2
+
+EXTRACTOR_VERSION = make_key(PARSER_VERSION, patterns, UNIT_FACTORS)
+
+document_cache = TTLCache(
+    max_size=DOC_CACHE_SIZE,
+    ttl=DOC_CACHE_TTL,
+    store=SQLiteStore(DOC_CACHE_DB, table="document_cache") if DOC_CACHE_DB else None
+)
+
+def _key(document_hash: str) -> str:
+    return make_key("values", document_hash, EXTRACTOR_VERSION)
+
+def get_parsed_document(document_hash: str, sex: Optional[str] = None, age: Optional[float] = None) -> Optional[dict]:
+    """
+    Returns {"text", "parameters"} for a document that was parsed before, or
+    None. The parameters are ParameterResults, classified for `sex` and `age`,
+    so the same upload can be read for patients with different ranges.
+    """
+    cached = document_cache.get(_key(document_hash))
+    if cached is None:
+        return None
+    return {
+        "text": cached["text"],
+        "parameters": [
+            make_result(name, value, sex, age, tuple(printed_range) if printed_range else None)
+            for name, value, printed_range in cached["parameters"]
+        ]
+    }
+
+def store_parsed_document(document_hash: str, text: str, parameters: list):
+    """
+    Caches a parsed document and its ParameterResults. Only the name, value
+    and any range printed on the report are kept for each result; statuses are
+    worked out again on read.
+    """
+    document_cache.set(_key(document_hash), {
+        "text": text,
+        "parameters": [
+            (p.parameter, p.value, p.reference.normal_range if p.reference and p.reference.printed else None)
+            for p in parameters
+        ]
+    })
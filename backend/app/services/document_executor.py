@@ -0,0 +1,108 @@
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.services.metrics import run_captured, record_captured
+
+# Number of worker processes used for PDF parsing and OCR.
+DOC_WORKERS = int(os.getenv("DOC_WORKERS", str(os.cpu_count() or 2)))
+# Documents allowed to be queued or running at once before new ones are rejected.
+DOC_QUEUE_LIMIT = int(os.getenv("DOC_QUEUE_LIMIT", str(DOC_WORKERS * 4)))
+# Seconds to wait for a single document before giving up on it.
+DOC_TIMEOUT = float(os.getenv("DOC_TIMEOUT", "120"))
+# "process" for CPU-bound production use, "thread" where worker processes are unavailable.
+DOC_EXECUTOR = os.getenv("DOC_EXECUTOR", "process")
+
+class DocumentQueueFull(Exception):
+    """Raised when too many documents are already waiting to be processed."""
+
+class DocumentTimeout(Exception):
+    """Raised when a document takes longer than the configured timeout."""
+
+class DocumentExecutor:
+    """
+    Runs blocking document work (pdfplumber, pdf2image, Tesseract) in a pool of
+    worker processes so the event loop stays responsive. The pool is created on
+    first use.
+    """
+
+    def __init__(self, max_workers: int = DOC_WORKERS, queue_limit: int = DOC_QUEUE_LIMIT,
+                 timeout: float = DOC_TIMEOUT, kind: str = DOC_EXECUTOR):
+        self.max_workers = max(1, max_workers)
+        self.queue_limit = max(1, queue_limit)
+        self.timeout = timeout
+        self.kind = kind
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.kind == "thread":
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="document")
+            else:
+                # Spawned workers do not inherit the server's threads or sockets
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+        return self._pool
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args):
+        """
+        Runs fn(*args) in the pool and returns its result. `fn` must be a
+        module-level function so it can be sent to a worker process.
+        """
+        with self._lock:
+            if self._pending >= self.queue_limit:
+                raise DocumentQueueFull(f"{self._pending} documents are already queued")
+            self._pending += 1
+
+        try:
+            future = self._get_pool().submit(run_captured, time.time(), fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        # A slot is only freed once the worker is really done with the document,
+        # even if the caller stopped waiting for it.
+        future.add_done_callback(self._release)
+
+        try:
+            result, timings = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise DocumentTimeout(f"Document processing exceeded {self.timeout} seconds")
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool next time
+            self._pool = None
+            raise
+        record_captured(timings)
+        return result
+
+    async def warm(self, fn):
+        """
+        Starts the worker processes and runs fn() once per worker, so imports
+        and other setup happen before the first document arrives. Best effort:
+        a worker that starts late may not get a call.
+        """
+        pool = self._get_pool()
+        futures = [asyncio.wrap_future(pool.submit(fn)) for _ in range(self.max_workers)]
+        await asyncio.gather(*futures)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+document_executor = DocumentExecutor()
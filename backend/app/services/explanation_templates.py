@@ -0,0 +1,157 @@
+import os
+from typing import Optional
+
+# When generate_explanation may answer from a template instead of the model:
+#   "abnormal" - templates for normal/optimal results, the model for low/high
+#   "template" - templates for everything, the model is never asked
+#   "llm"      - always ask the model (templates only without an API key)
+EXPLANATION_POLICY = os.getenv("EXPLANATION_POLICY", "abnormal").lower()
+
+# Statuses answered from templates under the "abnormal" policy
+TEMPLATE_STATUSES = ('normal', 'optimal')
+
+# Per analyte: what the test measures, and what a low or high result usually
+# points to. Keys match data_extractor.patterns.
+ANALYTES = {
+    'HbA1c': (
+        "HbA1c shows your average blood sugar over the past two to three months.",
+        "A low value is uncommon and can follow blood loss or some types of anaemia.",
+        "A higher value means blood sugar has been running above the healthy range and can point to prediabetes or diabetes.",
+    ),
+    'Glucose Fasting': (
+        "Fasting glucose is the amount of sugar in your blood after not eating overnight.",
+        "A low value can cause shakiness or tiredness and is sometimes linked to skipped meals or medication.",
+        "A higher value can mean the body is not handling sugar as well as it should.",
+    ),
+    'Total Cholesterol': (
+        "Total cholesterol is the overall amount of cholesterol, a fat-like substance, in your blood.",
+        "A low value is rarely a concern on its own.",
+        "A higher value can add to the risk of heart and blood vessel disease over time.",
+    ),
+    'HDL Cholesterol': (
+        "HDL is the 'good' cholesterol that helps carry excess cholesterol away from your arteries.",
+        "A low value gives your heart less of this protection; exercise and diet can help raise it.",
+        "A high value is generally considered protective.",
+    ),
+    'LDL Cholesterol': (
+        "LDL is the 'bad' cholesterol that can build up in the walls of your arteries.",
+        "A low value is generally not a concern.",
+        "A higher value can add to the risk of heart disease over time, and diet, exercise or medication can lower it.",
+    ),
+    'Triglycerides': (
+        "Triglycerides are a type of fat in the blood that the body uses for energy.",
+        "A low value is rarely a concern.",
+        "A higher value is often linked to diet, alcohol or blood sugar and can add to heart risk.",
+    ),
+    'TSH': (
+        "TSH is a hormone that tells your thyroid gland how much thyroid hormone to make.",
+        "A low value can mean the thyroid is more active than usual.",
+        "A higher value can mean the thyroid is less active than usual.",
+    ),
+    'Hemoglobin': (
+        "Hemoglobin is the protein in red blood cells that carries oxygen around your body.",
+        "A low value can be a sign of anaemia and may cause tiredness.",
+        "A higher value can be linked to dehydration, smoking or living at high altitude.",
+    ),
+    'WBC': (
+        "The white blood cell count measures the cells that help your body fight infection.",
+        "A low value can mean your body has fewer infection-fighting cells than usual.",
+        "A higher value is often the body's response to an infection or inflammation.",
+    ),
+    'Platelets': (
+        "Platelets are small blood cells that help your blood clot.",
+        "A low value can make bruising or bleeding more likely.",
+        "A higher value can be a response to inflammation, infection or low iron.",
+    ),
+    'Serum Creatinine': (
+        "Creatinine is a waste product from your muscles that the kidneys filter out of the blood.",
+        "A low value is usually linked to lower muscle mass and is rarely a concern.",
+        "A higher value can mean the kidneys are filtering less efficiently, or can follow dehydration.",
+    ),
+    'BUN': (
+        "Blood urea nitrogen (BUN) is a waste product from protein breakdown that the kidneys remove.",
+        "A low value is usually linked to a low-protein diet and is rarely a concern.",
+        "A higher value can be linked to dehydration, a high-protein diet or reduced kidney function.",
+    ),
+    'Uric Acid': (
+        "Uric acid is a waste product formed when the body breaks down substances called purines.",
+        "A low value is rarely a concern.",
+        "A higher value can lead to gout or kidney stones in some people.",
+    ),
+    'AST (SGOT)': (
+        "AST is an enzyme found mainly in the liver and muscles.",
+        "A low value is generally not a concern.",
+        "A higher value can mean liver or muscle cells are under some strain.",
+    ),
+    'ALT (SGPT)': (
+        "ALT is an enzyme found mostly in the liver.",
+        "A low value is generally not a concern.",
+        "A higher value can be a sign of liver irritation, for example from fatty liver, alcohol or medication.",
+    ),
+    'Alkaline Phosphatase': (
+        "Alkaline phosphatase (ALP) is an enzyme found in the liver and bones.",
+        "A low value is uncommon and can be linked to nutrition.",
+        "A higher value can come from the liver, the bile ducts or bone growth and repair.",
+    ),
+    'Total Bilirubin': (
+        "Bilirubin is a yellow pigment made when old red blood cells are broken down and cleared by the liver.",
+        "A low value is generally not a concern.",
+        "A higher value can be linked to the liver or to faster breakdown of red blood cells.",
+    ),
+    'Vitamin D': (
+        "Vitamin D helps your body absorb calcium and keeps bones and muscles healthy.",
+        "A low value is common and is often improved with sunlight, diet or supplements.",
+        "A higher value usually comes from taking a lot of supplements.",
+    ),
+    'Vitamin B12': (
+        "Vitamin B12 is needed to make red blood cells and keep nerves healthy.",
+        "A low value can cause tiredness or tingling and is often linked to diet or absorption.",
+        "A higher value is usually linked to supplements and is rarely a concern on its own.",
+    ),
+    'Sodium': (
+        "Sodium is a salt in the blood that helps control fluid balance and nerve signals.",
+        "A low value can be linked to drinking a lot of water, some medications or hormone changes.",
+        "A higher value is most often a sign of dehydration.",
+    ),
+    'Potassium': (
+        "Potassium is a mineral that helps your nerves, muscles and heart work properly.",
+        "A low value can cause muscle weakness or cramps and is often linked to fluid loss or medication.",
+        "A higher value can affect the heart rhythm and is often linked to the kidneys or medication.",
+    ),
+    'Calcium': (
+        "Calcium is a mineral that keeps bones strong and helps muscles and nerves work.",
+        "A low value can be linked to low vitamin D or low blood protein levels.",
+        "A higher value can be linked to the parathyroid glands or too much vitamin D.",
+    ),
+}
+
+def use_template(parameter: str, status: str, policy: Optional[str] = None) -> bool:
+    """
+    Whether the policy (EXPLANATION_POLICY by default) lets this result be
+    explained without the model.
+    """
+    policy = policy or EXPLANATION_POLICY
+    if parameter not in ANALYTES or policy == "llm":
+        return False
+    return policy == "template" or status in TEMPLATE_STATUSES
+
+def template_explanation(parameter: str, value: float, unit: str, status: str, normal_range: str) -> Optional[str]:
+    """
+    Explanation built from the analyte's templates, or None for a parameter
+    without templates.
+    """
+    analyte = ANALYTES.get(parameter)
+    if analyte is None:
+        return None
+    measures, low, high = analyte
+    result = f"Your result of {value:g} {unit}"
+
+    if status == 'optimal':
+        return f"{measures} {result} is in the optimal range, which is a good sign."
+    if status == 'normal':
+        return f"{measures} {result} is within the normal range ({normal_range})."
+    meaning = low if status == 'low' else high
+    return (
+        f"{measures} {result} is {status} compared with the normal range ({normal_range}). "
+        f"{meaning} Please discuss this result with your doctor."
+    )
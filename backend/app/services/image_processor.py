@@ -1,18 +1,134 @@
-import pytesseract
-from PIL import Image
+import os
+from PIL import Image, ImageOps
 import io
+from typing import Union
+from app.services.admission import ocr_stage
+from app.services.document_executor import document_executor
+from app.services.metrics import timer
+from app.services.ocr_engine import ocr_image
 
-async def process_image(file_bytes: bytes) -> str:
+# Images are scaled down so the long side is at most OCR_IMAGE_MAX_SIDE
+# pixels (about A4 at 200 DPI) and never above OCR_IMAGE_DPI when the file
+# records its resolution. Tesseract time grows with pixel count, and phone
+# photos are far larger than it needs.
+OCR_IMAGE_MAX_SIDE = int(os.getenv("OCR_IMAGE_MAX_SIDE", "2400"))
+OCR_IMAGE_DPI = int(os.getenv("OCR_IMAGE_DPI", "300"))
+# Convert to black and white (Otsu threshold) and crop to the text before OCR.
+OCR_BINARIZE = os.getenv("OCR_BINARIZE", "true").lower() == "true"
+OCR_CROP_MARGIN = int(os.getenv("OCR_CROP_MARGIN", "20"))
+
+# Tesseract settings for lab reports: page segmentation mode OCR_PSM (6 = one
+# uniform block of text). OCR_CHAR_WHITELIST limits recognition to the given
+# characters; it is off by default, since a character missing from it (such
+# as ^ in "10^9/L" or the Greek μ) is misread rather than skipped.
+OCR_PSM = int(os.getenv("OCR_PSM", "6"))
+OCR_CHAR_WHITELIST = os.getenv("OCR_CHAR_WHITELIST", "")
+
+def ocr_variables(whitelist: str = OCR_CHAR_WHITELIST) -> dict:
+    variables = {"preserve_interword_spaces": "1"}
+    if whitelist:
+        variables["tessedit_char_whitelist"] = whitelist
+    return variables
+
+async def process_image(source: Union[bytes, str]) -> str:
+    """
+    Extract text from an image (its bytes or a file path) in the document
+    worker pool, once the OCR stage has a free slot.
+    """
+    async with ocr_stage.slot():
+        return await document_executor.run(extract_image_text, source)
+
+def extract_image_text(source: Union[bytes, str]) -> str:
     """
     Extract text from an image file using OCR.
     """
     try:
         # Open image using PIL
-        image = Image.open(io.BytesIO(file_bytes))
-        
+        image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+        with timer("image_preprocess"):
+            image = preprocess_image(image)
+
         # Perform OCR
-        text = pytesseract.image_to_string(image)
+        with timer("image_ocr"):
+            text = ocr_image(image, psm=OCR_PSM, variables=ocr_variables())
         return text
     except Exception as e:
         print(f"Error processing image: {e}")
         return ""
+
+def _target_scale(image: Image.Image, max_side: int, dpi: int) -> float:
+    scale = min(1.0, max_side / max(image.size))
+    image_dpi = image.info.get("dpi")
+    if image_dpi and image_dpi[0] and image_dpi[0] > dpi:
+        scale = min(scale, dpi / float(image_dpi[0]))
+    return scale
+
+def otsu_threshold(image: Image.Image) -> int:
+    """
+    Gray level that best separates ink from paper in an "L" image.
+    """
+    histogram = image.histogram()
+    total = sum(histogram)
+    sum_all = sum(level * count for level, count in enumerate(histogram))
+    weight_below = sum_below = 0
+    best_variance = -1.0
+    threshold = 127
+    for level, count in enumerate(histogram):
+        weight_below += count
+        if weight_below == 0:
+            continue
+        weight_above = total - weight_below
+        if weight_above == 0:
+            break
+        sum_below += level * count
+        mean_below = sum_below / weight_below
+        mean_above = (sum_all - sum_below) / weight_above
+        variance = weight_below * weight_above * (mean_below - mean_above) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            threshold = level
+    return threshold
+
+def preprocess_image(image: Image.Image, max_side: int = OCR_IMAGE_MAX_SIDE, dpi: int = OCR_IMAGE_DPI,
+                     binarize: bool = OCR_BINARIZE, crop_margin: int = OCR_CROP_MARGIN) -> Image.Image:
+    """
+    Prepares an image for Tesseract: downscaled, upright, grayscale and, with
+    `binarize`, black text on white cropped to the text area.
+    """
+    scale = _target_scale(image, max_side, dpi)
+    target_side = max(1, round(max(image.size) * scale))
+    if scale < 1.0:
+        # JPEGs can be decoded straight at a reduced scale and in grayscale,
+        # which skips most of the decoding work for large photos
+        image.draft("L", (int(image.width * scale), int(image.height * scale)))
+
+    image = ImageOps.exif_transpose(image.convert("L"))
+
+    if max(image.size) > target_side:
+        factor = target_side / max(image.size)
+        # Pillow's bilinear filter is antialiased when shrinking, and is about
+        # twice as fast as Lanczos with no difference Tesseract can see
+        image = image.resize(
+            (max(1, round(image.width * factor)), max(1, round(image.height * factor))),
+            Image.BILINEAR,
+            reducing_gap=2.0
+        )
+
+    if not binarize:
+        return image
+
+    threshold = otsu_threshold(image)
+    image = image.point([0] * (threshold + 1) + [255] * (255 - threshold))
+
+    # Crop to the bounding box of the dark pixels, keeping a small margin
+    box = ImageOps.invert(image).getbbox()
+    if box:
+        left, top, right, bottom = box
+        image = image.crop((
+            max(0, left - crop_margin),
+            max(0, top - crop_margin),
+            min(image.width, right + crop_margin),
+            min(image.height, bottom + crop_margin),
+        ))
+    return image
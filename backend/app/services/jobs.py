@@ -0,0 +1,150 @@
+import os
+import time
+import uuid
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+
+# Jobs processed at the same time, jobs allowed to wait in the queue, and
+# seconds a finished job stays available for polling.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "50"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+
+class JobQueueFull(Exception):
+    """Raised when the job queue has no room for another job."""
+
+class Job:
+    """
+    State of one queued analysis. `stages` maps each pipeline stage to
+    "pending", "running", "done" or "failed", and `result` holds whatever
+    partial results are available so far.
+    """
+
+    def __init__(self, stages: list, payload=None):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.stages = {stage: "pending" for stage in stages}
+        self.progress = {}
+        self.result = {}
+        self.error = None
+        self.payload = payload
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def start_stage(self, stage: str):
+        self.stages[stage] = "running"
+
+    def finish_stage(self, stage: str):
+        self.stages[stage] = "done"
+
+    @property
+    def current_stage(self) -> Optional[str]:
+        for stage, state in self.stages.items():
+            if state in ("running", "failed"):
+                return stage
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.current_stage,
+            "stages": self.stages,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error
+        }
+
+class JobManager:
+    """
+    Bounded in-process job queue served by a fixed number of worker tasks.
+    `runner(job)` does the actual work and records progress on the job.
+    `cleanup(job)`, if given, releases whatever a job keeps outside memory
+    (files, uploads): it is called when a finished job expires, and for every
+    job, finished or not, when the manager stops.
+    """
+
+    def __init__(self, runner: Callable[[Job], Awaitable[None]], stages: list,
+                 workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE, retention: float = JOB_RETENTION,
+                 cleanup: Optional[Callable[[Job], None]] = None):
+        self.runner = runner
+        self.cleanup = cleanup
+        self.stages = stages
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.retention = retention
+        self.jobs: Dict[str, Job] = {}
+        self._queue = None
+        self._tasks = []
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Jobs only exist in this process, so nothing can reach their files
+        # after a restart
+        for job in self.jobs.values():
+            self._cleanup(job)
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, payload) -> Job:
+        """
+        Queues a new job. Raises JobQueueFull instead of waiting when the
+        queue is full.
+        """
+        self._prune()
+        job = Job(self.stages, payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"{self.queue_size} jobs are already queued")
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._prune()
+        return self.jobs.get(job_id)
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            try:
+                await self.runner(job)
+                job.status = "completed"
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "The server shut down before the job finished."
+                raise
+            except Exception as e:
+                print(f"Job {job.id} failed: {e}")
+                stage = job.current_stage
+                if stage:
+                    job.stages[stage] = "failed"
+                job.status = "failed"
+                job.error = getattr(e, "detail", None) or str(e)
+            finally:
+                job.payload = None
+                job.finished_at = time.time()
+                self._queue.task_done()
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            self._cleanup(self.jobs.pop(job_id))
+
+    def _cleanup(self, job: Job):
+        if self.cleanup is None:
+            return
+        try:
+            self.cleanup(job)
+        except Exception as e:
+            print(f"Cleaning up job {job.id} failed: {e}")
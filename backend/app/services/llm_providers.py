@@ -0,0 +1,242 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from contextlib import nullcontext
+from typing import AsyncContextManager, Callable, Optional
+
+# Model backend: "gemini", "openai", "anthropic", or "stub" for offline runs.
+# LLM_MODEL overrides the provider's default model.
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()
+LLM_MODEL = os.getenv("LLM_MODEL", "")
+# Requests per second sent to the provider (0 disables the limit), and how
+# many of them may go out back to back.
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "5"))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", "5"))
+# Retries for rate-limited, failed or timed-out requests, with exponential
+# backoff starting at LLM_RETRY_BASE_DELAY seconds.
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "30"))
+# Seconds allowed per request attempt.
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "512"))
+# Simulated response time of the stub provider.
+LLM_STUB_LATENCY = float(os.getenv("LLM_STUB_LATENCY", "0"))
+
+class RateLimiter:
+    """
+    Spaces requests out to `rate` per second while allowing bursts of up to
+    `burst`. After a rate-limit response, pause() holds back every caller
+    until the provider is ready again instead of letting them all retry.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self._interval = 1 / rate if rate > 0 else 0.0
+        self._tolerance = self._interval * (max(1, burst) - 1)
+        self._next = 0.0
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Claims the next free slot and returns the seconds to wait for it.
+        """
+        if self.rate <= 0:
+            return max(0.0, self._blocked_until - time.monotonic())
+        with self._lock:
+            now = time.monotonic()
+            due = max(self._next, now)
+            slot = max(now, due - self._tolerance, self._blocked_until)
+            self._next = max(due, slot) + self._interval
+            return slot - now
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+class LLMProvider:
+    """
+    Base class for model backends. Subclasses create their client once in
+    __init__ and implement _generate(); generate() adds rate limiting,
+    a per-attempt timeout and retries with backoff.
+    """
+    name = "base"
+    default_model = ""
+    # Errors worth retrying, and the subset that means "slow down"
+    retryable_errors: tuple = ()
+    rate_limit_errors: tuple = ()
+
+    def __init__(self, model: str = "", rate_limit: float = LLM_RATE_LIMIT, burst: int = LLM_RATE_BURST,
+                 max_retries: int = LLM_MAX_RETRIES, base_delay: float = LLM_RETRY_BASE_DELAY,
+                 max_delay: float = LLM_RETRY_MAX_DELAY, timeout: float = LLM_TIMEOUT):
+        self.model_name = model or self.default_model
+        self.limiter = RateLimiter(rate_limit, burst)
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+    async def _generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def generate(self, prompt: str, slot: Optional[Callable[[], AsyncContextManager]] = None) -> str:
+        """
+        The model's answer to `prompt`. If given, `slot()` is entered around
+        each attempt only, so callers waiting on the rate limit or a retry
+        delay do not hold it.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                async with slot() if slot is not None else nullcontext():
+                    return await asyncio.wait_for(self._generate(prompt), self.timeout)
+            except Exception as e:
+                retryable = isinstance(e, (asyncio.TimeoutError, *self.retryable_errors))
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self.retry_delay(e, attempt)
+                if isinstance(e, self.rate_limit_errors):
+                    self.limiter.pause(delay)
+                print(f"{self.name} request failed ({type(e).__name__}), retry {attempt + 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def retry_delay(self, error: Exception, attempt: int) -> float:
+        """
+        The server's Retry-After if it sent one, otherwise exponential backoff
+        with jitter so concurrent callers do not retry in lockstep.
+        """
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        retry_after = headers.get("retry-after") if hasattr(headers, "get") else None
+        try:
+            if retry_after is not None:
+                return min(self.max_delay, float(retry_after))
+        except ValueError:
+            pass
+        backoff = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(backoff / 2, backoff)
+
+    async def close(self):
+        pass
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+    default_model = "gemini-pro"
+
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(**kwargs)
+        import google.generativeai as genai
+        from google.api_core import exceptions
+
+        self.retryable_errors = (
+            exceptions.TooManyRequests, exceptions.ResourceExhausted, exceptions.ServiceUnavailable,
+            exceptions.InternalServerError, exceptions.DeadlineExceeded,
+        )
+        self.rate_limit_errors = (exceptions.TooManyRequests, exceptions.ResourceExhausted)
+        # configure() replaces the shared client (and its channel), so it is
+        # only called once, here
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(self.model_name)
+
+    async def _generate(self, prompt: str) -> str:
+        # The async client, so a timed-out attempt is cancelled instead of
+        # leaving a blocking call running in a worker thread
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+    default_model = "gpt-3.5-turbo"
+
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(**kwargs)
+        import openai
+
+        self.retryable_errors = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+        self.rate_limit_errors = (openai.RateLimitError,)
+        # Retries are handled here, so the SDK's own are disabled
+        self.client = openai.AsyncOpenAI(api_key=api_key, max_retries=0, timeout=self.timeout)
+
+    async def _generate(self, prompt: str) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=LLM_MAX_TOKENS
+        )
+        return response.choices[0].message.content
+
+    async def close(self):
+        await self.client.close()
+
+class AnthropicProvider(LLMProvider):
+    name = "anthropic"
+    default_model = "claude-3-haiku-20240307"
+
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(**kwargs)
+        import anthropic
+
+        self.retryable_errors = (anthropic.RateLimitError, anthropic.APIConnectionError, anthropic.InternalServerError)
+        self.rate_limit_errors = (anthropic.RateLimitError,)
+        self.client = anthropic.AsyncAnthropic(api_key=api_key, max_retries=0, timeout=self.timeout)
+
+    async def _generate(self, prompt: str) -> str:
+        response = await self.client.messages.create(
+            model=self.model_name,
+            max_tokens=LLM_MAX_TOKENS,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        return "".join(block.text for block in response.content if getattr(block, "text", None))
+
+    async def close(self):
+        await self.client.close()
+
+class StubProvider(LLMProvider):
+    """
+    Offline stand-in for tests and benchmarks. Answers after `latency`
+    seconds with a fixed text that names the test being explained.
+    """
+    name = "stub"
+    default_model = "stub"
+
+    def __init__(self, latency: float = LLM_STUB_LATENCY, **kwargs):
+        kwargs.setdefault("rate_limit", 0)
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.calls = 0
+
+    async def _generate(self, prompt: str) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        test_line = next((line.strip() for line in prompt.splitlines() if "- Test:" in line), "recommendations")
+        return f"Stub response for {test_line}."
+
+PROVIDERS = {
+    "gemini": (GeminiProvider, "GEMINI_API_KEY"),
+    "openai": (OpenAIProvider, "OPENAI_API_KEY"),
+    "anthropic": (AnthropicProvider, "ANTHROPIC_API_KEY"),
+}
+
+def create_provider(name: str = LLM_PROVIDER, model: str = LLM_MODEL) -> Optional[LLMProvider]:
+    """
+    Builds the configured provider, or returns None when its API key is not
+    set, in which case callers fall back to template text.
+    """
+    if name == "stub":
+        return StubProvider(model=model)
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM_PROVIDER {name!r}; expected one of {', '.join([*PROVIDERS, 'stub'])}")
+    provider_class, key_variable = PROVIDERS[name]
+    api_key = os.getenv(key_variable)
+    if not api_key:
+        print(f"{key_variable} is not set; explanations will use template text.")
+        return None
+    return provider_class(api_key, model=model)
@@ -1,17 +1,91 @@
 import os
-import google.generativeai as genai
+import asyncio
+import threading
+from typing import Optional
+from app.services.admission import StageBusy, llm_stage
+from app.services.cache import SQLiteStore, TTLCache, make_key
+from app.services.llm_providers import LLMProvider, create_provider
+from app.services.explanation_templates import template_explanation, use_template
+from app.services.metrics import LLM_REQUESTS, timer
+
+# Maximum number of explanation requests sent to the model at the same time
+# for a single report.
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "5"))
+
+# Explanation cache. The model's text usually quotes the value, so entries are
+# keyed by the exact value as well as the provider and model that wrote them.
+# Set LLM_CACHE_DB to a file path to keep entries across restarts.
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "")
+
+explanation_cache = TTLCache(
+    max_size=LLM_CACHE_SIZE,
+    ttl=LLM_CACHE_TTL,
+    store=SQLiteStore(LLM_CACHE_DB, table="llm_cache") if LLM_CACHE_DB else None
+)
+
+_provider: Optional[LLMProvider] = None
+_provider_ready = False
+_provider_lock = threading.Lock()
+
+def _load_provider() -> Optional[LLMProvider]:
+    global _provider, _provider_ready
+    with _provider_lock:
+        if not _provider_ready:
+            _provider = create_provider()
+            _provider_ready = True
+    return _provider
+
+async def get_provider() -> Optional[LLMProvider]:
+    """
+    The model provider shared by every request, created on first use (the app
+    creates it at startup). None when no API key is configured.
+    """
+    if _provider_ready:
+        return _provider
+    # Creating it imports the SDK, and the startup warm-up may be doing so
+    # already; wait for that in a thread, never on the event loop
+    return await asyncio.to_thread(_load_provider)
+
+async def close_provider():
+    global _provider, _provider_ready
+    if _provider is not None:
+        await _provider.close()
+    _provider = None
+    _provider_ready = False
+
+def _offline_explanation(parameter: str, value: float, unit: str, status: str, normal_range: str) -> str:
+    templated = template_explanation(parameter, value, unit, status, normal_range)
+    if templated:
+        return templated
+    return f"The {parameter} level is {value} {unit}, which is considered {status}. Please consult your doctor for a detailed diagnosis."
+
+def _offline_recommendations(abnormal_parameters: list) -> str:
+    items = ", ".join([f"{p['parameter']} ({p['status']})" for p in abnormal_parameters])
+    return f"We noticed some values outside the normal range: {items}. It is recommended to discuss these results with your healthcare provider."
 
 async def generate_explanation(parameter: str, value: float, unit: str, status: str, normal_range: str) -> str:
     """
-    Generate a simple explanation for a medical parameter using Google Gemini.
+    Generate a simple explanation for a medical parameter. Results the
+    explanation policy allows are answered from local templates; the rest go
+    to the configured model.
     """
-    api_key = os.getenv("GEMINI_API_KEY")
+    if use_template(parameter, status):
+        LLM_REQUESTS.inc(kind="explanation", outcome="template")
+        return template_explanation(parameter, value, unit, status, normal_range)
 
-    if not api_key:
-        return f"The {parameter} level is {value} {unit}, which is considered {status}. Please consult your doctor for a detailed diagnosis."
+    provider = await get_provider()
 
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-pro')
+    if provider is None:
+        LLM_REQUESTS.inc(kind="explanation", outcome="no_key")
+        return _offline_explanation(parameter, value, unit, status, normal_range)
+
+    cache_key = make_key("explanation", provider.name, provider.model_name, parameter, status, value, unit, normal_range)
+    cached = explanation_cache.get(cache_key)
+    if cached is not None:
+        LLM_REQUESTS.inc(kind="explanation", outcome="cache_hit")
+        return cached
 
     user_prompt = f"""
     You are a helpful and reassuring medical assistant explaining lab test results to a patient. 
@@ -27,27 +101,66 @@ async def generate_explanation(parameter: str, value: float, unit: str, status:
     """
 
     try:
-        response = model.generate_content(user_prompt)
-        return response.text
+        # The model slot is only held while a request is out, not during
+        # rate-limit waits or retry delays
+        with timer("llm_explanation"):
+            explanation = await provider.generate(user_prompt, slot=llm_stage.slot)
+        explanation_cache.set(cache_key, explanation)
+        LLM_REQUESTS.inc(kind="explanation", outcome="ok")
+        return explanation
+    except StageBusy:
+        # No model slot came free in time, so answer without the model
+        LLM_REQUESTS.inc(kind="explanation", outcome="shed")
+        return _offline_explanation(parameter, value, unit, status, normal_range)
     except Exception as e:
-        print(f"Gemini Error: {e}")
+        print(f"LLM Error: {e}")
+        LLM_REQUESTS.inc(kind="explanation", outcome="error")
         return f"Unable to generate explanation at this time. ({parameter}: {value} {unit})"
 
+async def generate_explanations(parameters: list, concurrency: int = LLM_CONCURRENCY, on_result=None) -> list:
+    """
+    Generate explanations for all parameters of a report concurrently, with at
+    most `concurrency` requests in flight. Results are in the same order as
+    `parameters`. If given, `on_result(index, explanation)` is called as each
+    explanation finishes.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def explain(index, param):
+        async with semaphore:
+            explanation = await generate_explanation(
+                param['parameter'],
+                param['value'],
+                param['unit'],
+                param['status'],
+                param['reference_range_display']
+            )
+        if on_result is not None:
+            on_result(index, explanation)
+        return explanation
+
+    return await asyncio.gather(*(explain(index, param) for index, param in enumerate(parameters)))
+
 async def get_health_recommendations(abnormal_parameters: list) -> str:
     """
-    Generate overall health recommendations based on abnormal values using Google Gemini.
+    Generate overall health recommendations based on abnormal values with the configured model.
     """
     if not abnormal_parameters:
         return "All your results appear to be within the normal range. Keep up the good work maintaining a healthy lifestyle!"
 
-    api_key = os.getenv("GEMINI_API_KEY")
+    provider = await get_provider()
 
-    if not api_key:
-        items = ", ".join([f"{p['parameter']} ({p['status']})" for p in abnormal_parameters])
-        return f"We noticed some values outside the normal range: {items}. It is recommended to discuss these results with your healthcare provider."
+    if provider is None:
+        LLM_REQUESTS.inc(kind="recommendations", outcome="no_key")
+        return _offline_recommendations(abnormal_parameters)
 
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-pro')
+    cache_key = make_key("recommendations", provider.name, provider.model_name, sorted(
+        (p['parameter'], p['status'], p['value'], p['unit']) for p in abnormal_parameters
+    ))
+    cached = explanation_cache.get(cache_key)
+    if cached is not None:
+        LLM_REQUESTS.inc(kind="recommendations", outcome="cache_hit")
+        return cached
 
     params_desc = "\n".join([f"- {p['parameter']}: {p['value']} {p['unit']} ({p['status']})" for p in abnormal_parameters])
 
@@ -62,8 +175,15 @@ async def get_health_recommendations(abnormal_parameters: list) -> str:
     """
 
     try:
-        response = model.generate_content(user_prompt)
-        return response.text
+        with timer("llm_recommendations"):
+            recommendations = await provider.generate(user_prompt, slot=llm_stage.slot)
+        explanation_cache.set(cache_key, recommendations)
+        LLM_REQUESTS.inc(kind="recommendations", outcome="ok")
+        return recommendations
+    except StageBusy:
+        LLM_REQUESTS.inc(kind="recommendations", outcome="shed")
+        return _offline_recommendations(abnormal_parameters)
     except Exception as e:
-        print(f"Gemini Recommendation Error: {e}")
+        print(f"LLM Recommendation Error: {e}")
+        LLM_REQUESTS.inc(kind="recommendations", outcome="error")
         return "Unable to generate specific recommendations at this time. Please show this report to your doctor."
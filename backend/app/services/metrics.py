@@ -0,0 +1,236 @@
+import os
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+METRICS_BUCKETS = tuple(sorted(
+    float(bound) for bound in os.getenv("METRICS_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120").split(",")
+))
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """
+    Monotonic counter with optional labels, e.g. counter.inc(outcome="ok").
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(name, "") for name in self.labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labels, key)} {value:g}" for key, value in items]
+
+class Histogram:
+    """
+    Cumulative histogram with optional labels, in the Prometheus layout.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = METRICS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # key -> [per-bucket counts, sum, count]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(tuple(labels.get(name, "") for name in self.labels))
+        return entry[2] if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+class Gauge:
+    """
+    Gauge read from a callback when the metrics are rendered.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {self.read():g}"]
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "meditrend_stage_duration_seconds", "Time spent in each stage of the document pipeline.", ("stage",)
+))
+STAGE_ERRORS = registry.register(Counter(
+    "meditrend_stage_errors_total", "Pipeline stages that ended with an exception.", ("stage",)
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    "meditrend_request_duration_seconds", "Time until the response headers were sent, per route.", ("method", "route", "status")
+))
+LLM_REQUESTS = registry.register(Counter(
+    "meditrend_llm_requests_total", "Explanation and recommendation lookups by outcome.", ("kind", "outcome")
+))
+
+# Stage timings of the request being served, for the Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+# Set while a document worker runs, so its timings travel back with the result
+_captured_timings = contextvars.ContextVar("captured_timings", default=None)
+
+def record_stage(stage: str, seconds: float, error: bool = False):
+    captured = _captured_timings.get()
+    if captured is not None:
+        captured.append((stage, seconds, error))
+        return
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    if error:
+        STAGE_ERRORS.inc(stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+@contextmanager
+def timer(stage: str):
+    """
+    Times the enclosed block as one observation of `stage`.
+    """
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - start, error)
+
+def timed(stage: str):
+    """
+    Decorator form of timer(), for plain and async functions.
+    """
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timer(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def run_captured(submitted_at: float, fn, *args):
+    """
+    Runs fn(*args) in a document worker and returns (result, timings). Stages
+    timed in a worker process would otherwise be recorded in that process's
+    registry and never show up on /metrics. The time the document waited for
+    a free worker is recorded as the "document_queue" stage.
+    """
+    captured = [("document_queue", max(0.0, time.time() - submitted_at), False)]
+    token = _captured_timings.set(captured)
+    try:
+        return fn(*args), captured
+    finally:
+        _captured_timings.reset(token)
+
+def record_captured(timings: list):
+    for stage, seconds, error in timings:
+        record_stage(stage, seconds, error)
+
+def start_request() -> list:
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+def server_timing(timings: list, total: Optional[float] = None) -> str:
+    """
+    Server-Timing header value, with repeated stages (e.g. one per OCR'd page)
+    added up. Durations are in milliseconds.
+    """
+    totals: Dict[str, float] = {}
+    counts: Dict[str, int] = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+        counts[stage] = counts.get(stage, 0) + 1
+    entries = [
+        f'{stage};dur={seconds * 1000:.1f}' + (f';desc="{counts[stage]}x"' if counts[stage] > 1 else "")
+        for stage, seconds in totals.items()
+    ]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
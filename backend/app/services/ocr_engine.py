@@ -0,0 +1,137 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+try:
+    import tesserocr
+except ImportError:  # optional, needs libtesseract
+    tesserocr = None
+
+# "auto" uses the tesserocr bindings when they are installed and can load the
+# language data, and otherwise runs the tesseract command through pytesseract.
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto").lower()
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+# Directory with the .traineddata files, if not tesserocr's built-in default.
+TESSDATA_PREFIX = os.getenv("TESSDATA_PREFIX", "")
+
+# Tesseract instances of the current thread, one per (psm, variables). Each
+# OCR thread loads the language data once and reuses it for every page.
+_local = threading.local()
+_engine: Optional[str] = None
+# Why "auto" did not pick tesserocr, if it was installed
+_fallback_reason: Optional[str] = None
+_engine_lock = threading.Lock()
+_pools: Dict[int, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+def tesseract_config(psm: int, variables: Optional[dict] = None) -> str:
+    """
+    Command-line config for pytesseract equivalent to `psm` and `variables`.
+    The OCR engine mode is left to Tesseract, so language data that only
+    has the legacy engine still works.
+    """
+    return f"--psm {psm}" + "".join(f" -c {name}={value}" for name, value in (variables or {}).items())
+
+def _create_api(psm: int, variables: dict):
+    kwargs = {"path": TESSDATA_PREFIX} if TESSDATA_PREFIX else {}
+    api = tesserocr.PyTessBaseAPI(lang=OCR_LANG, psm=psm, oem=tesserocr.OEM.LSTM_ONLY, **kwargs)
+    for name, value in variables.items():
+        api.SetVariable(name, str(value))
+    return api
+
+def _get_api(psm: int, variables: dict):
+    apis = getattr(_local, "apis", None)
+    if apis is None:
+        apis = _local.apis = {}
+    key = (psm, tuple(sorted(variables.items())))
+    api = apis.get(key)
+    if api is None:
+        api = apis[key] = _create_api(psm, variables)
+    return api
+
+def engine() -> str:
+    """
+    The OCR engine in use in this process, "tesserocr" or "pytesseract".
+    """
+    global _engine, _fallback_reason
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = "pytesseract"
+                if OCR_ENGINE != "pytesseract" and tesserocr is not None:
+                    try:
+                        _get_api(3, {})
+                        _engine = "tesserocr"
+                    except RuntimeError as e:
+                        # Usually missing language data
+                        if OCR_ENGINE == "tesserocr":
+                            raise
+                        _fallback_reason = f"tesserocr unavailable ({e})"
+                elif OCR_ENGINE == "tesserocr":
+                    raise RuntimeError("OCR_ENGINE=tesserocr but tesserocr is not installed")
+    return _engine
+
+def fallback_reason() -> Optional[str]:
+    """
+    Why pytesseract is used although tesserocr is installed, or None.
+    Reported by the warm-up rather than on whichever page is OCR'd first.
+    """
+    engine()
+    return _fallback_reason
+
+def ocr_image(image, psm: int = 3, variables: Optional[dict] = None) -> str:
+    """
+    Text of a PIL image. With tesserocr the thread's resident Tesseract
+    instance is reused; pytesseract starts a tesseract process per call.
+    """
+    variables = variables or {}
+    if engine() == "tesserocr":
+        api = _get_api(psm, variables)
+        try:
+            api.SetImage(image)
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+    # pytesseract imports pandas, so it is only loaded when it is used
+    import pytesseract
+
+    return pytesseract.image_to_string(image, lang=OCR_LANG, config=tesseract_config(psm, variables))
+
+def page_pool(threads: int) -> ThreadPoolExecutor:
+    """
+    Long-lived pool of OCR threads for this process. Pages are queued to it,
+    and its threads keep their Tesseract instances between documents.
+    """
+    threads = max(1, threads)
+    with _pools_lock:
+        pool = _pools.get(threads)
+        if pool is None:
+            pool = _pools[threads] = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="ocr")
+        return pool
+
+def warm_thread(psm: int = 3, variables: Optional[dict] = None) -> None:
+    """
+    Loads the calling thread's Tesseract instance for these settings, so its
+    first page does not wait for the language data. Nothing to load with
+    pytesseract.
+    """
+    if engine() == "tesserocr":
+        _get_api(psm, variables or {})
+
+def warm_pool(threads: int, psm: int = 3, variables: Optional[dict] = None, timeout: float = 60) -> None:
+    """
+    Runs warm_thread() in every thread of page_pool(threads). Each call waits
+    for the others, so no thread can take two of them.
+    """
+    if engine() != "tesserocr":
+        return
+    threads = max(1, threads)
+    barrier = threading.Barrier(threads)
+
+    def load():
+        warm_thread(psm, variables)
+        barrier.wait(timeout)
+
+    for future in [page_pool(threads).submit(load) for _ in range(threads)]:
+        future.result()
@@ -1,53 +1,267 @@
-import pdfplumber
-import pytesseract
-from pdf2image import convert_from_path
+import io
 import os
+import asyncio
+import tempfile
+import contextvars
+from bisect import bisect_right
+from contextlib import contextmanager
+from typing import Optional, Union
 from fastapi import UploadFile
+from app.services.admission import ocr_stage, pdf_stage
+from app.services.data_extractor import TABLE_CELL_SEPARATOR
+from app.services.document_executor import document_executor
+from app.services.metrics import timer
+from app.services.ocr_engine import ocr_image, page_pool
 
-async def parse_pdf(file_path: str) -> str:
+# OCR fallback settings. Pages are rendered OCR_CHUNK_PAGES at a time so only
+# one chunk of page images is held in memory, and each chunk is OCR'd by
+# OCR_THREADS threads of the worker's resident OCR pool in parallel.
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "true").lower() == "true"
+OCR_THREADS = int(os.getenv("OCR_THREADS", "2"))
+OCR_CHUNK_PAGES = int(os.getenv("OCR_CHUNK_PAGES", str(OCR_THREADS * 2)))
+
+# Pages with fewer characters than this in their text layer are treated as
+# scanned and OCR'd.
+MIN_PAGE_TEXT_CHARS = int(os.getenv("MIN_PAGE_TEXT_CHARS", "20"))
+# PDFs with more pages are rejected before any page is read.
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "50"))
+
+# Parallelism comes from running several pages at once, so keep each
+# Tesseract process single-threaded instead of oversubscribing the CPU.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+class PageLimitExceeded(ValueError):
+    """Raised for PDFs with more than PDF_MAX_PAGES pages."""
+
+class PartialText(str):
     """
-    Extract text from a PDF file.
-    First tries pdfplumber for text-based PDFs.
-    If no text is found, falls back to OCR using pytesseract.
+    Text of a PDF whose scanned pages could not be OCR'd, i.e. only what its
+    text layer gave.
     """
-    text = ""
+
+def count_pdf_pages(source: Union[bytes, str]) -> Optional[int]:
+    """
+    Page count from the PDF's page tree, without reading any page. None if
+    the file cannot be read this way; the worker then checks it itself.
+    """
+    from PyPDF2 import PdfReader
+
     try:
-        # 1. Try pdfplumber
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                # Extract tables
-                tables = page.extract_tables()
-                if tables:
-                    for table in tables:
-                        for row in table:
-                            # Clean and join row data
-                            row_text = " ".join([str(cell) for cell in row if cell is not None])
-                            text += row_text + "\n"
-                
-                # Extract plain text
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        
-        # 2. If valid text extracted, return it
-        if len(text.strip()) > 50:  # Arbitrary threshold to ensure meaningful text
-            return text
-
-        # 3. Fallback to OCR if text is empty or too short
-        print("Falling back to OCR for PDF...")
-        # Note: pdf2image requires poppler to be installed on the system
-        try:
-             images = convert_from_path(file_path)
-             for i, image in enumerate(images):
-                 page_text = pytesseract.image_to_string(image)
-                 text += page_text + "\n"
-        except Exception as e:
-            print(f"OCR failed: {e}")
-            # Identify if poppler is missing or other issue
-            return f"Error: OCR failed. Please ensure Poppler is installed. Details: {e}"
+        return len(PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source).pages)
+    except Exception:
+        return None
+
+async def parse_pdf(source: Union[bytes, str]) -> str:
+    """
+    Extract text from a PDF (its bytes or a file path) in the document worker
+    pool, once the PDF stage has a free slot. PDFs over PDF_MAX_PAGES are
+    rejected with PageLimitExceeded before they take a slot.
+    """
+    pages = await asyncio.to_thread(count_pdf_pages, source)
+    if pages is not None and pages > PDF_MAX_PAGES:
+        raise PageLimitExceeded(f"PDF has {pages} pages; the limit is {PDF_MAX_PAGES}")
+    async with pdf_stage.slot():
+        page_texts, scanned_pages = await document_executor.run(read_text_layer, source)
+    if not scanned_pages:
+        return "".join(page_texts)
+    # Scanned pages cost as much as an image upload, so they share its limit
+    async with ocr_stage.slot():
+        return await document_executor.run(ocr_scanned_pages, source, page_texts, scanned_pages)
 
+def extract_pdf_text(source: Union[bytes, str]) -> str:
+    """
+    Extract text from a PDF, given as bytes or a file path, page by page.
+    Pages with a text layer are read with pdfplumber. Pages without one
+    (scanned pages) are OCR'd with pytesseract. The page texts are merged
+    in page order. Raises PageLimitExceeded for PDFs over PDF_MAX_PAGES.
+    """
+    page_texts, scanned_pages = read_text_layer(source)
+    if not scanned_pages:
+        return "".join(page_texts)
+    return ocr_scanned_pages(source, page_texts, scanned_pages)
+
+def read_text_layer(source: Union[bytes, str]):
+    """
+    Step 1 of extract_pdf_text: reads every page that has a text layer with
+    pdfplumber. Returns the page texts, with "" for scanned pages, and the
+    (1-based) numbers of the scanned pages. A PDF that cannot be read gives
+    no pages.
+    """
+    # Imported here so the API process only loads them if it parses itself
+    import pdfplumber
+
+    page_texts = []
+    scanned_pages = []
+    try:
+        with timer("pdf_text_layer"), pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source) as pdf:
+            if len(pdf.pages) > PDF_MAX_PAGES:
+                raise PageLimitExceeded(f"PDF has {len(pdf.pages)} pages; the limit is {PDF_MAX_PAGES}")
+            for number, page in enumerate(pdf.pages, start=1):
+                if len(page.chars) < MIN_PAGE_TEXT_CHARS:
+                    scanned_pages.append(number)
+                    page_texts.append("")
+                else:
+                    page_texts.append(_text_layer(page))
+    except PageLimitExceeded:
+        raise
     except Exception as e:
         print(f"Error parsing PDF: {e}")
-        return ""
+        return [], []
+    return page_texts, scanned_pages
+
+def ocr_scanned_pages(source: Union[bytes, str], page_texts: list, scanned_pages: list) -> str:
+    """
+    Step 2 of extract_pdf_text: OCRs only the pages without a text layer and
+    merges them with the text of the others. If the OCR fails, the text of
+    the others is returned as PartialText.
+    """
+    page_texts = list(page_texts)
+    print(f"Falling back to OCR for {len(scanned_pages)} of {len(page_texts)} PDF page(s)...")
+    # Note: pdf2image requires poppler to be installed on the system
+    try:
+        with _as_path(source) as file_path:
+            for number, page_text in zip(scanned_pages, ocr_pdf_pages(file_path, scanned_pages)):
+                page_texts[number - 1] = page_text + "\n"
+    except Exception as e:
+        print(f"OCR failed: {e}")
+        text = "".join(page_texts)
+        if len(text.strip()) > 50:  # Keep what the text layer gave us
+            return PartialText(text)
+        # Identify if poppler is missing or other issue
+        return f"Error: OCR failed. Please ensure Poppler is installed. Details: {e}"
+    return "".join(page_texts)
 
+@contextmanager
+def _as_path(source: Union[bytes, str]):
+    """
+    Poppler can only render files, so in-memory PDFs are written to a
+    temporary file for as long as the OCR fallback needs them.
+    """
+    if not isinstance(source, bytes):
+        yield source
+        return
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        tmp.write(source)
+        tmp.flush()
+        yield tmp.name
+
+def _text_layer(page) -> str:
+    """
+    Text of a single page from its text layer: table rows first, one line
+    per row with the cells separated by TABLE_CELL_SEPARATOR so the
+    extractor can read them cell by cell, then the plain text of the rest of
+    the page. Text inside the tables is not repeated in the plain text.
+    """
+    tables = page.find_tables()
+    if not tables:
+        page_text = page.extract_text()
+        return page_text + "\n" if page_text else ""
+
+    from pdfplumber.utils import extract_text
+
+    text = ""
+    grids, free_chars = _split_chars(tables, page.chars)
+    for rows in grids:
+        for row in rows:
+            cells = [_clean_cell(chars) for _, chars in row]
+            if any(cells):
+                text += TABLE_CELL_SEPARATOR.join(cells) + "\n"
+
+    # Extract plain text
+    page_text = extract_text(free_chars)
+    if page_text:
+        text += page_text + "\n"
     return text
+
+def _split_chars(tables: list, chars: list):
+    """
+    Sorts a page's characters into the cells of its tables in a single pass
+    (pdfplumber's Table.extract() scans every character once per row and
+    cell). Returns, per table, its rows as lists of (cell bbox, chars), and
+    the characters that are in no cell.
+    """
+    grids = []
+    for table in tables:
+        rows = [[(cell, []) for cell in row.cells] for row in table.rows]
+        tops = [next(cell for cell in row.cells if cell)[1] for row in table.rows]
+        grids.append((table.bbox, tops, rows))
+
+    free_chars = []
+    for char in chars:
+        x = (char["x0"] + char["x1"]) / 2
+        y = (char["top"] + char["bottom"]) / 2
+        for (x0, top, x1, bottom), tops, rows in grids:
+            if x0 <= x < x1 and top <= y < bottom:
+                # Cells start at or above the character; a merged cell may
+                # start rows above it
+                for index in range(bisect_right(tops, y) - 1, -1, -1):
+                    cell = next((cell for cell in rows[index] if cell[0] and _contains(cell[0], x, y)), None)
+                    if cell:
+                        cell[1].append(char)
+                        break
+                else:
+                    # Inside the table but in no cell, e.g. a caption over
+                    # its first ruled line; kept as free text
+                    free_chars.append(char)
+                break
+        else:
+            free_chars.append(char)
+    return [rows for _, _, rows in grids], free_chars
+
+def _contains(bbox: tuple, x: float, y: float) -> bool:
+    x0, top, x1, bottom = bbox
+    return x0 <= x < x1 and top <= y < bottom
+
+def _clean_cell(chars: list) -> str:
+    from pdfplumber.utils import extract_text
+
+    text = extract_text(chars) if chars else ""
+    return " ".join(text.replace(TABLE_CELL_SEPARATOR, " ").split())
+
+def _page_chunks(pages: list, chunk_pages: int):
+    """
+    Splits sorted page numbers into runs of consecutive pages no longer than
+    `chunk_pages`, so each run can be rendered with a single pdf2image call.
+    """
+    chunk = []
+    for number in pages:
+        if chunk and (number != chunk[-1] + 1 or len(chunk) >= chunk_pages):
+            yield chunk
+            chunk = []
+        chunk.append(number)
+    if chunk:
+        yield chunk
+
+def ocr_pdf_pages(file_path: str, pages: list, dpi: int = OCR_DPI,
+                  chunk_pages: int = OCR_CHUNK_PAGES, threads: int = OCR_THREADS):
+    """
+    OCR the given (1-based) pages of a PDF. Yields the text of each page in
+    page order while holding at most `chunk_pages` rendered pages in memory.
+    Pages are queued to the process's long-lived OCR threads, which keep
+    Tesseract loaded between pages and documents.
+    """
+    from pdf2image import convert_from_path
+
+    chunk_pages = max(1, chunk_pages)
+    pool = page_pool(threads)
+    for chunk in _page_chunks(sorted(pages), chunk_pages):
+        with timer("pdf_render"):
+            images = convert_from_path(
+                file_path,
+                dpi=dpi,
+                first_page=chunk[0],
+                last_page=chunk[-1],
+                grayscale=OCR_GRAYSCALE,
+                thread_count=max(1, min(threads, len(chunk)))
+            )
+        # Each page runs in a copy of the current context so its timing is
+        # captured with the rest of the document's
+        futures = [pool.submit(contextvars.copy_context().run, _ocr_page, image) for image in images]
+        for future in futures:
+            yield future.result()
+        del images, futures
+
+def _ocr_page(image) -> str:
+    with timer("ocr_page"):
+        return ocr_image(image)
@@ -0,0 +1,208 @@
+import math
+import re
+from bisect import bisect_right
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from app.models.parameter import ReferenceRange
+
+SEXES = ('female', 'male')
+
+class Variant(NamedTuple):
+    """
+    A range that replaces the default of `patterns` for one sex (None:
+    either) and/or ages min_age <= age < max_age, in the unit of `patterns`.
+    """
+    normal_range: Tuple[float, float]
+    sex: Optional[str] = None
+    min_age: Optional[float] = None
+    max_age: Optional[float] = None
+    optimal_from: Optional[float] = None
+
+# Tests where high values are good: at or above this value the status is
+# "optimal", and there is no "high".
+OPTIMAL_FROM = {
+    'HDL Cholesterol': 60,
+}
+
+# Sex- and age-specific ranges. The most specific variant that applies wins:
+# one for both the sex and the age, then an age band of either sex, then one
+# for the sex at any age, so giving a child's sex never switches them from
+# their age band to the adult range for that sex.
+VARIANTS = {
+    'Hemoglobin': [
+        Variant((12.0, 15.5), sex='female'),
+        Variant((13.5, 17.5), sex='male'),
+        Variant((11.0, 15.5), max_age=18),
+    ],
+    'HDL Cholesterol': [
+        Variant((50, 100), sex='female', optimal_from=60),
+    ],
+    'Serum Creatinine': [
+        Variant((0.5, 1.1), sex='female'),
+        Variant((0.7, 1.3), sex='male'),
+        Variant((0.3, 0.9), max_age=18),
+    ],
+    'Uric Acid': [
+        Variant((2.6, 6.0), sex='female'),
+        Variant((3.5, 7.2), sex='male'),
+    ],
+    'Alkaline Phosphatase': [
+        Variant((100, 390), max_age=18),
+    ],
+}
+
+# Factors that convert a value in another unit to the unit of `patterns`.
+UNIT_FACTORS = {
+    'Glucose Fasting': {'mmol/L': 18.016},
+    'Total Cholesterol': {'mmol/L': 38.67},
+    'HDL Cholesterol': {'mmol/L': 38.67},
+    'LDL Cholesterol': {'mmol/L': 38.67},
+    'Triglycerides': {'mmol/L': 88.57},
+    'TSH': {'uIU/mL': 1.0},
+    'Hemoglobin': {'g/L': 0.1, 'mmol/L': 1.611},
+    'WBC': {'10^9/L': 1.0, '10^3/uL': 1.0},
+    'Platelets': {'10^9/L': 1.0, '10^3/uL': 1.0},
+    'Serum Creatinine': {'umol/L': 1 / 88.42},
+    'BUN': {'mmol/L': 2.801},
+    'Uric Acid': {'umol/L': 1 / 59.48},
+    'AST (SGOT)': {'IU/L': 1.0},
+    'ALT (SGPT)': {'IU/L': 1.0},
+    'Alkaline Phosphatase': {'IU/L': 1.0},
+    'Total Bilirubin': {'umol/L': 1 / 17.1},
+    'Vitamin D': {'nmol/L': 1 / 2.496},
+    'Vitamin B12': {'pmol/L': 1.355},
+    'Sodium': {'mEq/L': 1.0},
+    'Potassium': {'mEq/L': 1.0},
+    'Calcium': {'mmol/L': 4.008},
+}
+
+def unit_key(unit: str) -> str:
+    """
+    A unit as written on a report, normalised for lookup: "µmol/l",
+    "umol/L" and "x10^9/L" match their entries in UNIT_FACTORS.
+    """
+    key = re.sub(r'\s+', '', unit).replace('µ', 'u').replace('μ', 'u').replace('×', 'x').lower()
+    return key[1:] if key.startswith('x10') else key
+
+def compile_range(normal_range: Tuple[float, float], unit: str, optimal_from: Optional[float] = None,
+                  printed: bool = False) -> ReferenceRange:
+    """
+    Breakpoints for bisect_right: values below the range are "low", values
+    up to and including its upper end "normal", and anything above "high",
+    or "optimal" from `optimal_from` on.
+    """
+    low, high = normal_range
+    if optimal_from is not None:
+        breakpoints, labels = (low, optimal_from), ('low', 'normal', 'optimal')
+    else:
+        # The next float above `high`, so that `high` itself is normal
+        breakpoints, labels = (low, math.nextafter(high, math.inf)), ('low', 'normal', 'high')
+    return ReferenceRange(breakpoints, labels, normal_range, f"{low} - {high} {unit}", printed)
+
+class ReferenceTable(NamedTuple):
+    """
+    The ranges of one test for one sex: `default` when the age is unknown,
+    otherwise by_age[bisect_right(age_starts, age) - 1].
+    """
+    default: ReferenceRange
+    age_starts: Tuple[float, ...]
+    by_age: Tuple[ReferenceRange, ...]
+
+    def lookup(self, age: Optional[float] = None) -> ReferenceRange:
+        if age is None:
+            return self.default
+        return self.by_age[max(0, bisect_right(self.age_starts, age) - 1)]
+
+def _specificity(variant: Variant) -> int:
+    return (1 if variant.sex else 0) + (2 if variant.min_age is not None or variant.max_age is not None else 0)
+
+def _covers(variant: Variant, age: float) -> bool:
+    return (variant.min_age is None or age >= variant.min_age) and (variant.max_age is None or age < variant.max_age)
+
+class ReferenceRanges:
+    """
+    Every range of every test, compiled into lookup tables when the app
+    starts: a dict lookup for the test and sex, a bisect on the age and a
+    bisect on the value, however many tests and variants there are.
+    """
+
+    def __init__(self, patterns: dict, variants: Dict[str, List[Variant]] = VARIANTS,
+                 unit_factors: Dict[str, Dict[str, float]] = UNIT_FACTORS, optimal_from: Dict[str, float] = OPTIMAL_FROM):
+        self.tables: Dict[str, Dict[Optional[str], ReferenceTable]] = {}
+        self.unit_factors: Dict[str, Dict[str, float]] = {}
+        for name, config in patterns.items():
+            unit = config['unit']
+            default = Variant(tuple(config['range']), optimal_from=optimal_from.get(name))
+            self.tables[name] = {
+                sex: self._compile_table(default, [v for v in variants.get(name, []) if v.sex in (None, sex)], unit)
+                for sex in (None,) + SEXES
+            }
+            factors = {unit_key(other): factor for other, factor in unit_factors.get(name, {}).items()}
+            factors[unit_key(unit)] = 1.0
+            self.unit_factors[name] = factors
+
+    @staticmethod
+    def _compile_table(default: Variant, variants: List[Variant], unit: str) -> ReferenceTable:
+        compiled = {}
+
+        def range_of(variant: Variant) -> ReferenceRange:
+            if variant not in compiled:
+                compiled[variant] = compile_range(variant.normal_range, unit, variant.optimal_from)
+            return compiled[variant]
+
+        def best(candidates: List[Variant]) -> Variant:
+            return max(candidates, key=_specificity, default=default)
+
+        any_age = best([v for v in variants if v.min_age is None and v.max_age is None])
+        # Age bands start at every age where some variant starts or stops
+        starts = sorted({0.0} | {float(age) for v in variants for age in (v.min_age, v.max_age) if age is not None})
+        by_age = [range_of(best([v for v in variants if _covers(v, start)] or [any_age])) for start in starts]
+        return ReferenceTable(range_of(any_age), tuple(starts), tuple(by_age))
+
+    def reference(self, name: str, sex: Optional[str] = None, age: Optional[float] = None) -> Optional[ReferenceRange]:
+        """
+        The range a result of test `name` is judged against, or None for
+        unknown tests. An unknown sex uses the ranges for either sex.
+        """
+        tables = self.tables.get(name)
+        if tables is None:
+            return None
+        return (tables.get(sex) or tables[None]).lookup(age)
+
+    def classify(self, name: str, value: float, sex: Optional[str] = None, age: Optional[float] = None) -> Optional[str]:
+        reference = self.reference(name, sex, age)
+        return reference.classify(value) if reference else None
+
+    def to_canonical(self, name: str, value: float, unit: str) -> float:
+        """
+        A value reported in `unit` converted to the unit of `patterns`. Values
+        in units without a known factor are returned unchanged.
+        """
+        factor = self.unit_factors.get(name, {}).get(unit_key(unit)) if unit else None
+        if factor is None or factor == 1.0:
+            return value
+        return round(value * factor, 2)
+
+    def classify_matrix(self, names: Sequence[str], values, sex: Optional[str] = None, age: Optional[float] = None):
+        """
+        Statuses of a whole parameter x report matrix at once, the vectorized
+        bisect_right of ReferenceRange.classify. Returns (statuses, known):
+        an object array shaped like `values` and a boolean array per row that
+        is False for tests without a range, whose statuses are None.
+        """
+        import numpy as np
+
+        references = [self.reference(name, sex, age) for name in names]
+        known = np.array([reference is not None for reference in references], dtype=bool)
+        width = max((len(r.breakpoints) for r in references if r), default=0)
+        breakpoints = np.full((len(references), width), np.inf)
+        labels = np.full((len(references), width + 1), None, dtype=object)
+        for row, reference in enumerate(references):
+            if reference:
+                breakpoints[row, :len(reference.breakpoints)] = reference.breakpoints
+                labels[row, :len(reference.labels)] = reference.labels
+
+        values = np.asarray(values, dtype=float)
+        # Number of breakpoints at or below each value, i.e. bisect_right
+        positions = (values[:, :, None] >= breakpoints[:, None, :]).sum(axis=2)
+        statuses = np.take_along_axis(labels, positions, axis=1)
+        return statuses, known
@@ -0,0 +1,242 @@
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+from app.models.parameter import ParameterResult
+
+# SQLite file that keeps extracted parameters per patient. History endpoints
+# are disabled when unset.
+REPORT_STORE_DB = os.getenv("REPORT_STORE_DB", "")
+
+# Slopes are stored as running least-squares sums over years since this date
+_EPOCH = date(2000, 1, 1)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    report_date TEXT NOT NULL,
+    document_hash TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS reports_patient_document ON reports (patient_id, document_hash);
+CREATE INDEX IF NOT EXISTS reports_patient_date ON reports (patient_id, report_date);
+
+CREATE TABLE IF NOT EXISTS results (
+    report_id INTEGER NOT NULL REFERENCES reports (id) ON DELETE CASCADE,
+    parameter TEXT NOT NULL,
+    value REAL NOT NULL,
+    unit TEXT NOT NULL,
+    status TEXT NOT NULL,
+    category TEXT
+);
+CREATE INDEX IF NOT EXISTS results_report ON results (report_id);
+
+CREATE TABLE IF NOT EXISTS parameter_aggregates (
+    patient_id TEXT NOT NULL,
+    parameter TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    sum_x REAL NOT NULL,
+    sum_y REAL NOT NULL,
+    sum_xx REAL NOT NULL,
+    sum_xy REAL NOT NULL,
+    min_value REAL NOT NULL,
+    max_value REAL NOT NULL,
+    abnormal_count INTEGER NOT NULL,
+    first_date TEXT NOT NULL,
+    first_value REAL NOT NULL,
+    latest_date TEXT NOT NULL,
+    latest_value REAL NOT NULL,
+    latest_status TEXT NOT NULL,
+    PRIMARY KEY (patient_id, parameter, unit)
+);
+"""
+
+# Folds one new measurement into the running aggregates of its parameter and
+# unit, so values in different units are never mixed. Column names on the
+# right-hand side refer to the row as it was before the update.
+UPSERT_AGGREGATE = """
+INSERT INTO parameter_aggregates (patient_id, parameter, unit, n, sum_x, sum_y, sum_xx, sum_xy, min_value, max_value,
+                                  abnormal_count, first_date, first_value, latest_date, latest_value, latest_status)
+VALUES (:patient_id, :parameter, :unit, 1, :x, :y, :x * :x, :x * :y, :y, :y,
+        :abnormal, :date, :y, :date, :y, :status)
+ON CONFLICT (patient_id, parameter, unit) DO UPDATE SET
+    n = n + 1,
+    sum_x = sum_x + excluded.sum_x,
+    sum_y = sum_y + excluded.sum_y,
+    sum_xx = sum_xx + excluded.sum_xx,
+    sum_xy = sum_xy + excluded.sum_xy,
+    min_value = min(min_value, excluded.min_value),
+    max_value = max(max_value, excluded.max_value),
+    abnormal_count = abnormal_count + excluded.abnormal_count,
+    first_value = CASE WHEN excluded.first_date < first_date THEN excluded.first_value ELSE first_value END,
+    first_date = min(first_date, excluded.first_date),
+    latest_value = CASE WHEN excluded.latest_date >= latest_date THEN excluded.latest_value ELSE latest_value END,
+    latest_status = CASE WHEN excluded.latest_date >= latest_date THEN excluded.latest_status ELSE latest_status END,
+    latest_date = max(latest_date, excluded.latest_date)
+"""
+
+def _aggregate_row(patient_id: str, report_date: str, parameter: str, value: float, unit: str, status: str) -> dict:
+    x = (date.fromisoformat(report_date) - _EPOCH).days / 365.25
+    return {
+        "patient_id": patient_id,
+        "parameter": parameter,
+        "unit": unit,
+        "x": x,
+        "y": value,
+        "abnormal": int(status in ('low', 'high')),
+        "date": report_date,
+        "status": status,
+    }
+
+class ReportStore:
+    """
+    Keeps the parameters extracted from each report per patient and report
+    date, so trends can be computed from stored history instead of
+    re-uploading and re-parsing old documents. Per-parameter aggregates are
+    updated as each report is added.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            self._conn.executescript(SCHEMA)
+            self._migrate_aggregates()
+
+    def _migrate_aggregates(self):
+        """
+        Stores made before aggregates were kept per unit have an `aggregates`
+        table keyed by parameter only. It is rebuilt from the stored results.
+        """
+        if not self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'aggregates'").fetchone():
+            return
+        rows = self._conn.execute(
+            """
+            SELECT r.patient_id, r.report_date, s.parameter, s.value, s.unit, s.status
+            FROM results s JOIN reports r ON r.id = s.report_id
+            ORDER BY r.report_date, r.id
+            """
+        ).fetchall()
+        self._conn.executemany(UPSERT_AGGREGATE, [
+            _aggregate_row(row["patient_id"], row["report_date"], row["parameter"], row["value"], row["unit"], row["status"])
+            for row in rows
+        ])
+        self._conn.execute("DROP TABLE aggregates")
+
+    def add_report(self, patient_id: str, filename: str, parameters: List[ParameterResult],
+                   report_date: Optional[str] = None, document_hash: Optional[str] = None):
+        """
+        Stores a report and folds its ParameterResults into the patient's
+        aggregates. Reports without a date are filed under today's date.
+        Returns (report_id, created); a document already stored for this
+        patient is not added twice.
+        """
+        report_date = report_date or date.today().isoformat()
+
+        with self._lock, self._conn:
+            if document_hash:
+                existing = self._conn.execute(
+                    "SELECT id FROM reports WHERE patient_id = ? AND document_hash = ?", (patient_id, document_hash)
+                ).fetchone()
+                if existing:
+                    return existing["id"], False
+
+            report_id = self._conn.execute(
+                "INSERT INTO reports (patient_id, filename, report_date, document_hash, created_at) VALUES (?, ?, ?, ?, ?)",
+                (patient_id, filename, report_date, document_hash, datetime.now(timezone.utc).isoformat(timespec="seconds"))
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO results (report_id, parameter, value, unit, status, category) VALUES (?, ?, ?, ?, ?, ?)",
+                [(report_id, p.parameter, p.value, p.unit, p.status, p.category) for p in parameters]
+            )
+            self._conn.executemany(UPSERT_AGGREGATE, [
+                _aggregate_row(patient_id, report_date, p.parameter, p.value, p.unit, p.status) for p in parameters
+            ])
+        return report_id, True
+
+    def get_reports(self, patient_id: str) -> List[Dict]:
+        """
+        Returns the patient's stored reports in date order, in the same shape
+        analyze_trends takes.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT r.id, r.filename, r.report_date, s.parameter, s.value, s.unit, s.status, s.category
+                FROM reports r LEFT JOIN results s ON s.report_id = r.id
+                WHERE r.patient_id = ?
+                ORDER BY r.report_date, r.id
+                """,
+                (patient_id,)
+            ).fetchall()
+
+        reports = {}
+        for row in rows:
+            report = reports.setdefault(row["id"], {
+                "id": row["id"],
+                "filename": row["filename"],
+                "date": row["report_date"],
+                "parameters": []
+            })
+            if row["parameter"] is not None:
+                report["parameters"].append({
+                    "parameter": row["parameter"],
+                    "value": row["value"],
+                    "unit": row["unit"],
+                    "status": row["status"],
+                    "category": row["category"]
+                })
+        return list(reports.values())
+
+    def get_aggregates(self, patient_id: str) -> Dict:
+        """
+        Per-parameter summary of the patient's history, read straight from the
+        running aggregates. A parameter stored in more than one unit is
+        summarised in the unit of its latest result, and the other units are
+        under "other_units".
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM parameter_aggregates WHERE patient_id = ? ORDER BY parameter, latest_date DESC",
+                (patient_id,)
+            ).fetchall()
+
+        aggregates = {}
+        for row in rows:
+            n = row["n"]
+            denominator = n * row["sum_xx"] - row["sum_x"] ** 2
+            slope = (n * row["sum_xy"] - row["sum_x"] * row["sum_y"]) / denominator if n >= 2 and denominator > 1e-12 else None
+            aggregate = {
+                "unit": row["unit"],
+                "count": n,
+                "mean": round(row["sum_y"] / n, 4),
+                "min": row["min_value"],
+                "max": row["max_value"],
+                "abnormal_count": row["abnormal_count"],
+                "first_date": row["first_date"],
+                "first_value": row["first_value"],
+                "latest_date": row["latest_date"],
+                "latest_value": row["latest_value"],
+                "latest_status": row["latest_status"],
+                "slope_per_year": round(slope, 4) if slope is not None else None
+            }
+            if row["parameter"] in aggregates:
+                aggregates[row["parameter"]].setdefault("other_units", {})[row["unit"]] = aggregate
+            else:
+                aggregates[row["parameter"]] = aggregate
+        return aggregates
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+report_store = ReportStore(REPORT_STORE_DB) if REPORT_STORE_DB else None
@@ -1,65 +1,175 @@
-from datetime import datetime
-from typing import List, Dict
+import os
+import math
+from typing import List, Dict, Optional
+from app.models.parameter import ParameterResult
+from app.services.data_extractor import reference_ranges
+from app.services.metrics import timed
 
-async def analyze_trends(reports_data: List[Dict]) -> Dict:
+# Number of consecutive reports averaged for the rolling mean of each series.
+TREND_ROLLING_WINDOW = int(os.getenv("TREND_ROLLING_WINDOW", "3"))
+
+# Statuses that count towards an out-of-range streak
+ABNORMAL_STATUSES = ('low', 'high')
+
+def _dates_in_order(reports_data: List[Dict]) -> "pd.Series":
+    """
+    Parsed report dates sorted chronologically, indexed by report position.
+    Reports without a date keep their upload order and come after the dated
+    ones.
+    """
+    import pandas as pd
+
+    dates = pd.to_datetime(pd.Series([report.get('date') for report in reports_data], dtype=object), errors='coerce')
+    return dates.sort_values(kind='stable', na_position='last')
+
+def _measurement(param) -> tuple:
+    """
+    (parameter, value, unit, status) of an extracted ParameterResult or of a
+    result dict from the report store.
+    """
+    if isinstance(param, ParameterResult):
+        return param.analyte.name, param.value, param.analyte.unit, param.status
+    return param['parameter'], param['value'], param['unit'], param['status']
+
+def _to_float(value):
+    return None if value is None or math.isnan(value) else round(float(value), 4)
+
+@timed("trend_analysis")
+async def analyze_trends(reports_data: List[Dict], sex: Optional[str] = None, age: Optional[float] = None) -> Dict:
     """
     Analyze trends across multiple medical reports.
-    
+
     Args:
-        reports_data: List of dictionaries, each containing 'filename', 'date' (optional), and 'parameters'.
-    
+        reports_data: List of dictionaries, each containing 'filename', 'date' (optional), and 'parameters'
+            (ParameterResults or result dicts).
+        sex, age: Optional demographics. Every value is judged against the reference ranges for them, or
+            the default ranges when they are not given.
+
     Returns:
         Dictionary containing trend analysis, common parameters, and change direction.
     """
     if not reports_data:
         return {}
 
-    # 1. Identify all unique parameters across reports
-    all_params = set()
-    for report in reports_data:
-        for param in report.get('parameters', []):
-            all_params.add(param['parameter'])
-            
+    # Loaded on first use (or by the startup warm-up), not at import
+    import numpy as np
+    import pandas as pd
+
+    # 1. Flatten every report into one long table and pivot it once into a
+    #    parameter x report matrix, with reports in date order.
+    dates = _dates_in_order(reports_data)
+    order = list(dates.index)
+    rows = [
+        (column, *_measurement(param))
+        for column, report_index in enumerate(order)
+        for param in reports_data[report_index].get('parameters', [])
+    ]
+    if not rows:
+        return {"report_count": len(reports_data), "trends": {}}
+
+    long = pd.DataFrame(rows, columns=['column', 'parameter', 'value', 'unit', 'status'])
+    long = long.drop_duplicates(subset=['parameter', 'column'], keep='first')
+    columns = range(len(order))
+    values = long.pivot(index='parameter', columns='column', values='value').reindex(columns=columns)
+    units = long.groupby('parameter', sort=False)['unit'].last()
+
+    matrix = values.to_numpy(dtype=float)
+    valid = ~np.isnan(matrix)
+    n_points = valid.sum(axis=1)
+    n_columns = matrix.shape[1]
+    positions = np.arange(n_columns)
+
+    # 2. First, latest and previous measurement of every parameter
+    first_col = np.argmax(valid, axis=1)
+    last_col = n_columns - 1 - np.argmax(valid[:, ::-1], axis=1)
+    before_last = valid & (positions < last_col[:, None])
+    has_previous = before_last.any(axis=1)
+    prev_col = n_columns - 1 - np.argmax(before_last[:, ::-1], axis=1)
+
+    rows_idx = np.arange(matrix.shape[0])
+    first_val = matrix[rows_idx, first_col]
+    latest_val = matrix[rows_idx, last_col]
+    prev_val = np.where(has_previous, matrix[rows_idx, prev_col], np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent_change = np.where(
+            (n_points >= 2) & (first_val != 0), (latest_val - first_val) / np.abs(first_val) * 100, np.nan
+        )
+
+    # 3. Least-squares slope. Uses days between reports when every report is
+    #    dated, otherwise the position of the report in the sequence.
+    if dates.notna().all():
+        x = ((dates - dates.iloc[0]).dt.days.to_numpy(dtype=float) / 365.25)
+        slope_basis = "year"
+    else:
+        x = positions.astype(float)
+        slope_basis = "report"
+    x_matrix = np.where(valid, x, np.nan)
+    y_matrix = np.where(valid, matrix, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_dev = x_matrix - np.nanmean(x_matrix, axis=1, keepdims=True)
+        y_dev = y_matrix - np.nanmean(y_matrix, axis=1, keepdims=True)
+        slope = np.nansum(x_dev * y_dev, axis=1) / np.nansum(x_dev * x_dev, axis=1)
+    slope = np.where(n_points >= 2, slope, np.nan)
+
+    # 4. Rolling mean over the last TREND_ROLLING_WINDOW reports
+    rolling = values.T.rolling(TREND_ROLLING_WINDOW, min_periods=1).mean().T.to_numpy(dtype=float)
+    rolling = np.where(valid, rolling, np.nan)
+
+    # 5. Statuses of the whole matrix at once from the compiled reference
+    #    ranges. Tests without a range keep the status they were stored with.
+    status_matrix, known = reference_ranges.classify_matrix(values.index, matrix, sex, age)
+    if not known.all():
+        recorded = long.pivot(index='parameter', columns='column', values='status').reindex(columns=columns)
+        status_matrix[~known] = recorded.to_numpy(dtype=object)[~known]
+
+    # 6. Out-of-range streaks: consecutive abnormal measurements, where reports
+    #    missing the parameter neither extend nor break a streak.
+    abnormal = np.isin(status_matrix, ABNORMAL_STATUSES) & valid
+    abnormal_count = np.cumsum(abnormal, axis=1)
+    resets = np.maximum.accumulate(np.where(valid & ~abnormal, abnormal_count, 0), axis=1)
+    streaks = abnormal_count - resets
+    current_streak = streaks[:, -1]
+    longest_streak = streaks.max(axis=1)
+
+    # 7. Shape the result per parameter
+    labels = [reports_data[i].get('date') or reports_data[i]['filename'] for i in order]
     trends = {}
-    
-    # 2. Build time-series data for each parameter
-    for param_name in all_params:
-        series = []
-        for report in reports_data:
-            # Find this parameter in the report
-            match = next((p for p in report['parameters'] if p['parameter'] == param_name), None)
-            
-            if match:
-                entry = {
-                    "date": report.get('date', report['filename']), # Use filename as proxy for date if date missing
-                    "value": match['value'],
-                    "unit": match['unit'],
-                    "status": match['status']
-                }
-                series.append(entry)
-        
-        # Only track if we have at least 2 data points (to show a trend)
-        if len(series) >= 1:
-            # Sort by "date" (naive sorting by string for now, could be improved with real date parsing)
-            # Assuming filenames might have dates or user uploads in order
-            
-            # Calculate simple change summary
-            direction = "stable"
-            if len(series) >= 2:
-                last_val = series[-1]['value']
-                prev_val = series[-2]['value']
-                if last_val > prev_val:
-                    direction = "increasing"
-                elif last_val < prev_val:
-                    direction = "decreasing"
-            
-            trends[param_name] = {
-                "series": series,
-                "direction": direction,
-                "latest_value": series[-1]['value'],
-                "unit": series[-1]['unit']
+    for row, param_name in enumerate(values.index):
+        unit = units[param_name]
+        series = [
+            {
+                "date": labels[col],
+                "value": float(matrix[row, col]),
+                "unit": unit,
+                "status": status_matrix[row, col],
+                "rolling_mean": _to_float(rolling[row, col])
             }
-            
+            for col in np.flatnonzero(valid[row])
+        ]
+
+        direction = "stable"
+        if has_previous[row]:
+            if latest_val[row] > prev_val[row]:
+                direction = "increasing"
+            elif latest_val[row] < prev_val[row]:
+                direction = "decreasing"
+
+        trends[param_name] = {
+            "series": series,
+            "direction": direction,
+            "latest_value": float(latest_val[row]),
+            "unit": unit,
+            "data_points": int(n_points[row]),
+            "first_value": float(first_val[row]),
+            "percent_change": _to_float(percent_change[row]),
+            "slope": _to_float(slope[row]),
+            "slope_basis": slope_basis,
+            "rolling_mean": _to_float(rolling[row, last_col[row]]),
+            "out_of_range_streak": int(current_streak[row]),
+            "longest_out_of_range_streak": int(longest_streak[row])
+        }
+
     return {
         "report_count": len(reports_data),
         "trends": trends
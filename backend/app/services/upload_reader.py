@@ -0,0 +1,69 @@
+import os
+import hashlib
+from fastapi import UploadFile
+from app.services.metrics import timed, timer
+
+# Uploads larger than this are rejected before they are parsed.
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 256 * 1024
+
+# Magic numbers / file signatures
+# PDF: %PDF (25 50 44 46)
+# JPG: FF D8 FF
+# PNG: 89 50 4E 47
+SIGNATURES = {
+    "pdf": b'%PDF',
+    "jpg": b'\xff\xd8\xff',
+    "jpeg": b'\xff\xd8\xff',
+    "png": b'\x89PNG\r\n\x1a\n',
+}
+
+class InvalidSignature(Exception):
+    """Raised when the first bytes of an upload do not match its extension."""
+
+class UploadTooLarge(Exception):
+    """Raised when an upload is bigger than UPLOAD_MAX_BYTES."""
+
+class UploadedDocument:
+    """
+    The body of an upload that has been read and checked. `sha256` is the
+    hex digest of its bytes.
+    """
+
+    def __init__(self, file_ext: str, content: bytes, size: int, sha256: str):
+        self.file_ext = file_ext
+        self.content = content
+        self.size = size
+        self.sha256 = sha256
+
+@timed("upload_read")
+async def read_upload(file: UploadFile, file_ext: str, max_bytes: int = UPLOAD_MAX_BYTES) -> UploadedDocument:
+    """
+    Reads an upload in chunks, checking its signature on the first bytes and
+    its size while reading. By the time this runs the request body has been
+    received and Starlette has spooled large parts to a temporary file, so
+    these checks reject bad uploads before they are parsed, not before they
+    are received; AdmissionMiddleware turns away oversized requests.
+    """
+    signature = SIGNATURES.get(file_ext)
+    if signature is None:
+        raise InvalidSignature(f"Unsupported file type: {file_ext}")
+
+    with timer("signature_check"):
+        head = await file.read(len(signature))
+        if head != signature:
+            raise InvalidSignature(f"File does not look like a {file_ext.upper()} file")
+
+    chunks = [head]
+    size = len(head)
+    digest = hashlib.sha256(head)
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+        digest.update(chunk)
+        chunks.append(chunk)
+    return UploadedDocument(file_ext, b"".join(chunks), size, digest.hexdigest())
@@ -0,0 +1,73 @@
+import os
+import time
+import asyncio
+import importlib
+from app.services.document_executor import document_executor
+from app.services.llm_service import get_provider
+
+# After startup, load the model client, the analysis libraries and the document
+# worker processes in the background so the first requests don't wait for
+# them. /api/ready answers 503 until this has finished. When off, everything
+# is loaded on first use and the app is ready at once.
+WARMUP = os.getenv("WARMUP", "true").lower() == "true"
+
+# Libraries the API process itself uses (trend analysis)
+API_MODULES = ("numpy", "pandas")
+# Libraries the document workers use
+WORKER_MODULES = ("app.services.pdf_parser", "app.services.image_processor", "pdfplumber", "pdfplumber.utils", "pdf2image")
+
+_ready = False
+
+def is_ready() -> bool:
+    return _ready
+
+def import_modules(names) -> None:
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Warm-up could not import {name}: {e}")
+
+def warm_worker() -> None:
+    """
+    Runs once in each document worker process.
+    """
+    from app.services import ocr_engine
+
+    import_modules(WORKER_MODULES)
+    try:
+        from app.services.image_processor import OCR_PSM, ocr_variables
+        from app.services.pdf_parser import OCR_THREADS
+
+        # Picks the OCR engine, then loads the language data where pages are
+        # OCR'd: images in the worker's own thread, scanned PDF pages in its
+        # page pool threads
+        reason = ocr_engine.fallback_reason()
+        if reason:
+            print(f"Warm-up: {reason}; OCR uses pytesseract")
+        ocr_engine.warm_thread(OCR_PSM, ocr_variables())
+        ocr_engine.warm_pool(OCR_THREADS)
+    except (ImportError, RuntimeError) as e:
+        print(f"Warm-up could not start OCR: {e}")
+
+async def warm_up(enabled: bool = WARMUP):
+    """
+    Loads what the first requests would otherwise wait for, then marks the app
+    ready. Failures are logged and left to surface on first use.
+    """
+    global _ready
+    start = time.perf_counter()
+    try:
+        if enabled:
+            await asyncio.gather(
+                asyncio.to_thread(import_modules, API_MODULES),
+                # One model client for the whole app, so connections are reused
+                get_provider(),
+                document_executor.warm(warm_worker),
+            )
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+    finally:
+        _ready = True
+    if enabled:
+        print(f"Warm-up finished in {time.perf_counter() - start:.2f}s")
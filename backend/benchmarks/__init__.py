@@ -0,0 +1 @@
+"""Reproducible performance benchmarks. Run with `python -m benchmarks.run`."""
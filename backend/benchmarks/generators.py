@@ -0,0 +1,193 @@
+"""
+Synthetic lab reports for the benchmarks. Everything is generated from a
+seed, so the same arguments always give the same documents.
+"""
+import io
+import random
+from datetime import date, timedelta
+from typing import List
+from PIL import Image, ImageDraw, ImageFont
+from app.services.data_extractor import patterns
+
+NOISE_LINES = [
+    "Patient Name: John Doe    Age/Sex: 45 Y / M",
+    "Referred By: Dr. A. Sharma    Sample Collected: 08:30 AM",
+    "Method: Spectrophotometry    Specimen: Serum",
+    "Test Name    Result    Unit    Biological Reference Interval",
+    "Interpretation: Values should be correlated clinically.",
+    "This report is electronically verified and does not require a signature.",
+    "Page processed by the laboratory information system.",
+    "Please bring this report on your next visit.",
+]
+
+def parameter_value(rng: random.Random, name: str) -> str:
+    config = patterns[name]
+    low, high = config['range']
+    span = (high - low) or high or 1
+    value = rng.uniform(max(0, low - span * 0.3), high + span * 0.3)
+    # Integer-valued tests are written without decimals, like real reports
+    return f"{value:.1f}" if r"\.?\d*" in config['regex'] else f"{value:.0f}"
+
+def parameter_line(rng: random.Random, name: str) -> str:
+    config = patterns[name]
+    low, high = config['range']
+    return f"{name}: {parameter_value(rng, name)} {config['unit']}    {low} - {high}"
+
+def report_lines(parameter_count: int = len(patterns), noise_per_parameter: int = 1, seed: int = 0) -> List[str]:
+    """
+    Lines of one report with `parameter_count` results (cycling through the
+    known tests) and `noise_per_parameter` lines of header/footer text each.
+    """
+    rng = random.Random(seed)
+    names = list(patterns)
+    lines = [f"Report Date: {date(2024, 1, 1) + timedelta(days=seed % 365):%d/%m/%Y}"]
+    for i in range(parameter_count):
+        lines.extend(rng.choice(NOISE_LINES) for _ in range(noise_per_parameter))
+        lines.append(parameter_line(rng, names[i % len(names)]))
+    return lines
+
+def report_text(parameter_count: int = len(patterns), noise_per_parameter: int = 1, seed: int = 0) -> str:
+    return "\n".join(report_lines(parameter_count, noise_per_parameter, seed)) + "\n"
+
+def _pdf_string(line: str) -> str:
+    return "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+def text_pdf(lines: List[str], lines_per_page: int = 50) -> bytes:
+    """
+    A minimal PDF with a real text layer (Helvetica, A4), written by hand so
+    no PDF library is needed.
+    """
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    return _pdf([
+        "BT /F1 10 Tf 40 800 Td 15 TL " + " ".join(f"{_pdf_string(line)} '" for line in page_lines) + " ET"
+        for page_lines in pages
+    ])
+
+def table_rows(parameter_count: int = len(patterns), seed: int = 0) -> List[List[str]]:
+    """
+    Cells of a results table: a header row, then test, result, unit and
+    reference range for `parameter_count` results.
+    """
+    rng = random.Random(seed)
+    names = list(patterns)
+    rows = [["Test Name", "Result", "Unit", "Biological Reference Interval"]]
+    for i in range(parameter_count):
+        name = names[i % len(names)]
+        low, high = patterns[name]['range']
+        rows.append([name, parameter_value(rng, name), patterns[name]['unit'], f"{low} - {high}"])
+    return rows
+
+def table_pdf(rows: List[List[str]], header: List[str] = (), rows_per_page: int = 40) -> bytes:
+    """
+    A PDF with each page's rows drawn as a ruled table, the way laboratory
+    systems print results, below the `header` lines of free text.
+    """
+    columns = [40, 250, 330, 410, 555]
+    row_height = 18
+    contents = []
+    for start in range(0, len(rows), rows_per_page):
+        page_rows = rows[start:start + rows_per_page]
+        top = 790 - 15 * len(header)
+        bottom = top - row_height * len(page_rows)
+        ops = ["BT /F1 10 Tf 40 810 Td 15 TL " + " ".join(f"{_pdf_string(line)} '" for line in header) + " ET", "0.5 w"]
+        ops += [f"{columns[0]} {top - row_height * i} m {columns[-1]} {top - row_height * i} l S" for i in range(len(page_rows) + 1)]
+        ops += [f"{x} {top} m {x} {bottom} l S" for x in columns]
+        for i, row in enumerate(page_rows):
+            y = top - row_height * i - 13
+            ops += [f"BT /F1 10 Tf {x + 4} {y} Td {_pdf_string(cell)} Tj ET" for x, cell in zip(columns, row)]
+        contents.append("\n".join(ops))
+    return _pdf(contents)
+
+def _pdf(contents: List[str]) -> bytes:
+    """
+    Writes a PDF with one A4 page per content stream, using Helvetica.
+    """
+    page_ids = [4 + 2 * i for i in range(len(contents))]
+    objects = {
+        1: "<< /Type /Catalog /Pages 2 0 R >>",
+        2: f"<< /Type /Pages /Kids [{' '.join(f'{pid} 0 R' for pid in page_ids)}] /Count {len(contents)} >>",
+        3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    for page_id, content in zip(page_ids, contents):
+        objects[page_id] = (
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        )
+        objects[page_id + 1] = f"<< /Length {len(content)} >>\nstream\n{content}\nendstream"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number in range(1, len(objects) + 1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{objects[number]}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+def report_image(lines: List[str], dpi: int = 200) -> Image.Image:
+    """
+    One A4 page of black text on white at `dpi`, like a scanned report.
+    """
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    size = max(10, dpi // 8)
+    try:
+        font = ImageFont.load_default(size=size)
+    except (TypeError, OSError):
+        # Pillow without FreeType only has the small bitmap font
+        font = ImageFont.load_default()
+    y = dpi // 2
+    for line in lines:
+        draw.text((dpi // 2, y), line, fill=0, font=font)
+        y += int(size * 1.5)
+    return image
+
+def image_bytes(lines: List[str], dpi: int = 200, format: str = "PNG") -> bytes:
+    out = io.BytesIO()
+    report_image(lines, dpi).save(out, format=format)
+    return out.getvalue()
+
+def image_pdf(lines: List[str], lines_per_page: int = 50, dpi: int = 200) -> bytes:
+    """
+    A PDF of rendered page images without a text layer, so parsing it goes
+    through the OCR fallback.
+    """
+    pages = [report_image(lines[i:i + lines_per_page], dpi) for i in range(0, len(lines), lines_per_page)]
+    out = io.BytesIO()
+    pages[0].save(out, format="PDF", save_all=True, append_images=pages[1:], resolution=dpi)
+    return out.getvalue()
+
+def trend_reports(report_count: int, parameter_count: int = len(patterns), seed: int = 0) -> List[dict]:
+    """
+    Reports in the shape analyze_trends takes, one per month, with a random
+    walk per parameter and a few results missing.
+    """
+    rng = random.Random(seed)
+    names = list(patterns)[:parameter_count]
+    values = {name: sum(patterns[name]['range']) / 2 or 1.0 for name in names}
+    reports = []
+    for i in range(report_count):
+        parameters = []
+        for name in names:
+            values[name] *= rng.uniform(0.95, 1.05)
+            if rng.random() < 0.1:
+                continue
+            low, high = patterns[name]['range']
+            value = round(values[name], 2)
+            parameters.append({
+                "parameter": name,
+                "value": value,
+                "unit": patterns[name]['unit'],
+                "status": "low" if value < low else "high" if value > high else "normal",
+            })
+        reports.append({
+            "filename": f"report_{i}.pdf",
+            "date": (date(2015, 1, 1) + timedelta(days=30 * i)).isoformat(),
+            "parameters": parameters,
+        })
+    return reports
@@ -0,0 +1,281 @@
+"""
+Benchmarks for the extraction, parsing and trend pipeline.
+
+    python -m benchmarks.run                          # print results
+    python -m benchmarks.run --output baseline.json   # save them
+    python -m benchmarks.run --compare baseline.json  # fail on regressions
+
+Runs offline. OCR benchmarks are skipped when Tesseract or Poppler is not
+installed, and the model is replaced by a stub with a fixed latency.
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from unittest import mock
+
+from benchmarks import generators
+
+def measure(fn, repeat: int, warmup: int = 1, setup=None) -> dict:
+    """
+    Calls fn() `warmup` times unmeasured and `repeat` times measured, with
+    setup() (if given) run before every call outside the timing.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    runs.sort()
+    return {
+        "runs": repeat,
+        "median_ms": round(statistics.median(runs) * 1000, 3),
+        "p95_ms": round(runs[min(len(runs) - 1, int(len(runs) * 0.95))] * 1000, 3),
+        "min_ms": round(runs[0] * 1000, 3),
+    }
+
+def with_throughput(result: dict, items: int, unit: str) -> dict:
+    result[f"{unit}_per_second"] = round(items / (result["median_ms"] / 1000), 2) if result["median_ms"] else None
+    return result
+
+def bench_extract_parameters(repeat: int) -> dict:
+    from app.services.data_extractor import extract_parameters
+
+    results = {}
+    for size, (parameter_count, noise) in {"small": (22, 1), "medium": (220, 3), "large": (2200, 3)}.items():
+        text = generators.report_text(parameter_count, noise)
+        result = measure(lambda: extract_parameters(text), repeat)
+        result["chars"] = len(text)
+        results[f"extract_parameters/{size}"] = with_throughput(result, len(text) / 1e6, "mb")
+
+    # The same results as table rows from a lab-generated PDF
+    text = "\n".join("\t".join(row) for row in generators.table_rows(220))
+    result = measure(lambda: extract_parameters(text), repeat)
+    result["chars"] = len(text)
+    results["extract_parameters/table"] = with_throughput(result, len(text) / 1e6, "mb")
+    return results
+
+def bench_parse_text_pdf(repeat: int) -> dict:
+    from app.services.pdf_parser import extract_pdf_text, parse_pdf
+    from app.services.document_executor import document_executor
+
+    results = {}
+    for pages in (1, 10, 50):
+        pdf = generators.text_pdf(generators.report_lines(pages * 16, 2), lines_per_page=50)
+        result = measure(lambda: extract_pdf_text(pdf), repeat)
+        results[f"extract_pdf_text/{pages}_pages"] = with_throughput(result, pages, "pages")
+    pdf = generators.table_pdf(generators.table_rows(220), header=["Report Date: 01/01/2024"])
+    result = measure(lambda: extract_pdf_text(pdf), repeat)
+    results["extract_pdf_text/table_6_pages"] = with_throughput(result, 6, "pages")
+
+    # Many documents through the worker pool, as many at once as it accepts
+    documents = [generators.text_pdf(generators.report_lines(16, 2, seed=i)) for i in range(16)]
+
+    async def batch():
+        semaphore = asyncio.Semaphore(document_executor.queue_limit)
+
+        async def parse(document):
+            async with semaphore:
+                return await parse_pdf(document)
+
+        await asyncio.gather(*(parse(document) for document in documents))
+
+    result = measure(lambda: asyncio.run(batch()), max(1, repeat // 2))
+    results["parse_pdf/16_documents"] = with_throughput(result, len(documents), "documents")
+    return results
+
+def bench_ocr(repeat: int) -> dict:
+    from PIL import Image
+    from app.services.image_processor import preprocess_image, process_image
+    from app.services.ocr_engine import engine
+    from app.services.pdf_parser import parse_pdf
+
+    # A 12 MP phone photo of a report, as JPEG
+    photo = generators.report_image(generators.report_lines(22, 0), dpi=340).resize((4000, 3000)).convert("RGB")
+    photo_bytes = io.BytesIO()
+    photo.save(photo_bytes, format="JPEG", quality=90)
+    results = {
+        "image_preprocess/12mp": measure(lambda: preprocess_image(Image.open(io.BytesIO(photo_bytes.getvalue()))), repeat)
+    }
+
+    if engine() != "tesserocr" and not shutil.which("tesseract"):
+        results["process_image"] = {"skipped": "tesseract is not installed"}
+        return results
+    results["process_image/12mp_photo"] = measure(lambda: asyncio.run(process_image(photo_bytes.getvalue())), repeat)
+    image = generators.image_bytes(generators.report_lines(22, 0))
+    results["process_image/1_page"] = measure(lambda: asyncio.run(process_image(image)), repeat)
+
+    if not shutil.which("pdftoppm"):
+        results["parse_pdf/scanned"] = {"skipped": "poppler is not installed"}
+        return results
+    for pages in (1, 4):
+        pdf = generators.image_pdf(generators.report_lines(pages * 25, 1), lines_per_page=50)
+        result = measure(lambda: asyncio.run(parse_pdf(pdf)), repeat)
+        results[f"parse_pdf/scanned_{pages}_pages"] = with_throughput(result, pages, "pages")
+    return results
+
+def bench_analyze_trends(repeat: int) -> dict:
+    from app.services.trend_analyzer import analyze_trends
+
+    results = {}
+    for report_count in (5, 50, 500):
+        reports = generators.trend_reports(report_count)
+        result = measure(lambda: asyncio.run(analyze_trends(reports)), repeat)
+        results[f"analyze_trends/{report_count}_reports"] = with_throughput(result, report_count, "reports")
+    return results
+
+def bench_upload(repeat: int, llm_latency: float) -> dict:
+    """
+    End-to-end /api/upload latency with the model replaced by a stub that
+    answers after `llm_latency` seconds. "cold" clears the document and
+    explanation caches before each request, "warm" does not.
+    """
+    from fastapi.testclient import TestClient
+    from app import main
+    from app.services import llm_service
+    from app.services.document_cache import document_cache
+    from app.services.llm_providers import StubProvider
+
+    def clear_caches():
+        document_cache.clear()
+        llm_service.explanation_cache.clear()
+
+    pdf = generators.text_pdf(generators.report_lines(22, 2))
+    patch = mock.patch.object(llm_service, "get_provider", return_value=StubProvider(latency=llm_latency))
+    patch.start()
+    try:
+        with TestClient(main.app) as client:
+            def upload():
+                response = client.post("/api/upload", files={"file": ("report.pdf", pdf, "application/pdf")})
+                response.raise_for_status()
+
+            cold = measure(upload, repeat, setup=clear_caches)
+            warm = measure(upload, repeat)
+    finally:
+        patch.stop()
+        clear_caches()
+
+    cold["llm_latency_ms"] = warm["llm_latency_ms"] = llm_latency * 1000
+    return {"upload/cold": cold, "upload/warm": warm}
+
+def bench_startup(repeat: int) -> dict:
+    """
+    Wall time of `import app.main` in a fresh interpreter, which every server
+    worker pays before it can answer /api/health, next to a bare interpreter.
+    """
+    runs = max(3, repeat // 4)
+    env = dict(os.environ, GEMINI_API_KEY="")
+    results = {}
+    for name, code in (("startup/python", "pass"), ("startup/import_app", "import app.main")):
+        results[name] = measure(
+            lambda: subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True), runs
+        )
+    return results
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "tesseract": bool(shutil.which("tesseract")),
+        "ocr_engine": ocr_engine(),
+        "poppler": bool(shutil.which("pdftoppm")),
+    }
+
+def ocr_engine():
+    try:
+        from app.services.ocr_engine import engine
+        return engine()
+    except RuntimeError:
+        return None
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns (name, baseline_ms, current_ms, ratio) for every benchmark whose
+    median got slower than the baseline by more than `tolerance`.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name, {})
+        if "median_ms" not in result or not before.get("median_ms"):
+            continue
+        ratio = result["median_ms"] / before["median_ms"]
+        print(f"  {name:<36} {before['median_ms']:>10.3f} -> {result['median_ms']:>10.3f} ms  x{ratio:.2f}")
+        if ratio > 1 + tolerance:
+            regressions.append((name, before["median_ms"], result["median_ms"], ratio))
+    return regressions
+
+SUITES = {
+    "extract": bench_extract_parameters,
+    "pdf": bench_parse_text_pdf,
+    "ocr": bench_ocr,
+    "trends": bench_analyze_trends,
+    "upload": bench_upload,
+    "startup": bench_startup,
+}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suite", action="append", choices=sorted(SUITES), help="Run only these suites (repeatable)")
+    parser.add_argument("--repeat", type=int, default=20, help="Measured runs per benchmark")
+    parser.add_argument("--quick", action="store_true", help="Few runs, for a smoke test")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the stub model takes per call")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before a regression is reported")
+    args = parser.parse_args(argv)
+
+    repeat = 3 if args.quick else max(1, args.repeat)
+    results = {}
+    for name in args.suite or SUITES:
+        print(f"Running {name}...", flush=True)
+        if name == "upload":
+            suite_results = bench_upload(repeat, args.llm_latency)
+        else:
+            suite_results = SUITES[name](repeat)
+        for key, result in suite_results.items():
+            summary = result.get("skipped") or f"median {result['median_ms']:.3f} ms, p95 {result['p95_ms']:.3f} ms"
+            print(f"  {key:<36} {summary}")
+        results.update(suite_results)
+
+    report = {"environment": environment(), "repeat": repeat, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} ({baseline.get('environment', {}).get('commit')}):")
+        regressions = compare(results, baseline, args.tolerance)
+        for name, before, after, ratio in regressions:
+            print(f"REGRESSION {name}: {before:.3f} -> {after:.3f} ms (x{ratio:.2f})")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import io
+import asyncio
+import unittest
+from unittest import mock
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+from app import main
+from app.services import llm_service, pdf_parser
+from app.services.admission import REQUEST_MAX_BYTES, AdmissionMiddleware, StageBusy, StageLimiter
+from app.services.llm_providers import StubProvider
+from benchmarks import generators
+
+class TestStageLimiter(unittest.TestCase):
+
+    def test_sheds_when_queue_is_full(self):
+        limiter = StageLimiter("test", limit=1, max_waiting=1, wait_timeout=5)
+        release = None
+        order = []
+
+        async def work(name):
+            async with limiter.slot():
+                order.append(name)
+                await release.wait()
+
+        async def run():
+            nonlocal release
+            release = asyncio.Event()
+            first = asyncio.create_task(work("first"))
+            second = asyncio.create_task(work("second"))
+            await asyncio.sleep(0.01)
+            with self.assertRaises(StageBusy) as busy:
+                await work("third")
+            self.assertEqual((limiter.active, limiter.waiting), (1, 1))
+            release.set()
+            await asyncio.gather(first, second)
+            return busy.exception
+
+        error = asyncio.run(run())
+        self.assertEqual(order, ["first", "second"])
+        self.assertEqual(error.stage, "test")
+        self.assertGreaterEqual(error.retry_after, 1)
+        self.assertEqual((limiter.active, limiter.waiting), (0, 0))
+
+    def test_gives_up_after_wait_timeout(self):
+        limiter = StageLimiter("test", limit=1, max_waiting=5, wait_timeout=0.05)
+
+        async def run():
+            async with limiter.slot():
+                with self.assertRaises(StageBusy):
+                    async with limiter.slot():
+                        pass
+            # The slot is free again afterwards
+            async with limiter.slot():
+                pass
+
+        asyncio.run(run())
+
+def admission_app(**kwargs) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, **kwargs)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return app
+
+class TestAdmissionMiddleware(unittest.TestCase):
+
+    def test_rejects_large_bodies_before_parsing(self):
+        client = TestClient(admission_app(max_bytes=1000))
+        self.assertEqual(client.post("/upload", files={"file": ("a.pdf", b"x" * 100)}).json(), {"size": 100})
+        response = client.post("/upload", files={"file": ("a.pdf", b"x" * 2000)})
+        self.assertEqual(response.status_code, 413)
+        # Sent without a Content-Length
+        chunks = iter([b"x" * 600, b"x" * 600])
+        response = client.post("/upload", content=chunks, headers={"content-type": "multipart/form-data; boundary=b"})
+        self.assertEqual(response.status_code, 413)
+
+    def test_limits_requests_per_client(self):
+        release = asyncio.Event()
+        sent = []
+
+        async def slow_app(scope, receive, send):
+            await release.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        middleware = AdmissionMiddleware(slow_app, client_max_requests=1)
+        scope = {"type": "http", "method": "POST", "path": "/api/upload", "headers": [], "client": ("10.0.0.1", 1)}
+
+        async def send(message):
+            sent.append(message)
+
+        async def run():
+            first = asyncio.create_task(middleware(scope, None, send))
+            await asyncio.sleep(0.01)
+            await middleware(scope, None, send)
+            release.set()
+            await first
+
+        asyncio.run(run())
+        statuses = [m["status"] for m in sent if m["type"] == "http.response.start"]
+        self.assertEqual(statuses, [429, 200])
+        self.assertIn((b"retry-after", b"5"), sent[0]["headers"])
+        self.assertEqual(middleware.in_flight, {})
+
+    def test_client_address_header(self):
+        middleware = AdmissionMiddleware(None, client_header="X-Forwarded-For")
+        scope = {"client": ("10.0.0.1", 1)}
+        self.assertEqual(middleware._client(scope, {b"x-forwarded-for": b"203.0.113.7, 10.0.0.2"}), "203.0.113.7")
+        self.assertEqual(middleware._client(scope, {}), "10.0.0.1")
+        # Without a configured header, forwarded addresses are not trusted
+        self.assertEqual(AdmissionMiddleware(None)._client(scope, {b"x-forwarded-for": b"203.0.113.7"}), "10.0.0.1")
+        self.assertEqual(AdmissionMiddleware(None).client_max_requests, 0)
+
+    def test_rejections_carry_cors_headers(self):
+        # The browser only shows the limit message with CORS headers
+        client = TestClient(main.app)
+        response = client.post("/api/upload", content=b"x", headers={
+            "content-length": str(REQUEST_MAX_BYTES + 1),
+            "content-type": "multipart/form-data; boundary=b",
+            "origin": "http://localhost:5173",
+        })
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("access-control-allow-origin", response.headers)
+
+class TestResourceLimits(unittest.TestCase):
+
+    def test_pdf_page_limit(self):
+        pdf = generators.text_pdf(generators.report_lines(22, 2), lines_per_page=20)
+        with mock.patch.object(pdf_parser, "PDF_MAX_PAGES", 1):
+            with self.assertRaises(pdf_parser.PageLimitExceeded):
+                pdf_parser.extract_pdf_text(pdf)
+        self.assertIn("HbA1c", pdf_parser.extract_pdf_text(pdf))
+
+    def test_pdf_page_limit_is_checked_before_parsing(self):
+        pdf = generators.text_pdf(generators.report_lines(22, 2), lines_per_page=20)
+        import pdfplumber
+        with pdfplumber.open(io.BytesIO(pdf)) as document:
+            self.assertEqual(pdf_parser.count_pdf_pages(pdf), len(document.pages))
+        self.assertIsNone(pdf_parser.count_pdf_pages(b"%PDF-1.4 truncated"))
+        executor = mock.Mock()
+        with mock.patch.object(pdf_parser, "PDF_MAX_PAGES", 1), \
+                mock.patch.object(pdf_parser, "document_executor", executor):
+            with self.assertRaises(pdf_parser.PageLimitExceeded):
+                asyncio.run(pdf_parser.parse_pdf(pdf))
+        executor.run.assert_not_called()
+
+    def test_busy_model_falls_back_to_templates(self):
+        limiter = StageLimiter("llm", limit=1, max_waiting=0)
+
+        async def run():
+            async with limiter.slot():
+                return await llm_service.generate_explanation("Hemoglobin", 10.0, "g/dL", "low", "12.0 - 17.0 g/dL")
+
+        with mock.patch.object(llm_service, "llm_stage", limiter), \
+             mock.patch.object(llm_service, "get_provider", return_value=StubProvider()), \
+             mock.patch.object(llm_service, "use_template", return_value=False):
+            llm_service.explanation_cache.clear()
+            shed = llm_service.LLM_REQUESTS.value(kind="explanation", outcome="shed")
+            explanation = asyncio.run(run())
+        self.assertIn("12.0 - 17.0 g/dL", explanation)
+        self.assertEqual(llm_service.LLM_REQUESTS.value(kind="explanation", outcome="shed"), shed + 1)
+
+    def test_trends_file_count(self):
+        files = [mock.Mock(filename=f"{i}.pdf") for i in range(3)]
+        with mock.patch.object(main, "TRENDS_MAX_FILES", 2):
+            with self.assertRaises(HTTPException) as error:
+                asyncio.run(main.analyze_trends_endpoint(files=files, patient_id=None, sex=None, age=None))
+        self.assertEqual(error.exception.status_code, 413)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+from unittest import mock
+from fastapi.testclient import TestClient
+from app import main
+from test_patient_history import fake_process_file_content, upload
+
+async def slow_or_failing(file, sex=None, age=None):
+    if file.filename.startswith("slow"):
+        await asyncio.sleep(5)
+    if file.filename.startswith("broken"):
+        raise ValueError("unreadable")
+    return await fake_process_file_content(file, sex, age)
+
+class TestAnalyzeTrends(unittest.TestCase):
+
+    def setUp(self):
+        patch = mock.patch.object(main, "process_file_content", slow_or_failing)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.client = TestClient(main.app)
+
+    def post(self, *uploads):
+        return self.client.post("/api/analyze-trends", files=[("files", u) for u in uploads])
+
+    def test_failed_files_are_reported(self):
+        response = self.post(
+            upload("a.pdf", "2024-01-01", "HbA1c 5.5"),
+            upload("broken.pdf", "2024-03-01", "HbA1c 5.8"),
+            upload("empty.pdf", "2024-04-01", "nothing here"),
+            upload("b.pdf", "2024-06-01", "HbA1c 6.0"),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["report_count"], 2)
+        self.assertEqual(response.json()["failed_files"], [
+            {"filename": "broken.pdf", "error": "unreadable"},
+            {"filename": "empty.pdf", "error": "No recognised lab parameters found."},
+        ])
+
+    def test_deadline(self):
+        with mock.patch.object(main, "TRENDS_DEADLINE", 0.5):
+            response = self.post(
+                upload("a.pdf", "2024-01-01", "HbA1c 5.5"),
+                upload("slow.pdf", "2024-03-01", "HbA1c 5.8"),
+                upload("b.pdf", "2024-06-01", "HbA1c 6.0"),
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["report_count"], 2)
+        self.assertEqual(response.json()["failed_files"], [
+            {"filename": "slow.pdf", "error": "Timed out before the report could be read."}
+        ])
+
+    def test_too_few_reports_lists_failed_files(self):
+        with mock.patch.object(main, "TRENDS_DEADLINE", 0.5):
+            response = self.post(
+                upload("a.pdf", "2024-01-01", "HbA1c 5.5"),
+                upload("slow.pdf", "2024-03-01", "HbA1c 5.8"),
+                upload("broken.pdf", "2024-06-01", "HbA1c 6.0"),
+            )
+        self.assertEqual(response.status_code, 400)
+        detail = response.json()["detail"]
+        self.assertIn("at least 2 valid reports", detail["message"])
+        self.assertEqual([f["filename"] for f in detail["failed_files"]], ["slow.pdf", "broken.pdf"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,227 @@
+import io
+import os
+import json
+import time
+import asyncio
+import functools
+import tarfile
+import zipfile
+import tempfile
+import unittest
+import importlib.util
+from unittest import mock
+from app import main
+from app.services import batch, pdf_parser
+from app.services.batch import batch_slots, iter_documents, run_batch
+from app.services.document_executor import DocumentExecutor
+from app.services.jobs import Job
+from benchmarks import generators
+
+def report(seed: int) -> bytes:
+    return generators.text_pdf(generators.report_lines(22, 0, seed=seed))
+
+class BatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.source = os.path.join(self.dir, "reports")
+        os.makedirs(os.path.join(self.source, "2023"))
+        self.files = {"a.pdf": report(1), "2023/b.pdf": report(2), "c.pdf": report(3), "broken.png": b"not an image"}
+        for name, content in self.files.items():
+            with open(os.path.join(self.source, name), "wb") as f:
+                f.write(content)
+        with open(os.path.join(self.source, "notes.txt"), "w") as f:
+            f.write("ignored")
+
+        patch = mock.patch.object(batch, "document_executor", DocumentExecutor(max_workers=2, kind="thread"))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def output(self, name="results.jsonl") -> str:
+        return os.path.join(self.dir, name)
+
+    def read_jsonl(self, path) -> list:
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+
+class TestIterDocuments(BatchTestCase):
+
+    def test_directory(self):
+        self.assertEqual([name for name, _ in iter_documents(self.source)], ["a.pdf", "broken.png", "c.pdf", "2023/b.pdf"])
+
+    def test_zip_and_tar(self):
+        zip_path = os.path.join(self.dir, "reports.zip")
+        with zipfile.ZipFile(zip_path, "w") as archive:
+            for name, content in self.files.items():
+                archive.writestr(name, content)
+            archive.writestr("__MACOSX/._a.pdf", b"")
+        tar_path = os.path.join(self.dir, "reports.tar.gz")
+        with tarfile.open(tar_path, "w:gz") as archive:
+            for name, content in self.files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                archive.addfile(info, io.BytesIO(content))
+
+        for path in (zip_path, tar_path):
+            documents = {name: load() for name, load in iter_documents(path)}
+            self.assertEqual(documents, self.files)
+
+    def test_large_members_are_not_loaded(self):
+        zip_path = os.path.join(self.dir, "reports.zip")
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("a.pdf", self.files["a.pdf"])
+            archive.writestr("bomb.pdf", b"%PDF" + b"\0" * 100000)
+
+        documents = iter_documents(zip_path, max_bytes=50000)
+        name, load = next(documents)
+        self.assertEqual((name, load()), ("a.pdf", self.files["a.pdf"]))
+        name, load = next(documents)
+        with self.assertRaises(batch.UploadTooLarge):
+            load()
+        documents.close()
+
+        output = self.output()
+        with mock.patch.object(batch, "iter_documents", functools.partial(iter_documents, max_bytes=50000)):
+            stats = asyncio.run(run_batch(zip_path, output))
+        errors = {r["file"]: r.get("error") for r in self.read_jsonl(output)}
+        self.assertEqual((stats["processed"], stats["failed"]), (1, 1))
+        self.assertIsNone(errors["a.pdf"])
+        self.assertIn("at most 50000 bytes", errors["bomb.pdf"])
+
+    def test_rejects_other_files(self):
+        with self.assertRaises(ValueError):
+            list(iter_documents(os.path.join(self.source, "notes.txt")))
+
+class TestRunBatch(BatchTestCase):
+
+    def test_writes_jsonl_and_checkpoint(self):
+        progress = []
+        stats = asyncio.run(run_batch(self.source, self.output(), on_progress=progress.append))
+
+        records = {record["file"]: record for record in self.read_jsonl(self.output())}
+        self.assertEqual(set(records), set(self.files))
+        self.assertEqual(len(records["a.pdf"]["parameters"]), 22)
+        self.assertEqual(records["2023/b.pdf"]["date"], "2024-01-03")
+        self.assertIn("error", records["broken.png"])
+        self.assertEqual((stats["processed"], stats["failed"], stats["skipped"]), (3, 1, 0))
+        self.assertEqual(len(progress), 4)
+        with open(self.output() + ".checkpoint") as f:
+            self.assertEqual(set(f.read().split()), set(self.files))
+
+    def test_resumes_from_checkpoint(self):
+        with open(self.output(), "w") as f:
+            f.write(json.dumps({"file": "a.pdf", "parameters": []}) + "\n")
+        with open(self.output() + ".checkpoint", "w") as f:
+            f.write("a.pdf\n")
+
+        stats = asyncio.run(run_batch(self.source, self.output()))
+        self.assertEqual(stats["skipped"], 1)
+        files = [record["file"] for record in self.read_jsonl(self.output())]
+        self.assertEqual(sorted(files), sorted(self.files))
+
+    def test_uploads_are_served_while_a_batch_runs(self):
+        executor = DocumentExecutor(max_workers=2, queue_limit=3, kind="thread")
+        self.addCleanup(executor.shutdown)
+        for name in range(10):
+            with open(os.path.join(self.source, f"extra-{name}.pdf"), "wb") as f:
+                f.write(report(name))
+
+        analyze = batch.analyze_document
+
+        def slow_analyze(name, source):
+            time.sleep(0.05)
+            return analyze(name, source)
+
+        async def run():
+            batch_run = asyncio.create_task(run_batch(self.source, self.output()))
+            await asyncio.sleep(0.1)
+            # An interactive upload while the batch is holding its slots
+            text = await pdf_parser.parse_pdf(self.files["a.pdf"])
+            return batch_run.done(), text, await batch_run
+
+        with mock.patch.object(batch, "document_executor", executor), \
+                mock.patch.object(pdf_parser, "document_executor", executor), \
+                mock.patch.object(batch, "analyze_document", slow_analyze):
+            finished, text, stats = asyncio.run(run())
+        self.assertFalse(finished)
+        self.assertIn("HbA1c", text)
+        self.assertEqual(stats["processed"], 13)
+        self.assertEqual(batch_slots(DocumentExecutor(max_workers=4, queue_limit=16)), 4)
+        self.assertEqual(batch_slots(DocumentExecutor(max_workers=4, queue_limit=16), concurrency=2), 2)
+
+    def test_model_is_only_used_when_asked(self):
+        async def explanations(parameters):
+            return [f"about {p['parameter']}" for p in parameters]
+
+        async def recommendations(abnormal):
+            return "see a doctor"
+
+        explain = mock.AsyncMock(side_effect=explanations)
+        with mock.patch.object(batch, "generate_explanations", explain), \
+             mock.patch.object(batch, "get_health_recommendations", side_effect=recommendations):
+            asyncio.run(run_batch(self.source, self.output()))
+            explain.assert_not_called()
+            asyncio.run(run_batch(self.source, self.output("explained.jsonl"), explain=True))
+
+        record = next(r for r in self.read_jsonl(self.output("explained.jsonl")) if r["file"] == "a.pdf")
+        self.assertEqual(record["parameters"][0]["explanation"], f"about {record['parameters'][0]['parameter']}")
+        self.assertEqual(record["recommendations"], "see a doctor")
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_parquet_parts(self):
+        import pandas as pd
+
+        output = self.output("results.parquet")
+        with mock.patch.object(batch, "BATCH_PARQUET_ROWS", 30):
+            asyncio.run(run_batch(self.source, output, "parquet"))
+        parts = sorted(os.listdir(output))
+        self.assertGreater(len(parts), 1)
+        frame = pd.concat(pd.read_parquet(os.path.join(output, part)) for part in parts)
+        self.assertEqual(len(frame), 3 * 22 + 1)
+        self.assertEqual(set(frame["file"]), set(self.files))
+
+class TestBatchJob(BatchTestCase):
+
+    def test_job_runs_uploaded_archive(self):
+        archive = os.path.join(self.dir, "upload.zip")
+        with zipfile.ZipFile(archive, "w") as f:
+            f.writestr("a.pdf", self.files["a.pdf"])
+        job = Job(main.BATCH_JOB_STAGES, (archive, False))
+        job.result = {"results_url": "http://test/results"}
+
+        with mock.patch.object(main, "BATCH_OUTPUT_DIR", self.dir):
+            asyncio.run(main.run_batch_job(job))
+            results = self.read_jsonl(main.batch_results_path(job.id))
+
+        self.assertEqual(job.stages, {"extract": "done"})
+        self.assertEqual(job.progress["processed"], 1)
+        self.assertEqual(job.result["processed"], 1)
+        self.assertEqual(job.result["results_url"], "http://test/results")
+        self.assertEqual(results[0]["file"], "a.pdf")
+        self.assertFalse(os.path.exists(archive))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, f"{job.id}.jsonl.checkpoint")))
+
+    def test_files_are_removed(self):
+        with mock.patch.object(main, "BATCH_OUTPUT_DIR", self.dir):
+            # A failed batch leaves no archive or checkpoint behind
+            archive = os.path.join(self.dir, "broken.upload")
+            with open(archive, "wb") as f:
+                f.write(b"not an archive")
+            job = Job(main.BATCH_JOB_STAGES, (archive, False))
+            with self.assertRaises(ValueError):
+                asyncio.run(main.run_batch_job(job))
+            output = main.batch_results_path(job.id)
+            self.assertEqual([os.path.exists(p) for p in (archive, output + ".checkpoint")], [False, False])
+
+            # Results go when the job expires; a batch that never ran loses its archive
+            with open(archive, "wb") as f:
+                f.write(b"queued")
+            with open(output, "w") as f:
+                f.write("{}\n")
+            main.remove_batch_files(job)
+            self.assertEqual([os.path.exists(p) for p in (archive, output)], [False, False])
+
+if __name__ == '__main__':
+    unittest.main()
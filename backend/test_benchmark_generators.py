@@ -0,0 +1,28 @@
+import unittest
+from app.services.data_extractor import extract_parameters, extract_report_date, patterns
+from app.services.pdf_parser import extract_pdf_text
+from benchmarks import generators
+
+class TestBenchmarkGenerators(unittest.TestCase):
+
+    def test_report_text_has_every_parameter(self):
+        text = generators.report_text(seed=3)
+        self.assertEqual({p['parameter'] for p in extract_parameters(text)}, set(patterns))
+        self.assertEqual(extract_report_date(text), "2024-01-04")
+        self.assertEqual(text, generators.report_text(seed=3))
+
+    def test_text_pdf_round_trips(self):
+        lines = generators.report_lines(60, 1)
+        text = extract_pdf_text(generators.text_pdf(lines, lines_per_page=40))
+        for line in (lines[1], lines[-1]):
+            self.assertIn(line.split(":")[0], text)
+        self.assertEqual(len(extract_parameters(text)), len(patterns))
+
+    def test_trend_reports(self):
+        reports = generators.trend_reports(12, parameter_count=5, seed=1)
+        self.assertEqual(len(reports), 12)
+        self.assertEqual(reports[1]['date'], "2015-01-31")
+        self.assertTrue(all(len(r['parameters']) <= 5 for r in reports))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import io
+import os
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+from fastapi import UploadFile
+from app import main
+from app.services import document_cache
+from app.services.pdf_parser import PartialText
+from app.services.cache import SQLiteStore, TTLCache, make_key
+from app.services.data_extractor import analytes, extract_results
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = TTLCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_ttl_expiry(self):
+        cache = TTLCache(ttl=10)
+        with mock.patch("app.services.cache.time.time", return_value=1000.0):
+            cache.set("a", "value")
+        with mock.patch("app.services.cache.time.time", return_value=1005.0):
+            self.assertEqual(cache.get("a"), "value")
+        with mock.patch("app.services.cache.time.time", return_value=1011.0):
+            self.assertIsNone(cache.get("a"))
+
+    def test_counters(self):
+        cache = TTLCache()
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("missing")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_disk_tier_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.db")
+            first = TTLCache(store=SQLiteStore(path))
+            first.set("a", {"text": "cached"})
+            first.store.close()
+
+            second = TTLCache(store=SQLiteStore(path))
+            self.assertEqual(second.get("a"), {"text": "cached"})
+            self.assertEqual(second.stats()["disk_hits"], 1)
+            # Promoted into memory after the first disk hit
+            self.assertEqual(second.get("a"), {"text": "cached"})
+            self.assertEqual(second.stats()["hits"], 1)
+            second.store.close()
+
+    def test_make_key_is_order_insensitive_for_dicts(self):
+        self.assertEqual(make_key({"a": 1, "b": 2}), make_key({"b": 2, "a": 1}))
+        self.assertNotEqual(make_key("a", 1), make_key("a", 2))
+
+class TestDocumentCache(unittest.TestCase):
+
+    def setUp(self):
+        document_cache.document_cache.clear()
+
+    def test_parsed_document_round_trip(self):
+        text = "HbA1c 6.1\nTotal Cholesterol 250"
+        document_cache.store_parsed_document("abc", text, extract_results(text))
+        cached = document_cache.get_parsed_document("abc")
+        self.assertEqual(cached["text"], text)
+        self.assertEqual(cached["parameters"], extract_results(text))
+        self.assertIs(cached["parameters"][0].analyte, analytes["HbA1c"])
+        self.assertIsNone(document_cache.get_parsed_document("other"))
+        self.assertEqual(document_cache.document_cache.stats()["hits"], 1)
+
+    def test_round_trip_through_disk_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = TTLCache(max_size=1, ttl=60, store=SQLiteStore(os.path.join(tmp, "cache.db"), table="document_cache"))
+            with mock.patch.object(document_cache, "document_cache", cache):
+                document_cache.store_parsed_document("abc", "HbA1c 6.1", extract_results("HbA1c 6.1"))
+                document_cache.store_parsed_document("other", "TSH 2.0", [])
+                cached = document_cache.get_parsed_document("abc")
+            cache.store.close()
+        self.assertEqual(cached["parameters"], extract_results("HbA1c 6.1"))
+
+    def test_printed_range_is_kept(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = TTLCache(max_size=1, ttl=60, store=SQLiteStore(os.path.join(tmp, "cache.db"), table="document_cache"))
+            text = "HbA1c\t6.1\t%\t4.0 - 6.5\nTSH 2.0"
+            with mock.patch.object(document_cache, "document_cache", cache):
+                document_cache.store_parsed_document("abc", text, extract_results(text))
+                document_cache.store_parsed_document("other", "", [])
+                cached = document_cache.get_parsed_document("abc")
+            cache.store.close()
+        self.assertEqual(cached["parameters"], extract_results(text))
+        self.assertEqual(cached["parameters"][0].status, 'normal')
+
+    def test_pattern_changes_invalidate_entries(self):
+        document_cache.store_parsed_document("abc", "HbA1c 6.1", extract_results("HbA1c 6.1"))
+        with mock.patch.object(document_cache, "EXTRACTOR_VERSION", "changed"):
+            self.assertIsNone(document_cache.get_parsed_document("abc"))
+
+class TestUploadCache(unittest.TestCase):
+
+    def setUp(self):
+        document_cache.document_cache.clear()
+        self.addCleanup(document_cache.document_cache.clear)
+
+    def process(self, content=b"%PDF-1.4 report"):
+        return asyncio.run(main.process_file_content(UploadFile(file=io.BytesIO(content), filename="report.pdf")))
+
+    def test_cached_upload_is_not_parsed_again(self):
+        parse = mock.AsyncMock(return_value="Hemoglobin 13.0\nHbA1c 6.1")
+        with mock.patch.object(main, "parse_pdf", parse), \
+                mock.patch.object(main, "process_image") as process_image:
+            first = self.process()
+            second = self.process()
+        parse.assert_awaited_once()
+        process_image.assert_not_called()
+        self.assertEqual(first["parameters"], second["parameters"])
+        self.assertEqual(len(second["parameters"]), 2)
+
+    def test_partial_ocr_text_is_not_cached(self):
+        parse = mock.AsyncMock(return_value=PartialText("Cover page of City Diagnostics Laboratory\nHemoglobin 13.0"))
+        with mock.patch.object(main, "parse_pdf", parse):
+            self.process()
+            self.process()
+        self.assertEqual(parse.await_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
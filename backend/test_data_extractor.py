@@ -1,5 +1,29 @@
+import random
+import re
+import pickle
 import unittest
-from app.services.data_extractor import extract_parameters, determine_status
+from app.services.data_extractor import (
+    extract_parameters, extract_results, extract_report_date, determine_status, patterns,
+    alias_index, analytes, lookup_parameter, parse_table_row, TableRow
+)
+
+def reference_extract_parameters(text):
+    # The original one-regex-per-parameter implementation, kept as an oracle
+    results = []
+    for param_name, config in patterns.items():
+        match = re.search(config['regex'], text, re.IGNORECASE)
+        if match:
+            value = float(match.group(1))
+            results.append({
+                "parameter": param_name,
+                "value": value,
+                "unit": config['unit'],
+                "status": determine_status(value, config['range'], param_name),
+                "normal_range": config['range'],
+                "category": config['category'],
+                "reference_range_display": f"{config['range'][0]} - {config['range'][1]} {config['unit']}"
+            })
+    return results
 
 class TestDataExtractor(unittest.TestCase):
 
@@ -69,5 +93,148 @@ class TestDataExtractor(unittest.TestCase):
         self.assertEqual(ast['value'], 25.0)
         self.assertEqual(b12['value'], 400.0)
 
+    def test_results_share_analytes(self):
+        text = "HbA1c 6.1 Hemoglobin 11.0"
+        first, second = extract_results(text), extract_results(text)
+        self.assertIs(first[0].analyte, analytes['HbA1c'])
+        self.assertIs(first[1].analyte, second[1].analyte)
+        self.assertEqual((first[1].parameter, first[1].value, first[1].status), ('Hemoglobin', 11.0, 'low'))
+        self.assertEqual([r.to_dict() for r in first], extract_parameters(text))
+        self.assertEqual(pickle.loads(pickle.dumps(first)), first)
+
+class TestTableRows(unittest.TestCase):
+
+    def test_alias_index(self):
+        self.assertEqual(set(alias_index.values()), set(patterns))
+        self.assertEqual(lookup_parameter("GLUCOSE - FASTING"), 'Glucose Fasting')
+        self.assertEqual(lookup_parameter("Cholesterol, Total"), 'Total Cholesterol')
+        self.assertEqual(lookup_parameter("Hemoglobin A1c"), 'HbA1c')
+        self.assertEqual(lookup_parameter("Aspartate Aminotransferase (AST)"), 'AST (SGOT)')
+        self.assertEqual(lookup_parameter("Sodium (Serum)"), 'Sodium')
+        self.assertIsNone(lookup_parameter("Albumin"))
+
+    def test_parse_row(self):
+        self.assertEqual(parse_table_row(["HbA1c", "6.1", "%", "4.0 - 5.7"]), TableRow('HbA1c', 6.1, '%', (4.0, 5.7)))
+        self.assertEqual(parse_table_row(["1", "Hemoglobin", "11.2 L", "g/dL", "12.0-17.0"]),
+                         TableRow('Hemoglobin', 11.2, 'g/dL', (12.0, 17.0)))
+        self.assertEqual(parse_table_row(["TSH", "", "2.5 mIU/L", "0.4 to 4.0"]), TableRow('TSH', 2.5, 'mIU/L', (0.4, 4.0)))
+        self.assertEqual(parse_table_row(["Vitamin D", "18.5"]), TableRow('Vitamin D', 18.5, ''))
+
+    def test_unit_in_any_column(self):
+        # Unit after the range column, and a flag after the unit in the value cell
+        self.assertEqual(parse_table_row(["Glucose Fasting", "5.5", "3.9 - 5.5", "mmol/L"]),
+                         TableRow('Glucose Fasting', 5.5, 'mmol/L', (3.9, 5.5)))
+        self.assertEqual(parse_table_row(["Glucose Fasting", "5.5 mmol/L H", "3.9-5.5"]),
+                         TableRow('Glucose Fasting', 5.5, 'mmol/L', (3.9, 5.5)))
+        self.assertEqual(parse_table_row(["Glucose Fasting", "5.5", "H", "", "mmol/L", "Fasting"]), TableRow('Glucose Fasting', 5.5, 'mmol/L'))
+        for text in ("Glucose Fasting\t5.5\t3.9 - 5.5\tmmol/L", "Glucose Fasting\t5.5 mmol/L H\t3.9-5.5"):
+            with self.subTest(text=text):
+                result, = extract_results(text)
+                self.assertEqual((result.value, result.status), (99.09, 'normal'))
+
+    def test_printed_range_is_used(self):
+        # The lab's own interval decides the status, not the built-in 4.0 - 5.7 %
+        result, = extract_results("HbA1c\t6.1\t%\t4.0 - 6.5")
+        self.assertEqual(result.status, 'normal')
+        self.assertEqual(result.reference.normal_range, (4.0, 6.5))
+        # A range in another unit is converted with the value
+        result, = extract_results("Glucose Fasting\t6.5\tmmol/L\t3.9 - 7.0")
+        self.assertEqual((result.value, result.status), (117.1, 'normal'))
+        self.assertEqual(result.reference.normal_range, (70.26, 126.11))
+        # A range that does not parse leaves the built-in one
+        self.assertEqual(parse_table_row(["HbA1c", "6.1", "%", "< 5.7"]), TableRow('HbA1c', 6.1, '%'))
+        self.assertEqual(parse_table_row(["HbA1c", "6.1", "%", "5.7 - 4.0"]), TableRow('HbA1c', 6.1, '%'))
+        result, = extract_results("HbA1c\t6.1\t%\t< 5.7")
+        self.assertFalse(result.reference.printed)
+        self.assertEqual(result.status, extract_results("HbA1c 6.1")[0].status)
+
+    def test_rows_that_are_not_results(self):
+        self.assertIsNone(parse_table_row(["Test Name", "Result", "Unit"]))
+        self.assertIsNone(parse_table_row(["HbA1c", "Method: HPLC"]))
+        # A range where the value should be is not read as the value
+        self.assertIsNone(parse_table_row(["HbA1c", "4.0-5.7", "6.1"]))
+
+    def test_table_rows_are_read_before_free_text(self):
+        text = (
+            "Test\tResult\tUnit\tRange\n"
+            "Glucose - Fasting\t97.5\tmg/dL\t70 - 100\n"
+            "Glucose - Fasting\t140\tmg/dL\t70 - 100\n"
+            "HbA1c\tsee note\n"
+            "Fasting Blood Sugar: 120\n"
+            "HbA1c: 6.1 %\n"
+        )
+        results = {r['parameter']: r for r in extract_parameters(text)}
+        # The first table row is read whole; the free text and the repeated row are not used
+        self.assertEqual(results['Glucose Fasting']['value'], 97.5)
+        # A row without a value is left to the regexes
+        self.assertEqual(results['HbA1c']['value'], 6.1)
+        self.assertEqual(list(results), [name for name in patterns if name in results])
+
+class TestReportDate(unittest.TestCase):
+
+    def test_labelled_date_wins(self):
+        text = "Patient ID 12345\nPrinted 01-01-2025\nCollected on: 12/03/2024 10:30"
+        self.assertEqual(extract_report_date(text), "2024-03-12")
+
+    def test_formats(self):
+        self.assertEqual(extract_report_date("Report Date : 2023-11-05"), "2023-11-05")
+        self.assertEqual(extract_report_date("Sample date 5th Jan 2024"), "2024-01-05")
+        self.assertEqual(extract_report_date("Reported: March 3, 2022"), "2022-03-03")
+        # Only the month-first reading is a valid date
+        self.assertEqual(extract_report_date("Date: 02/13/2024"), "2024-02-13")
+
+    def test_filename_fallback(self):
+        self.assertEqual(extract_report_date("HbA1c 6.1", "report_2024_02_10.pdf"), "2024-02-10")
+        self.assertIsNone(extract_report_date("HbA1c 6.1", "report.pdf"))
+
+    def test_report_date_is_not_date_of_birth(self):
+        text = "Patient: Jane\nDate of Birth: 14/02/1980\nSample Collected: 03/05/2024\nHbA1c 6.1"
+        self.assertEqual(extract_report_date(text), "2024-05-03")
+        self.assertEqual(extract_report_date("DOB: 14/02/1980\nDate: 03/05/2024"), "2024-05-03")
+        self.assertEqual(extract_report_date("Birth Date: 14/02/1980 Report Date: 03/05/2024"), "2024-05-03")
+        self.assertEqual(extract_report_date("D.O.B. 14/02/1980\nHbA1c 6.1 01/06/2024"), "2024-06-01")
+        self.assertIsNone(extract_report_date("Date of Birth: 14/02/1980\nHbA1c 6.1", "report.pdf"))
+
+    def test_reference_ranges_are_not_dates(self):
+        self.assertIsNone(extract_report_date("Hemoglobin 13.5 g/dL 10.5-12.0"))
+
+class TestSinglePassEquivalence(unittest.TestCase):
+
+    SAMPLES = [
+        "",
+        "No lab values here.",
+        "Glucose - Fasting  (Hexokinase)   92 mg/dL\nHbA1c 6.1 %",
+        "Glycated Hemoglobin: 7.2\nHemoglobin 14.1 g/dL\nHb 13",
+        "Fasting Blood Sugar\n110\nAST (SGOT)\n25 U/L\nALT: 30",
+        "Cholesterol, Total 220\nHDL 38\nLDL Cholesterol: 160\nTriglycerides 199",
+        "Sodium 140 Na+ 141 K+ 4.1 Potassium 3.9 Calcium 9.4 Ca 8.0",
+        "25-OH Vitamin D 18.5 ng/mL\nVitamin B12 150\nCobalamin 300",
+        "Platelet Count 250\nPLT 100\nWBC 7.2\nWhite Blood Cell Count 12",
+        "Blood Urea Nitrogen 18\nUric Acid 8.1\nSerum Creatinine 1.4\nTotal Bilirubin 0.8",
+        "Alkaline Phosphatase 120 ALP 300 TSH 2.5 Thyrotropin 5.1",
+        "Glucose \u2013 Fasting 99\n\u212a+ 4.4\nPota\u017fsium\nCalc\u0130um 9.1 \u00b5g HB\u0130 12",
+    ]
+
+    def test_matches_reference_on_samples(self):
+        for text in self.SAMPLES:
+            self.assertEqual(extract_parameters(text), reference_extract_parameters(text), text)
+
+    def test_matches_reference_on_generated_reports(self):
+        rng = random.Random(1234)
+        tokens = []
+        for config in patterns.values():
+            tokens.extend(re.findall(r'[A-Za-z0-9+\- ,]{2,}', config['regex'].split(')')[0]))
+        fillers = ["", " ", ": ", "  -  ", "\n", " (method) ", " result ", "\u212a+ ", "\u0130"]
+        for _ in range(200):
+            parts = []
+            for _ in range(rng.randint(1, 40)):
+                parts.append(rng.choice(tokens))
+                parts.append(rng.choice(fillers))
+                if rng.random() < 0.7:
+                    parts.append(str(round(rng.uniform(0, 500), rng.choice([0, 1, 2]))))
+                parts.append(rng.choice(fillers))
+            text = "".join(parts)
+            self.assertEqual(extract_parameters(text), reference_extract_parameters(text), text)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,46 @@
+import asyncio
+import time
+import unittest
+from app.services.document_executor import DocumentExecutor, DocumentQueueFull, DocumentTimeout
+
+class TestDocumentExecutor(unittest.TestCase):
+
+    def test_runs_in_worker_process(self):
+        executor = DocumentExecutor(max_workers=2, kind="process")
+        try:
+            self.assertEqual(asyncio.run(executor.run(pow, 2, 10)), 1024)
+        finally:
+            executor.shutdown()
+
+    def test_parallel_documents(self):
+        executor = DocumentExecutor(max_workers=4, kind="thread")
+
+        async def run():
+            return await asyncio.gather(*(executor.run(time.sleep, 0.1) for _ in range(4)))
+
+        start = time.perf_counter()
+        asyncio.run(run())
+        self.assertLess(time.perf_counter() - start, 0.3)
+        executor.shutdown()
+
+    def test_rejects_when_queue_is_full(self):
+        executor = DocumentExecutor(max_workers=1, queue_limit=2, kind="thread")
+
+        async def run():
+            return await asyncio.gather(
+                *(executor.run(time.sleep, 0.1) for _ in range(3)), return_exceptions=True
+            )
+
+        results = asyncio.run(run())
+        self.assertEqual(sum(isinstance(r, DocumentQueueFull) for r in results), 1)
+        self.assertEqual(executor.pending, 0)
+        executor.shutdown()
+
+    def test_timeout(self):
+        executor = DocumentExecutor(max_workers=1, timeout=0.05, kind="thread")
+        with self.assertRaises(DocumentTimeout):
+            asyncio.run(executor.run(time.sleep, 0.3))
+        executor.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import io
+import unittest
+from unittest import mock
+from PIL import Image, ImageDraw
+from app.services import image_processor
+from app.services.image_processor import extract_image_text, ocr_variables, otsu_threshold, preprocess_image
+from app.services.ocr_engine import tesseract_config
+
+def photo(width=4000, height=3000, orientation=None, dpi=None) -> bytes:
+    """
+    A large gray 'photo' of a page with a block of dark text-like bars on it.
+    """
+    image = Image.new("RGB", (width, height), (200, 195, 190))
+    draw = ImageDraw.Draw(image)
+    for row in range(10):
+        y = height // 3 + row * height // 40
+        draw.rectangle((width // 4, y, width // 2, y + height // 100), fill=(40, 40, 50))
+    out = io.BytesIO()
+    kwargs = {}
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        kwargs["exif"] = exif.tobytes()
+    if dpi:
+        kwargs["dpi"] = (dpi, dpi)
+    image.save(out, format="JPEG", **kwargs)
+    return out.getvalue()
+
+class TestPreprocessImage(unittest.TestCase):
+
+    def test_downscales_large_photos(self):
+        image = preprocess_image(Image.open(io.BytesIO(photo())), binarize=False)
+        self.assertEqual(image.mode, "L")
+        self.assertEqual(max(image.size), image_processor.OCR_IMAGE_MAX_SIDE)
+
+    def test_downscales_to_target_dpi(self):
+        image = preprocess_image(Image.open(io.BytesIO(photo(2000, 1000, dpi=600))), dpi=300, binarize=False)
+        self.assertEqual(image.size, (1000, 500))
+
+    def test_keeps_small_images(self):
+        image = preprocess_image(Image.open(io.BytesIO(photo(800, 600))), binarize=False)
+        self.assertEqual(image.size, (800, 600))
+
+    def test_applies_exif_orientation(self):
+        # Orientation 6 means the camera was rotated; the upright page is portrait
+        image = preprocess_image(Image.open(io.BytesIO(photo(1200, 900, orientation=6))), binarize=False)
+        self.assertEqual(image.size, (900, 1200))
+
+    def test_binarizes_and_crops_to_text(self):
+        image = preprocess_image(Image.open(io.BytesIO(photo(1200, 900))), crop_margin=10)
+        self.assertEqual(set(image.getdata()) - {0, 255}, set())
+        # Bars span x 300..600 and y 300..~550 of the original
+        self.assertLess(image.width, 330)
+        self.assertLess(image.height, 300)
+
+    def test_otsu_threshold_separates_two_levels(self):
+        image = Image.new("L", (100, 100), 220)
+        image.paste(40, (0, 0, 30, 100))
+        self.assertTrue(40 <= otsu_threshold(image) < 220)
+
+class TestExtractImageText(unittest.TestCase):
+
+    def test_passes_preprocessed_image_and_config(self):
+        with mock.patch.object(image_processor, "ocr_image", return_value="Hemoglobin 13.5") as ocr:
+            self.assertEqual(extract_image_text(photo()), "Hemoglobin 13.5")
+        image = ocr.call_args.args[0]
+        self.assertEqual(image.mode, "L")
+        self.assertLessEqual(max(image.size), image_processor.OCR_IMAGE_MAX_SIDE)
+        self.assertEqual(ocr.call_args.kwargs, {"psm": image_processor.OCR_PSM, "variables": ocr_variables()})
+
+    def test_config(self):
+        self.assertEqual(tesseract_config(4, ocr_variables(whitelist="")), "--psm 4 -c preserve_interword_spaces=1")
+        self.assertIn("tessedit_char_whitelist=ABC", tesseract_config(6, ocr_variables(whitelist="ABC")))
+
+if __name__ == '__main__':
+    unittest.main()
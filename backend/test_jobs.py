@@ -0,0 +1,117 @@
+import asyncio
+import unittest
+from unittest import mock
+from app.services.jobs import JobManager, JobQueueFull
+
+class TestJobManager(unittest.TestCase):
+
+    def test_runs_job_and_records_stages(self):
+        async def runner(job):
+            job.start_stage("one")
+            job.result["partial"] = job.payload
+            job.finish_stage("one")
+            job.start_stage("two")
+            await asyncio.sleep(0)
+            job.finish_stage("two")
+
+        async def run():
+            manager = JobManager(runner, ["one", "two"], workers=1)
+            await manager.start()
+            job = manager.submit("payload")
+            self.assertEqual(job.status, "queued")
+            while job.finished_at is None:
+                await asyncio.sleep(0.01)
+            await manager.stop()
+            return manager, job
+
+        manager, job = asyncio.run(run())
+        self.assertEqual(job.status, "completed")
+        self.assertEqual(job.stages, {"one": "done", "two": "done"})
+        self.assertEqual(job.result, {"partial": "payload"})
+        self.assertIsNone(job.payload)
+        self.assertIs(manager.get(job.id), job)
+
+    def test_failure_marks_stage(self):
+        async def runner(job):
+            job.start_stage("parse")
+            raise ValueError("unreadable")
+
+        async def run():
+            manager = JobManager(runner, ["parse", "explain"], workers=1)
+            await manager.start()
+            job = manager.submit(None)
+            while job.finished_at is None:
+                await asyncio.sleep(0.01)
+            await manager.stop()
+            return job.to_dict()
+
+        state = asyncio.run(run())
+        self.assertEqual(state["status"], "failed")
+        self.assertEqual(state["stage"], "parse")
+        self.assertEqual(state["stages"], {"parse": "failed", "explain": "pending"})
+        self.assertEqual(state["error"], "unreadable")
+
+    def test_rejects_when_queue_is_full(self):
+        async def runner(job):
+            await asyncio.sleep(1)
+
+        async def run():
+            manager = JobManager(runner, ["work"], workers=1, queue_size=1)
+            await manager.start()
+            manager.submit(None)
+            await asyncio.sleep(0.01)  # first job is picked up by the worker
+            manager.submit(None)
+            with self.assertRaises(JobQueueFull):
+                manager.submit(None)
+            await manager.stop()
+
+        asyncio.run(run())
+
+    def test_finished_jobs_expire(self):
+        async def runner(job):
+            pass
+
+        async def run():
+            manager = JobManager(runner, ["work"], workers=1, retention=10)
+            await manager.start()
+            job = manager.submit(None)
+            while job.finished_at is None:
+                await asyncio.sleep(0.01)
+            await manager.stop()
+            return manager, job
+
+        manager, job = asyncio.run(run())
+        with mock.patch("app.services.jobs.time.time", return_value=job.finished_at + 11):
+            self.assertIsNone(manager.get(job.id))
+
+    def test_cleanup_on_expiry_and_stop(self):
+        cleaned = []
+        release = None
+
+        async def runner(job):
+            await release.wait()
+
+        async def run():
+            nonlocal release
+            release = asyncio.Event()
+            manager = JobManager(runner, ["work"], workers=1, retention=10, cleanup=lambda job: cleaned.append(job.payload))
+            await manager.start()
+            finished = manager.submit("finished")
+            release.set()
+            while finished.finished_at is None:
+                await asyncio.sleep(0.01)
+            release.clear()
+            manager.submit("running")
+            await asyncio.sleep(0.01)
+            manager.submit("queued")
+            with mock.patch("app.services.jobs.time.time", return_value=finished.finished_at + 11):
+                self.assertIsNone(manager.get(finished.id))
+            self.assertEqual(cleaned, [None])
+            await manager.stop()
+
+        asyncio.run(run())
+        # The cancelled job has let go of its payload; the queued one has not
+        self.assertEqual(cleaned, [None, None, "queued"])
+
+if __name__ == '__main__':
+    unittest.main()
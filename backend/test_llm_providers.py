@@ -0,0 +1,164 @@
+import asyncio
+import os
+import time
+import unittest
+from unittest import mock
+from app.services import llm_providers
+from app.services.admission import StageLimiter
+from app.services.llm_providers import LLMProvider, RateLimiter, StubProvider, create_provider
+
+class RateLimited(Exception):
+    pass
+
+class Unavailable(Exception):
+    pass
+
+class FlakyProvider(LLMProvider):
+    """
+    Fails with the queued errors first, then answers.
+    """
+    retryable_errors = (RateLimited, Unavailable)
+    rate_limit_errors = (RateLimited,)
+
+    def __init__(self, errors, **kwargs):
+        kwargs.setdefault("rate_limit", 0)
+        kwargs.setdefault("base_delay", 0.01)
+        super().__init__(**kwargs)
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def _generate(self, prompt):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+class TestProviderRetries(unittest.TestCase):
+
+    def test_retries_transient_errors(self):
+        provider = FlakyProvider([Unavailable(), RateLimited()])
+        self.assertEqual(asyncio.run(provider.generate("prompt")), "ok")
+        self.assertEqual(provider.calls, 3)
+
+    def test_gives_up_after_max_retries(self):
+        provider = FlakyProvider([Unavailable()] * 3, max_retries=2)
+        with self.assertRaises(Unavailable):
+            asyncio.run(provider.generate("prompt"))
+        self.assertEqual(provider.calls, 3)
+
+    def test_does_not_retry_other_errors(self):
+        provider = FlakyProvider([ValueError("bad request")])
+        with self.assertRaises(ValueError):
+            asyncio.run(provider.generate("prompt"))
+        self.assertEqual(provider.calls, 1)
+
+    def test_retries_timeouts(self):
+        class SlowOnce(FlakyProvider):
+            async def _generate(self, prompt):
+                self.calls += 1
+                if self.calls == 1:
+                    await asyncio.sleep(1)
+                return "ok"
+
+        provider = SlowOnce([], timeout=0.05)
+        self.assertEqual(asyncio.run(provider.generate("prompt")), "ok")
+        self.assertEqual(provider.calls, 2)
+
+    def test_slot_is_free_during_retry_delay(self):
+        stage = StageLimiter("llm", limit=1, max_waiting=0)
+        backing_off = FlakyProvider([Unavailable()], base_delay=0.4)
+        other = FlakyProvider([])
+
+        async def run():
+            first = asyncio.create_task(backing_off.generate("a", slot=stage.slot))
+            await asyncio.sleep(0.05)
+            # Would be StageBusy if the first caller kept its slot while waiting
+            second = await other.generate("b", slot=stage.slot)
+            return await first, second
+
+        self.assertEqual(asyncio.run(run()), ("ok", "ok"))
+        self.assertEqual((backing_off.calls, stage.active), (2, 0))
+
+    def test_rate_limit_response_pauses_all_callers(self):
+        error = RateLimited()
+        error.response = mock.Mock(headers={"retry-after": "0.2"})
+        provider = FlakyProvider([error])
+
+        async def run():
+            first = asyncio.create_task(provider.generate("a"))
+            await asyncio.sleep(0.05)
+            start = time.perf_counter()
+            await provider.generate("b")
+            waited = time.perf_counter() - start
+            await first
+            return waited
+
+        # The second caller waits out the Retry-After of the first one's 429
+        self.assertGreater(asyncio.run(run()), 0.1)
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_burst_then_spaced(self):
+        limiter = RateLimiter(rate=10, burst=3)
+        delays = [limiter.reserve() for _ in range(5)]
+        self.assertEqual(delays[:3], [0, 0, 0])
+        self.assertAlmostEqual(delays[3], 0.1, places=2)
+        self.assertAlmostEqual(delays[4], 0.2, places=2)
+
+    def test_disabled(self):
+        limiter = RateLimiter(rate=0)
+        self.assertEqual([limiter.reserve() for _ in range(100)], [0.0] * 100)
+
+class TestCreateProvider(unittest.TestCase):
+
+    def test_no_key_means_no_provider(self):
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": ""}):
+            self.assertIsNone(create_provider("openai"))
+
+    def test_unknown_provider(self):
+        with self.assertRaises(ValueError):
+            create_provider("nope")
+
+    def test_stub(self):
+        provider = create_provider("stub")
+        self.assertIsInstance(provider, StubProvider)
+        text = asyncio.run(provider.generate("Explain this test result:\n- Test: TSH\n"))
+        self.assertEqual(text, "Stub response for - Test: TSH.")
+
+    def test_gemini_is_configured_once(self):
+        with mock.patch("google.generativeai.configure") as configure, \
+                mock.patch("google.generativeai.GenerativeModel") as model, \
+                mock.patch.dict(os.environ, {"GEMINI_API_KEY": "key"}):
+            model.return_value.generate_content_async = mock.AsyncMock(return_value=mock.Mock(text="answer"))
+            provider = create_provider("gemini")
+
+            async def run():
+                return await asyncio.gather(*(provider.generate(str(i)) for i in range(5)))
+
+            self.assertEqual(asyncio.run(run()), ["answer"] * 5)
+        configure.assert_called_once_with(api_key="key")
+        model.assert_called_once_with("gemini-pro")
+
+    def test_gemini_timeout_cancels_the_call(self):
+        cancelled = []
+
+        async def hang(prompt):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(prompt)
+                raise
+
+        with mock.patch("google.generativeai.configure"), \
+                mock.patch("google.generativeai.GenerativeModel") as model, \
+                mock.patch.dict(os.environ, {"GEMINI_API_KEY": "key"}):
+            model.return_value.generate_content_async = hang
+            provider = create_provider("gemini")
+            provider.timeout, provider.max_retries, provider.base_delay = 0.05, 1, 0.01
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(provider.generate("prompt"))
+        # Nothing is left running after either attempt
+        self.assertEqual(cancelled, ["prompt", "prompt"])
+
+if __name__ == '__main__':
+    unittest.main()
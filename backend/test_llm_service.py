@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+from app.services import llm_service, explanation_templates
+from app.services.llm_providers import LLMProvider
+from app.services.data_extractor import extract_parameters
+
+class FakeModel(LLMProvider):
+    """
+    Stands in for a model provider: runs a blocking call in a worker thread
+    and records how many calls were in flight at once.
+    """
+    latency = 0.05
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    async def _generate(self, prompt):
+        return await asyncio.to_thread(self.generate_content, prompt)
+
+    def generate_content(self, prompt):
+        with FakeModel.lock:
+            FakeModel.active += 1
+            FakeModel.peak = max(FakeModel.peak, FakeModel.active)
+        time.sleep(self.latency)
+        with FakeModel.lock:
+            FakeModel.active -= 1
+        test_line = next((line for line in prompt.splitlines() if "- Test:" in line), "recommendations")
+        return f"explained {test_line.strip()}"
+
+REPORT = """
+HbA1c: 6.5 %
+Total Cholesterol: 250 mg/dL
+HDL Cholesterol: 35 mg/dL
+LDL Cholesterol: 160 mg/dL
+Triglycerides: 180 mg/dL
+TSH: 2.5
+WBC: 7.2
+Platelet Count: 250
+Serum Creatinine: 0.9
+Uric Acid: 5.0
+"""
+
+class TestConcurrentExplanations(unittest.TestCase):
+
+    def setUp(self):
+        FakeModel.active = 0
+        FakeModel.peak = 0
+        llm_service.explanation_cache.clear()
+        patches = [
+            mock.patch.object(llm_service, "get_provider", return_value=FakeModel(rate_limit=0)),
+            mock.patch.object(explanation_templates, "EXPLANATION_POLICY", "llm"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.parameters = extract_parameters(REPORT)
+
+    def test_explanations_keep_parameter_order(self):
+        explanations = asyncio.run(llm_service.generate_explanations(self.parameters))
+        self.assertEqual(len(explanations), len(self.parameters))
+        for param, explanation in zip(self.parameters, explanations):
+            self.assertIn(f"Test: {param['parameter']}", explanation)
+
+    def test_concurrency_is_bounded_and_faster_than_serial(self):
+        start = time.perf_counter()
+        asyncio.run(llm_service.generate_explanations(self.parameters, concurrency=4))
+        elapsed = time.perf_counter() - start
+
+        serial = FakeModel.latency * len(self.parameters)
+        self.assertLessEqual(FakeModel.peak, 4)
+        self.assertGreater(FakeModel.peak, 1)
+        self.assertLess(elapsed, serial * 0.6)
+
+    def test_event_loop_is_not_blocked(self):
+        async def run():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.005)
+                    ticks += 1
+
+            task = asyncio.create_task(ticker())
+            await llm_service.generate_explanations(self.parameters, concurrency=1)
+            task.cancel()
+            return ticks
+
+        # Ten serial 50ms calls leave plenty of room for the ticker to run
+        self.assertGreater(asyncio.run(run()), 20)
+
+    def test_repeat_results_are_served_from_cache(self):
+        asyncio.run(llm_service.generate_explanations(self.parameters))
+        first_misses = llm_service.explanation_cache.stats()["misses"]
+
+        FakeModel.peak = 0
+        explanations = asyncio.run(llm_service.generate_explanations([dict(p) for p in self.parameters]))
+
+        stats = llm_service.explanation_cache.stats()
+        self.assertEqual(FakeModel.peak, 0)
+        self.assertEqual(stats["misses"], first_misses)
+        self.assertEqual(stats["hits"], len(self.parameters))
+        self.assertEqual(len(explanations), len(self.parameters))
+
+    def test_cache_key_has_exact_value_and_model(self):
+        asyncio.run(llm_service.generate_explanations(self.parameters))
+        misses = llm_service.explanation_cache.stats()["misses"]
+
+        # The text quotes the value, so a nearby value is not served it
+        nearby = [dict(p, value=p['value'] + 1) for p in self.parameters]
+        asyncio.run(llm_service.generate_explanations(nearby))
+        self.assertEqual(llm_service.explanation_cache.stats()["misses"], misses + len(self.parameters))
+
+        # Nor is another model
+        other = FakeModel(model="other-model", rate_limit=0)
+        with mock.patch.object(llm_service, "get_provider", return_value=other):
+            asyncio.run(llm_service.generate_explanations(self.parameters))
+        self.assertEqual(llm_service.explanation_cache.stats()["misses"], misses + 2 * len(self.parameters))
+
+    def test_recommendations_are_cached(self):
+        abnormal = [p for p in self.parameters if p['status'] != 'normal']
+        first = asyncio.run(llm_service.get_health_recommendations(abnormal))
+        FakeModel.peak = 0
+        second = asyncio.run(llm_service.get_health_recommendations(list(reversed(abnormal))))
+        self.assertEqual(first, second)
+        self.assertEqual(FakeModel.peak, 0)
+
+class TestProviderLoading(unittest.TestCase):
+
+    def test_waiting_for_warm_up_does_not_block_the_loop(self):
+        loaded = threading.Event()
+
+        def slow_create():
+            loaded.wait(1)
+            return "provider"
+
+        async def run():
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while not loaded.is_set():
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            # A warm-up thread is creating the provider when a request needs it
+            warm_up = asyncio.create_task(asyncio.to_thread(llm_service._load_provider))
+            await asyncio.sleep(0.02)
+            ticker = asyncio.create_task(tick())
+            request = asyncio.create_task(llm_service.get_provider())
+            await asyncio.sleep(0.2)
+            loaded.set()
+            await ticker
+            return ticks, await request, await warm_up
+
+        with mock.patch.object(llm_service, "create_provider", side_effect=slow_create) as create, \
+                mock.patch.object(llm_service, "_provider", None), \
+                mock.patch.object(llm_service, "_provider_ready", False):
+            ticks, provider, warmed = asyncio.run(run())
+        self.assertGreater(ticks, 5)
+        self.assertEqual((provider, warmed), ("provider", "provider"))
+        create.assert_called_once()
+
+class TestTemplateExplanations(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = FakeModel(rate_limit=0)
+        patch = mock.patch.object(llm_service, "get_provider", return_value=self.provider)
+        patch.start()
+        self.addCleanup(patch.stop)
+        llm_service.explanation_cache.clear()
+        FakeModel.peak = 0
+        self.parameters = extract_parameters(REPORT)
+
+    def explain(self, policy):
+        with mock.patch.object(explanation_templates, "EXPLANATION_POLICY", policy):
+            return asyncio.run(llm_service.generate_explanations(self.parameters))
+
+    def test_every_pattern_has_templates(self):
+        from app.services.data_extractor import patterns
+        self.assertEqual(set(explanation_templates.ANALYTES), set(patterns))
+
+    def test_abnormal_policy_only_sends_abnormal_results_to_model(self):
+        explanations = self.explain("abnormal")
+        for param, explanation in zip(self.parameters, explanations):
+            if param['status'] in ('low', 'high'):
+                self.assertTrue(explanation.startswith("explained"), explanation)
+            else:
+                self.assertIn(param['reference_range_display'], explanation)
+                self.assertIn("normal range", explanation)
+        self.assertGreater(FakeModel.peak, 0)
+
+    def test_template_policy_never_calls_model(self):
+        explanations = self.explain("template")
+        self.assertEqual(FakeModel.peak, 0)
+        hdl = next(e for p, e in zip(self.parameters, explanations) if p['parameter'] == 'HDL Cholesterol')
+        self.assertEqual(
+            hdl,
+            "HDL is the 'good' cholesterol that helps carry excess cholesterol away from your arteries. "
+            "Your result of 35 mg/dL is low compared with the normal range (40 - 100 mg/dL). "
+            "A low value gives your heart less of this protection; exercise and diet can help raise it. "
+            "Please discuss this result with your doctor."
+        )
+
+    def test_templates_without_api_key(self):
+        with mock.patch.object(llm_service, "get_provider", return_value=None), \
+                mock.patch.object(explanation_templates, "EXPLANATION_POLICY", "llm"):
+            explanation = asyncio.run(llm_service.generate_explanation("TSH", 2.5, "mIU/L", "normal", "0.4 - 4.0 mIU/L"))
+        self.assertTrue(explanation.startswith("TSH is a hormone"))
+
+if __name__ == '__main__':
+    unittest.main()
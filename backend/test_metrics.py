@@ -0,0 +1,69 @@
+import asyncio
+import time
+import unittest
+from app.services import metrics
+from app.services.metrics import Counter, Histogram, Registry
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_render(self):
+        registry = Registry()
+        histogram = registry.register(Histogram("test_seconds", "Test latency.", ("stage",), buckets=(0.1, 1.0)))
+        histogram.observe(0.05, stage="ocr")
+        histogram.observe(0.5, stage="ocr")
+        histogram.observe(5.0, stage="ocr")
+
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE test_seconds histogram", lines)
+        self.assertIn('test_seconds_bucket{stage="ocr",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="ocr",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="ocr",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_sum{stage="ocr"} 5.550000', lines)
+        self.assertIn('test_seconds_count{stage="ocr"} 3', lines)
+
+    def test_counter_escapes_labels(self):
+        counter = Counter("test_total", "Test counter.", ("route",))
+        counter.inc(route='a"b')
+        counter.inc(route='a"b')
+        self.assertEqual(counter.samples(), ['test_total{route="a\\"b"} 2'])
+
+    def test_request_timings_and_server_timing(self):
+        async def handle():
+            timings = metrics.start_request()
+            with metrics.timer("test_stage"):
+                pass
+            metrics.record_stage("test_page", 0.010)
+            metrics.record_stage("test_page", 0.015)
+            return timings
+
+        timings = asyncio.run(handle())
+        self.assertEqual([stage for stage, _ in timings], ["test_stage", "test_page", "test_page"])
+        header = metrics.server_timing(timings[1:], total=0.5)
+        self.assertEqual(header, 'test_page;dur=25.0;desc="2x", total;dur=500.0')
+
+    def test_worker_timings_are_captured(self):
+        before = metrics.STAGE_SECONDS.count(stage="test_worker")
+
+        def work(x):
+            with metrics.timer("test_worker"):
+                return x * 2
+
+        result, timings = metrics.run_captured(time.time(), work, 21)
+        self.assertEqual(result, 42)
+        self.assertEqual([stage for stage, _, _ in timings], ["document_queue", "test_worker"])
+        # Nothing reaches the registry until the timings are handed back
+        self.assertEqual(metrics.STAGE_SECONDS.count(stage="test_worker"), before)
+        metrics.record_captured(timings)
+        self.assertEqual(metrics.STAGE_SECONDS.count(stage="test_worker"), before + 1)
+
+    def test_timed_records_errors(self):
+        @metrics.timed("test_failing")
+        async def failing():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            asyncio.run(failing())
+        self.assertEqual(metrics.STAGE_ERRORS.value(stage="test_failing"), 1)
+
+if __name__ == '__main__':
+    unittest.main()
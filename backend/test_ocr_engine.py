@@ -0,0 +1,117 @@
+import os
+import unittest
+import threading
+from unittest import mock
+from PIL import Image, ImageDraw, ImageFont
+from app.services import ocr_engine
+from app.services.ocr_engine import ocr_image, page_pool, tesseract_config
+
+class FakeAPI:
+    created = 0
+
+    def __init__(self, lang, psm, oem, **kwargs):
+        FakeAPI.created += 1
+        self.psm = psm
+        self.variables = {}
+        self.image = None
+
+    def SetVariable(self, name, value):
+        self.variables[name] = value
+
+    def SetImage(self, image):
+        self.image = image
+
+    def GetUTF8Text(self):
+        return f"psm {self.psm} {self.image.size}"
+
+    def Clear(self):
+        self.image = None
+
+class TestOcrEngine(unittest.TestCase):
+
+    def setUp(self):
+        FakeAPI.created = 0
+        ocr_engine._local.__dict__.clear()
+        patches = [
+            mock.patch.object(ocr_engine, "_engine", None),
+            mock.patch.object(ocr_engine, "tesserocr", mock.Mock(PyTessBaseAPI=FakeAPI)),
+            mock.patch.object(ocr_engine, "OCR_ENGINE", "auto"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(ocr_engine._local.__dict__.clear)
+
+    def test_reuses_one_api_per_thread_and_settings(self):
+        image = Image.new("L", (40, 20), 255)
+        for _ in range(5):
+            self.assertEqual(ocr_image(image), "psm 3 (40, 20)")
+        self.assertEqual(ocr_image(image, psm=6, variables={"a": "1"}), "psm 6 (40, 20)")
+        # One for psm 3 (also used to pick the engine) and one for psm 6
+        self.assertEqual(ocr_engine.engine(), "tesserocr")
+        self.assertEqual(FakeAPI.created, 2)
+
+        # Another thread gets its own instance
+        thread = threading.Thread(target=ocr_image, args=(image,))
+        thread.start()
+        thread.join()
+        self.assertEqual(FakeAPI.created, 3)
+
+    def test_falls_back_to_pytesseract(self):
+        image = Image.new("L", (40, 20), 255)
+        with mock.patch.object(ocr_engine, "tesserocr", None), \
+             mock.patch("pytesseract.image_to_string", return_value="text") as run:
+            self.assertEqual(ocr_image(image, psm=6, variables={"preserve_interword_spaces": "1"}), "text")
+        self.assertEqual(ocr_engine.engine(), "pytesseract")
+        self.assertEqual(run.call_args.kwargs["config"], "--psm 6 -c preserve_interword_spaces=1")
+
+    def test_falls_back_when_language_data_is_missing(self):
+        with mock.patch.object(ocr_engine, "_fallback_reason", None), \
+             mock.patch.object(FakeAPI, "__init__", side_effect=RuntimeError("Failed to init API")):
+            self.assertEqual(ocr_engine.engine(), "pytesseract")
+            self.assertEqual(ocr_engine.fallback_reason(), "tesserocr unavailable (Failed to init API)")
+
+    def test_forced_tesserocr_must_be_available(self):
+        with mock.patch.object(ocr_engine, "OCR_ENGINE", "tesserocr"), mock.patch.object(ocr_engine, "tesserocr", None):
+            with self.assertRaises(RuntimeError):
+                ocr_engine.engine()
+
+    def test_config(self):
+        self.assertEqual(tesseract_config(3), "--psm 3")
+        self.assertEqual(tesseract_config(6, {"a": "1", "b": "x"}), "--psm 6 -c a=1 -c b=x")
+
+    def test_warm_pool_loads_every_thread(self):
+        threads = []
+        original = ocr_engine._get_api
+
+        def get_api(psm, variables):
+            threads.append(threading.current_thread().name)
+            return original(psm, variables)
+
+        with mock.patch.object(ocr_engine, "_get_api", side_effect=get_api):
+            ocr_engine.warm_pool(3)
+        pool_threads = [name for name in threads if name.startswith("ocr")]
+        self.assertEqual(len(set(pool_threads)), 3)
+        # Pages queued afterwards find their instance loaded
+        created = FakeAPI.created
+        page_pool(3).submit(ocr_image, Image.new("L", (10, 10), 255)).result()
+        self.assertEqual(FakeAPI.created, created)
+
+    def test_page_pool_is_reused(self):
+        self.assertIs(page_pool(2), page_pool(2))
+        self.assertIsNot(page_pool(2), page_pool(3))
+        self.assertIs(page_pool(0), page_pool(1))
+
+@unittest.skipUnless(ocr_engine.tesserocr is not None and os.getenv("TESSDATA_PREFIX"), "tesserocr or language data not installed")
+class TestTesserocr(unittest.TestCase):
+
+    def test_reads_text(self):
+        image = Image.new("L", (900, 120), 255)
+        font = ImageFont.load_default(size=40)
+        ImageDraw.Draw(image).text((20, 30), "Hemoglobin 13.5 g/dL", font=font, fill=0)
+        with mock.patch.object(ocr_engine, "_engine", None):
+            self.assertIn("Hemoglobin", ocr_image(image, psm=6))
+            self.assertEqual(ocr_engine.engine(), "tesserocr")
+
+if __name__ == '__main__':
+    unittest.main()
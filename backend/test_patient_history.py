@@ -0,0 +1,86 @@
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest import mock
+from fastapi.testclient import TestClient
+from app import main
+from app.services.data_extractor import extract_results
+from app.services.report_store import ReportStore
+
+async def fake_process_file_content(file, sex=None, age=None):
+    # The first line of each upload is its date, the rest its results
+    content = (await file.read()).decode()
+    report_date, text = content.split("\n", 1)
+    parameters = extract_results(text, sex=sex, age=age)
+    return {
+        "filename": file.filename,
+        "date": report_date,
+        "document_hash": hashlib.sha256(content.encode()).hexdigest(),
+        "parameters": parameters
+    }
+
+def upload(name, report_date, text):
+    return (name, f"{report_date}\n{text}".encode(), "application/pdf")
+
+class TestPatientHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = ReportStore(os.path.join(self.tmp.name, "reports.db"))
+        patches = [
+            mock.patch.object(main, "report_store", self.store),
+            mock.patch.object(main, "process_file_content", fake_process_file_content),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_reports_and_trends(self):
+        for name, report_date, value in (("b.pdf", "2024-06-01", 6.0), ("a.pdf", "2024-01-01", 5.5)):
+            response = self.client.post("/api/patients/p1/reports", files={"file": upload(name, report_date, f"HbA1c {value}")})
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.json()["duplicate"])
+        again = self.client.post("/api/patients/p1/reports", files={"file": upload("a.pdf", "2024-01-01", "HbA1c 5.5")})
+        self.assertTrue(again.json()["duplicate"])
+
+        reports = self.client.get("/api/patients/p1/reports").json()["reports"]
+        self.assertEqual([r["filename"] for r in reports], ["a.pdf", "b.pdf"])
+
+        trends = self.client.get("/api/patients/p1/trends").json()
+        self.assertEqual(trends["report_count"], 2)
+        self.assertEqual(trends["aggregates"]["HbA1c"]["count"], 2)
+        self.assertEqual([p["value"] for p in trends["analysis"]["trends"]["HbA1c"]["series"]], [5.5, 6.0])
+        self.assertEqual(self.client.get("/api/patients/p2/trends").status_code, 404)
+
+    def test_trend_uploads_are_added_to_history(self):
+        self.client.post("/api/patients/p1/reports", files={"file": upload("a.pdf", "2024-01-01", "HbA1c 5.5")})
+        response = self.client.post("/api/analyze-trends", data={"patient_id": "p1"},
+                                    files=[("files", upload("b.pdf", "2024-06-01", "HbA1c 6.0"))])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["report_count"], 2)
+        self.assertEqual(len(self.store.get_reports("p1")), 2)
+
+    def test_history_needs_the_store(self):
+        with mock.patch.object(main, "report_store", None):
+            self.assertEqual(self.client.get("/api/patients/p1/reports").status_code, 501)
+            self.assertEqual(self.client.get("/api/patients/p1/trends").status_code, 501)
+            response = self.client.post("/api/analyze-trends", data={"patient_id": "p1"}, files=[
+                ("files", upload("a.pdf", "2024-01-01", "HbA1c 5.5")),
+                ("files", upload("b.pdf", "2024-06-01", "HbA1c 6.0")),
+            ])
+            self.assertEqual(response.status_code, 501)
+            # Without a patient_id nothing needs to be stored
+            response = self.client.post("/api/analyze-trends", files=[
+                ("files", upload("a.pdf", "2024-01-01", "HbA1c 5.5")),
+                ("files", upload("b.pdf", "2024-06-01", "HbA1c 6.0")),
+            ])
+            self.assertEqual(response.status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
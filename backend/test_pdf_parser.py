@@ -0,0 +1,128 @@
+import asyncio
+import contextlib
+import unittest
+from unittest import mock
+from app.services import pdf_parser
+from app.services.document_executor import DocumentExecutor
+from app.services.data_extractor import extract_parameters, patterns
+from benchmarks import generators
+
+class FakeImage:
+    def __init__(self, page):
+        self.page = page
+
+class TestOcrFallback(unittest.TestCase):
+
+    def setUp(self):
+        self.rendered = []
+
+        def convert_from_path(file_path, dpi, first_page, last_page, grayscale, thread_count):
+            self.rendered.append((first_page, last_page, dpi, grayscale))
+            return [FakeImage(page) for page in range(first_page, last_page + 1)]
+
+        patches = [
+            mock.patch("pdf2image.convert_from_path", side_effect=convert_from_path),
+            mock.patch.object(pdf_parser, "ocr_image", side_effect=lambda image: f"page {image.page}"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_pages_are_rendered_in_chunks_and_joined_in_order(self):
+        pages = list(pdf_parser.ocr_pdf_pages("scan.pdf", list(range(1, 11)), dpi=150, chunk_pages=4, threads=3))
+        self.assertEqual(pages, [f"page {n}" for n in range(1, 11)])
+        self.assertEqual([(first, last) for first, last, _, _ in self.rendered], [(1, 4), (5, 8), (9, 10)])
+        self.assertTrue(all(dpi == 150 for _, _, dpi, _ in self.rendered))
+
+    def test_only_requested_pages_are_rendered(self):
+        pages = list(pdf_parser.ocr_pdf_pages("scan.pdf", [2, 3, 7, 8, 9], chunk_pages=2))
+        self.assertEqual(pages, ["page 2", "page 3", "page 7", "page 8", "page 9"])
+        self.assertEqual([(first, last) for first, last, _, _ in self.rendered], [(2, 3), (7, 8), (9, 9)])
+
+    def test_empty_document(self):
+        self.assertEqual(list(pdf_parser.ocr_pdf_pages("scan.pdf", [])), [])
+        self.assertEqual(self.rendered, [])
+
+class FakePage:
+    def __init__(self, text):
+        self.chars = list(text)
+        self.text = text
+
+    def find_tables(self):
+        return []
+
+    def extract_text(self):
+        return self.text
+
+class TestHybridPages(unittest.TestCase):
+
+    def test_only_pages_without_text_layer_are_ocrd(self):
+        pdf = mock.MagicMock()
+        pdf.__enter__.return_value.pages = [
+            FakePage("Cover page: City Diagnostics Laboratory"),
+            FakePage(""),
+            FakePage("Summary page with a text layer"),
+            FakePage(""),
+        ]
+        ocr = mock.Mock(return_value=iter(["Hemoglobin 13.5", "HbA1c 6.1"]))
+        with mock.patch("pdfplumber.open", return_value=pdf), \
+                mock.patch.object(pdf_parser, "ocr_pdf_pages", ocr):
+            text = pdf_parser.extract_pdf_text("mixed.pdf")
+
+        ocr.assert_called_once_with("mixed.pdf", [2, 4])
+        self.assertEqual(text.splitlines(), [
+            "Cover page: City Diagnostics Laboratory",
+            "Hemoglobin 13.5",
+            "Summary page with a text layer",
+            "HbA1c 6.1",
+        ])
+
+    def test_scanned_pages_take_an_ocr_slot(self):
+        stages = []
+
+        def stage(name):
+            @contextlib.asynccontextmanager
+            async def slot():
+                stages.append(name)
+                yield
+            return mock.Mock(slot=slot)
+
+        executor = DocumentExecutor(max_workers=1, kind="thread")
+        self.addCleanup(executor.shutdown)
+        text_layer = mock.Mock(side_effect=[(["Summary\n"], []), (["Summary\n", ""], [2])])
+        with mock.patch.object(pdf_parser, "pdf_stage", stage("pdf")), \
+                mock.patch.object(pdf_parser, "ocr_stage", stage("ocr")), \
+                mock.patch.object(pdf_parser, "document_executor", executor), \
+                mock.patch.object(pdf_parser, "read_text_layer", text_layer), \
+                mock.patch.object(pdf_parser, "ocr_pdf_pages", return_value=iter(["HbA1c 6.1"])):
+            self.assertEqual(asyncio.run(pdf_parser.parse_pdf(b"%PDF text")), "Summary\n")
+            self.assertEqual(stages, ["pdf"])
+            self.assertEqual(asyncio.run(pdf_parser.parse_pdf(b"%PDF scanned")), "Summary\nHbA1c 6.1\n")
+            self.assertEqual(stages, ["pdf", "pdf", "ocr"])
+
+class TestTables(unittest.TestCase):
+
+    def test_table_cells_are_kept_and_not_repeated(self):
+        rows = generators.table_rows(len(patterns))
+        pdf = generators.table_pdf(rows, header=["Report Date: 04/01/2024"], rows_per_page=10)
+        lines = pdf_parser.extract_pdf_text(pdf).splitlines()
+
+        self.assertEqual([line.split("\t") for line in lines if "\t" in line], rows[:10] + rows[10:20] + rows[20:])
+        self.assertEqual(lines.count("Report Date: 04/01/2024"), 3)
+        self.assertEqual(len(lines), len(rows) + 3)
+        values = {p['parameter']: p['value'] for p in extract_parameters("\n".join(lines))}
+        self.assertEqual(values, {name: float(value) for name, value, _, _ in rows[1:]})
+
+    def test_characters_in_no_cell_are_free_text(self):
+        row = mock.Mock(cells=[(0, 10, 50, 20), (50, 10, 100, 20)])
+        table = mock.Mock(bbox=(0, 0, 100, 20), rows=[row])
+        chars = [
+            {"text": "a", "x0": 10, "x1": 12, "top": 2, "bottom": 6},    # above the first cell
+            {"text": "b", "x0": 60, "x1": 62, "top": 12, "bottom": 16},
+        ]
+        (cells,), free_chars = pdf_parser._split_chars([table], chars)
+        self.assertEqual(free_chars, chars[:1])
+        self.assertEqual([chars_ for _, chars_ in cells[0]], [[], chars[1:]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import asyncio
+import unittest
+import numpy as np
+from app.services import document_cache
+from app.services.data_extractor import extract_results, make_result, patterns, reference_ranges
+from app.services.reference_ranges import ReferenceRanges, Variant, unit_key
+from app.services.trend_analyzer import analyze_trends
+
+def original_status(value, range_tuple, param_name):
+    # The status logic before ranges were compiled, kept as an oracle
+    if param_name == 'HDL Cholesterol':
+        if value >= 60: return 'optimal'
+        elif value < 40: return 'low'
+        return 'normal'
+    if value < range_tuple[0]:
+        return 'low'
+    elif value > range_tuple[1]:
+        return 'high'
+    return 'normal'
+
+def status(results, name):
+    return next(p.status for p in results if p.parameter == name)
+
+class TestReferenceRanges(unittest.TestCase):
+
+    def test_default_ranges_match_original_statuses(self):
+        for name, config in patterns.items():
+            low, high = config['range']
+            for value in (0, low - 0.01, low, (low + high) / 2, high, high + 0.01, 60, 1000):
+                with self.subTest(name=name, value=value):
+                    self.assertEqual(reference_ranges.classify(name, value), original_status(value, config['range'], name))
+
+    def test_sex_and_age_ranges(self):
+        self.assertEqual(reference_ranges.classify('Hemoglobin', 12.5), 'normal')
+        self.assertEqual(reference_ranges.classify('Hemoglobin', 12.5, sex='male'), 'low')
+        self.assertEqual(reference_ranges.classify('Hemoglobin', 17.2, sex='male'), 'normal')
+        self.assertEqual(reference_ranges.classify('Hemoglobin', 16.0, sex='female'), 'high')
+        # Children keep their own range when their sex is given
+        self.assertEqual(reference_ranges.classify('Hemoglobin', 11.5, age=10), 'normal')
+        self.assertEqual(reference_ranges.classify('Hemoglobin', 11.5, sex='female', age=10), 'normal')
+        self.assertEqual(reference_ranges.reference('Serum Creatinine', 'male', 10).normal_range, (0.3, 0.9))
+        self.assertEqual(reference_ranges.reference('Hemoglobin', 'male', 10).normal_range, (11.0, 15.5))
+        self.assertEqual(reference_ranges.reference('Serum Creatinine', 'male', 30).normal_range, (0.7, 1.3))
+        self.assertEqual(reference_ranges.classify('Alkaline Phosphatase', 300, age=12), 'normal')
+        self.assertEqual(reference_ranges.classify('Alkaline Phosphatase', 300, age=18), 'high')
+        self.assertEqual(reference_ranges.classify('HDL Cholesterol', 45, sex='female'), 'low')
+        self.assertEqual(reference_ranges.classify('HDL Cholesterol', 65, sex='female'), 'optimal')
+        self.assertIsNone(reference_ranges.classify('Unknown', 1.0))
+
+        result = make_result('Hemoglobin', 13.0, sex='male')
+        self.assertEqual(result.to_dict()['reference_range_display'], '13.5 - 17.5 g/dL')
+        self.assertEqual(result.to_dict()['normal_range'], (13.5, 17.5))
+
+    def test_age_bands(self):
+        ranges = ReferenceRanges(
+            {'X': {'unit': 'u', 'range': (1, 2)}},
+            variants={'X': [Variant((3, 4), min_age=10, max_age=20), Variant((5, 6), sex='male', min_age=15)]}
+        )
+        ranges_by_sex = ReferenceRanges(
+            {'X': {'unit': 'u', 'range': (1, 2)}},
+            variants={'X': [Variant((3, 4), max_age=18), Variant((5, 6), sex='male'), Variant((7, 8), sex='male', max_age=5)]}
+        )
+        # Sex and age over age over sex
+        for age, low in ((3, 7), (10, 3), (30, 5), (None, 5)):
+            with self.subTest(sex='male', age=age):
+                self.assertEqual(ranges_by_sex.reference('X', 'male', age).normal_range[0], low)
+
+        cases = [(None, None, 1), (None, 5, 1), (None, 10, 3), (None, 19.5, 3), (None, 20, 1),
+                 ('male', 12, 3), ('male', 15, 5), ('male', 70, 5), ('female', 15, 3)]
+        for sex, age, low in cases:
+            with self.subTest(sex=sex, age=age):
+                self.assertEqual(ranges.reference('X', sex, age).normal_range[0], low)
+
+    def test_unit_conversion(self):
+        self.assertEqual(unit_key('µmol/l'), unit_key('umol/L'))
+        self.assertEqual(reference_ranges.to_canonical('Serum Creatinine', 88.42, 'µmol/L'), 1.0)
+        self.assertEqual(reference_ranges.to_canonical('Glucose Fasting', 5.0, 'mmol/L'), 90.08)
+        self.assertEqual(reference_ranges.to_canonical('Glucose Fasting', 90, 'mg/dL'), 90)
+        self.assertEqual(reference_ranges.to_canonical('Glucose Fasting', 90, 'furlongs'), 90)
+
+        results = extract_results("Fasting Blood Sugar\t7.2\tmmol/L\t3.9 - 5.5\nHemoglobin\t135\tg/L")
+        self.assertEqual(status(results, 'Glucose Fasting'), 'high')
+        self.assertEqual(next(p.value for p in results if p.parameter == 'Glucose Fasting'), 129.72)
+        self.assertEqual(next(p.value for p in results if p.parameter == 'Hemoglobin'), 13.5)
+
+    def test_classify_matrix_matches_scalar(self):
+        names = list(patterns) + ['Unknown']
+        rng = np.random.default_rng(0)
+        matrix = rng.uniform(0, 500, size=(len(names), 30)).round(1)
+        for sex, age in ((None, None), ('female', 40), ('male', 8)):
+            statuses, known = reference_ranges.classify_matrix(names, matrix, sex, age)
+            self.assertEqual(known.tolist(), [True] * len(patterns) + [False])
+            for row, name in enumerate(names[:-1]):
+                expected = [reference_ranges.classify(name, value, sex, age) for value in matrix[row]]
+                self.assertEqual(statuses[row].tolist(), expected)
+
+class TestDemographicsDownstream(unittest.TestCase):
+
+    def test_cached_document_is_reclassified(self):
+        document_cache.document_cache.clear()
+        text = "Hemoglobin 13.0\nUric Acid 6.5"
+        document_cache.store_parsed_document("abc", text, extract_results(text))
+        default = document_cache.get_parsed_document("abc")["parameters"]
+        female = document_cache.get_parsed_document("abc", sex="female")["parameters"]
+        self.assertEqual([p.status for p in default], ['normal', 'normal'])
+        self.assertEqual([p.status for p in female], ['normal', 'high'])
+        self.assertEqual(female, extract_results(text, sex="female"))
+
+    def test_trends_use_demographic_ranges(self):
+        reports = [
+            {"filename": "a.pdf", "date": "2024-01-01", "parameters": extract_results("Hemoglobin 13.0")},
+            {"filename": "b.pdf", "date": "2024-06-01", "parameters": extract_results("Hemoglobin 13.2")},
+        ]
+        default = asyncio.run(analyze_trends(reports))["trends"]["Hemoglobin"]
+        male = asyncio.run(analyze_trends(reports, sex="male"))["trends"]["Hemoglobin"]
+        self.assertEqual([point["status"] for point in default["series"]], ['normal', 'normal'])
+        self.assertEqual([point["status"] for point in male["series"]], ['low', 'low'])
+        self.assertEqual(male["out_of_range_streak"], 2)
+
+    def test_trends_keep_statuses_of_unknown_tests(self):
+        reports = [
+            {"filename": f"{i}.pdf", "date": None, "parameters": [
+                {"parameter": "Ferritin", "value": v, "unit": "ng/mL", "status": s},
+                {"parameter": "TSH", "value": 5.0, "unit": "mIU/L", "status": "normal"},
+            ]}
+            for i, (v, s) in enumerate([(10, "low"), (50, "normal")])
+        ]
+        trends = asyncio.run(analyze_trends(reports))["trends"]
+        self.assertEqual([point["status"] for point in trends["Ferritin"]["series"]], ["low", "normal"])
+        # Known tests are judged against the current ranges
+        self.assertEqual([point["status"] for point in trends["TSH"]["series"]], ["high", "high"])
+
+if __name__ == '__main__':
+    unittest.main()
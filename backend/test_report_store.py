@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from app.services.data_extractor import extract_results
+from app.services.report_store import ReportStore
+
+def in_unit(results, unit):
+    return [r._replace(analyte=r.analyte._replace(unit=unit)) for r in results]
+
+class TestReportStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = ReportStore(os.path.join(self.tmp.name, "reports.db"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def add(self, text, date, document_hash=None, patient_id="p1"):
+        return self.store.add_report(patient_id, f"{date}.pdf", extract_results(text), date, document_hash)
+
+    def test_history_is_returned_in_date_order(self):
+        self.add("HbA1c 6.0", "2024-06-01")
+        self.add("HbA1c 5.5", "2024-01-01")
+        self.add("TSH 2.0", "2024-03-01", patient_id="p2")
+        reports = self.store.get_reports("p1")
+        self.assertEqual([r["date"] for r in reports], ["2024-01-01", "2024-06-01"])
+        self.assertEqual(reports[0]["parameters"][0]["value"], 5.5)
+
+    def test_aggregates_are_updated_incrementally(self):
+        self.add("HbA1c 6.0 Total Cholesterol 240", "2024-07-01")
+        self.add("HbA1c 5.0", "2023-07-01")
+        self.add("HbA1c 7.0", "2025-07-01")
+        aggregate = self.store.get_aggregates("p1")["HbA1c"]
+        self.assertEqual(aggregate["count"], 3)
+        self.assertEqual(aggregate["mean"], 6.0)
+        self.assertEqual((aggregate["first_date"], aggregate["first_value"]), ("2023-07-01", 5.0))
+        self.assertEqual((aggregate["latest_date"], aggregate["latest_value"]), ("2025-07-01", 7.0))
+        self.assertEqual(aggregate["latest_status"], "high")
+        self.assertEqual(aggregate["abnormal_count"], 2)
+        self.assertAlmostEqual(aggregate["slope_per_year"], 1.0, places=2)
+        self.assertIsNone(self.store.get_aggregates("p1")["Total Cholesterol"]["slope_per_year"])
+
+    def test_same_document_is_stored_once(self):
+        first_id, created = self.add("HbA1c 6.0", "2024-06-01", "abc")
+        second_id, created_again = self.add("HbA1c 6.0", "2024-06-01", "abc")
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(first_id, second_id)
+        self.assertEqual(self.store.get_aggregates("p1")["HbA1c"]["count"], 1)
+
+    def test_units_are_not_mixed(self):
+        self.store.add_report("p1", "a.pdf", in_unit(extract_results("Glucose Fasting 5.0"), "mmol/L"), "2023-01-01")
+        self.add("Glucose Fasting 90", "2024-01-01")
+        self.add("Glucose Fasting 110", "2024-06-01")
+        aggregate = self.store.get_aggregates("p1")["Glucose Fasting"]
+        self.assertEqual((aggregate["unit"], aggregate["count"], aggregate["min"]), ("mg/dL", 2, 90))
+        self.assertEqual(aggregate["other_units"]["mmol/L"]["mean"], 5.0)
+
+    def test_old_aggregates_are_rebuilt(self):
+        self.add("HbA1c 6.0", "2024-06-01")
+        self.add("HbA1c 5.0", "2024-01-01")
+        self.store.close()
+        path = os.path.join(self.tmp.name, "reports.db")
+        with sqlite3.connect(path) as conn:
+            conn.execute("DROP TABLE parameter_aggregates")
+            conn.execute("CREATE TABLE aggregates (patient_id TEXT, parameter TEXT, PRIMARY KEY (patient_id, parameter))")
+        conn.close()
+
+        self.store = ReportStore(path)
+        aggregate = self.store.get_aggregates("p1")["HbA1c"]
+        self.assertEqual((aggregate["count"], aggregate["first_value"], aggregate["latest_value"]), (2, 5.0, 6.0))
+        with self.assertRaises(sqlite3.OperationalError):
+            self.store._conn.execute("SELECT * FROM aggregates")
+
+if __name__ == '__main__':
+    unittest.main()
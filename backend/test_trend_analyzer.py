@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+from app.services.data_extractor import extract_parameters
+from app.services.trend_analyzer import analyze_trends
+
+def report(filename, text, date=None):
+    return {"filename": filename, "date": date, "parameters": extract_parameters(text)}
+
+class TestTrendAnalyzer(unittest.TestCase):
+
+    def test_reports_are_ordered_by_date(self):
+        reports = [
+            report("b.pdf", "Total Cholesterol 240", "2024-06-01"),
+            report("c.pdf", "Total Cholesterol 180", "2025-01-01"),
+            report("a.pdf", "Total Cholesterol 220", "2024-01-01"),
+        ]
+        trend = asyncio.run(analyze_trends(reports))["trends"]["Total Cholesterol"]
+        self.assertEqual([p["date"] for p in trend["series"]], ["2024-01-01", "2024-06-01", "2025-01-01"])
+        self.assertEqual(trend["direction"], "decreasing")
+        self.assertEqual(trend["latest_value"], 180.0)
+        self.assertEqual(trend["percent_change"], round((180 - 220) / 220 * 100, 4))
+        self.assertEqual(trend["slope_basis"], "year")
+        self.assertLess(trend["slope"], 0)
+
+    def test_undated_reports_keep_upload_order(self):
+        reports = [report("first.pdf", "HbA1c 5.5"), report("second.pdf", "HbA1c 6.0")]
+        trend = asyncio.run(analyze_trends(reports))["trends"]["HbA1c"]
+        self.assertEqual([p["date"] for p in trend["series"]], ["first.pdf", "second.pdf"])
+        self.assertEqual(trend["direction"], "increasing")
+        self.assertEqual(trend["slope_basis"], "report")
+        self.assertEqual(trend["slope"], 0.5)
+
+    def test_rolling_mean_and_streaks_skip_missing_reports(self):
+        reports = [
+            report("1.pdf", "HbA1c 6.0 TSH 2.0", "2024-01-01"),
+            report("2.pdf", "TSH 2.1", "2024-02-01"),
+            report("3.pdf", "HbA1c 6.4 TSH 2.2", "2024-03-01"),
+            report("4.pdf", "HbA1c 5.0 TSH 2.3", "2024-04-01"),
+            report("5.pdf", "HbA1c 6.6 TSH 2.4", "2024-05-01"),
+        ]
+        trend = asyncio.run(analyze_trends(reports))["trends"]["HbA1c"]
+        self.assertEqual(trend["data_points"], 4)
+        self.assertEqual([p["rolling_mean"] for p in trend["series"]], [6.0, 6.2, 5.7, 6.0])
+        self.assertEqual(trend["out_of_range_streak"], 1)
+        self.assertEqual(trend["longest_out_of_range_streak"], 2)
+
+    def test_single_point(self):
+        trend = asyncio.run(analyze_trends([report("a.pdf", "TSH 2.5"), report("b.pdf", "HbA1c 5.0")]))["trends"]["TSH"]
+        self.assertEqual(trend["direction"], "stable")
+        self.assertIsNone(trend["slope"])
+        self.assertIsNone(trend["percent_change"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+from fastapi.testclient import TestClient
+from app import main
+from app.services import document_cache
+from app.services.jobs import JobQueueFull
+
+PDF = b"%PDF-1.4 report"
+
+class TestUploadJobs(unittest.TestCase):
+
+    def setUp(self):
+        document_cache.document_cache.clear()
+        self.addCleanup(document_cache.document_cache.clear)
+        self.release = threading.Event()
+
+        async def explanations(parameters, concurrency=5, on_result=None):
+            on_result(0, "first")
+            # The rest only once the test has seen the partial result
+            while not self.release.is_set():
+                await asyncio.sleep(0.01)
+            for index in range(1, len(parameters)):
+                on_result(index, f"explanation {index}")
+
+        patches = [
+            mock.patch.object(main, "warm_up", mock.AsyncMock()),
+            mock.patch.object(main, "parse_pdf", mock.AsyncMock(return_value="Hemoglobin 10.2\nHbA1c 5.2\nTSH 2.0")),
+            mock.patch.object(main, "generate_explanations", explanations),
+            mock.patch.object(main, "get_health_recommendations", mock.AsyncMock(return_value="see a doctor")),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.client = TestClient(main.app)
+        self.client.__enter__()
+        self.addCleanup(self.client.__exit__, None, None, None)
+
+    def poll(self, url, until, timeout=5):
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.client.get(url).json()
+            if until(job) or time.monotonic() > deadline:
+                return job
+            time.sleep(0.01)
+
+    def test_job_publishes_partial_results(self):
+        response = self.client.post("/api/jobs", files={"file": ("report.pdf", PDF, "application/pdf")})
+        self.assertEqual(response.status_code, 202)
+        url = response.headers["location"]
+        self.assertEqual(url, response.json()["status_url"])
+
+        job = self.poll(url, lambda job: job["progress"].get("explanations_done") == 1)
+        self.assertEqual(job["status"], "running")
+        self.assertEqual(job["stage"], "explain")
+        self.assertEqual(job["stages"], {"parse": "done", "extract": "done", "explain": "running"})
+        self.assertEqual(job["result"]["health_score"], 66)
+        self.assertEqual([p.get("explanation") for p in job["result"]["parameters"]], ["first", None, None])
+        self.assertIsNone(job["result"]["recommendations"])
+
+        self.release.set()
+        job = self.poll(url, lambda job: job["status"] != "running")
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual(job["progress"], {"explanations_done": 3, "explanations_total": 3})
+        self.assertEqual(job["result"]["recommendations"], "see a doctor")
+
+    def test_unreadable_report_fails_the_job(self):
+        main.parse_pdf.return_value = ""
+        response = self.client.post("/api/jobs", files={"file": ("report.pdf", PDF, "application/pdf")})
+        job = self.poll(response.json()["status_url"], lambda job: job["status"] in ("completed", "failed"))
+        self.assertEqual(job["status"], "failed")
+        self.assertEqual(job["stages"]["parse"], "failed")
+        self.assertIn("Could not extract text", job["error"])
+
+    def test_unknown_job(self):
+        response = self.client.get("/api/jobs/nope")
+        self.assertEqual(response.status_code, 404)
+
+    def test_rejected_uploads(self):
+        response = self.client.post("/api/jobs", files={"file": ("report.pdf", b"not a pdf", "application/pdf")})
+        self.assertEqual(response.status_code, 400)
+        with mock.patch.object(main.job_manager, "submit", side_effect=JobQueueFull("full")):
+            response = self.client.post("/api/jobs", files={"file": ("report.pdf", PDF, "application/pdf")})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["retry-after"], "10")
+
+if __name__ == '__main__':
+    unittest.main()
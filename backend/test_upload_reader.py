@@ -0,0 +1,40 @@
+import asyncio
+import hashlib
+import io
+import unittest
+from unittest import mock
+from fastapi import UploadFile
+from app.services import upload_reader
+from app.services.upload_reader import read_upload, InvalidSignature, UploadTooLarge
+
+PDF = b"%PDF-1.4\n" + b"x" * 1000
+
+def upload(content, filename="report.pdf"):
+    return UploadFile(file=io.BytesIO(content), filename=filename)
+
+class TestReadUpload(unittest.TestCase):
+
+    def test_small_upload_stays_in_memory(self):
+        document = asyncio.run(read_upload(upload(PDF), "pdf"))
+        self.assertEqual(document.content, PDF)
+        self.assertEqual(document.size, len(PDF))
+        self.assertEqual(document.sha256, hashlib.sha256(PDF).hexdigest())
+
+    def test_signature_is_checked_before_reading_the_rest(self):
+        file = upload(b"GIF89a" + b"x" * 1000)
+        with self.assertRaises(InvalidSignature):
+            asyncio.run(read_upload(file, "png"))
+        self.assertLessEqual(file.file.tell(), 8)
+
+    def test_unsupported_extension(self):
+        with self.assertRaises(InvalidSignature):
+            asyncio.run(read_upload(upload(PDF, "report.docx"), "docx"))
+
+    def test_size_cap(self):
+        with mock.patch.object(upload_reader, "UPLOAD_CHUNK_BYTES", 100):
+            with self.assertRaises(UploadTooLarge):
+                asyncio.run(read_upload(upload(PDF), "pdf", max_bytes=500))
+            self.assertEqual(asyncio.run(read_upload(upload(PDF), "pdf", max_bytes=len(PDF))).size, len(PDF))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+from app import main
+from app.models.parameter import ParameterResult
+from app.services.data_extractor import analytes
+
+def make_result():
+    return {
+        "filename": "report.pdf",
+        "date": "2024-03-12",
+        "parameters": [
+            ParameterResult(analytes["Hemoglobin"], 10.2, "low"),
+            ParameterResult(analytes["Glucose Fasting"], 90.0, "normal"),
+        ]
+    }
+
+async def slow_explanations(parameters, concurrency=5, on_result=None):
+    explanations = []
+    for index, param in enumerate(parameters):
+        await asyncio.sleep(0.1)
+        explanation = f"about {param['parameter']}"
+        on_result(index, explanation)
+        explanations.append(explanation)
+    return explanations
+
+async def recommendations(abnormal_parameters):
+    await asyncio.sleep(0.05)
+    return f"{len(abnormal_parameters)} abnormal"
+
+class TestUploadEvents(unittest.TestCase):
+
+    def collect(self):
+        async def run():
+            start = time.perf_counter()
+            events = []
+            async for event in main.upload_events(make_result()):
+                events.append((time.perf_counter() - start, event))
+            return events
+
+        with mock.patch.object(main, "generate_explanations", slow_explanations), \
+                mock.patch.object(main, "get_health_recommendations", recommendations):
+            return asyncio.run(run())
+
+    def test_report_is_sent_before_explanations(self):
+        events = self.collect()
+        elapsed, first = events[0]
+        self.assertEqual(first["type"], "report")
+        self.assertEqual(first["health_score"], 50)
+        self.assertLess(elapsed, 0.05)
+
+        types = [event["type"] for _, event in events]
+        self.assertEqual(types, ["report", "recommendations", "explanation", "explanation", "done"])
+        self.assertEqual(events[1][1]["recommendations"], "1 abnormal")
+        self.assertEqual([e["index"] for _, e in events if e["type"] == "explanation"], [0, 1])
+        # Each explanation arrives when it is ready, not at the end
+        self.assertLess(events[2][0], events[3][0] - 0.05)
+
+    def test_error_ends_stream(self):
+        async def failing(parameters, concurrency=5, on_result=None):
+            raise RuntimeError("model unavailable")
+
+        async def run():
+            return [event async for event in main.upload_events(make_result())]
+
+        with mock.patch.object(main, "generate_explanations", failing), \
+                mock.patch.object(main, "get_health_recommendations", recommendations):
+            events = asyncio.run(run())
+        self.assertEqual(events[-1], {"type": "error", "detail": "model unavailable"})
+
+if __name__ == '__main__':
+    unittest.main()
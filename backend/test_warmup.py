@@ -0,0 +1,62 @@
+import sys
+import asyncio
+import subprocess
+import unittest
+from unittest import mock
+from app import main
+from app.services import warmup
+from app.services.document_executor import DocumentExecutor
+
+class TestWarmUp(unittest.TestCase):
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(warmup, "_ready", False),
+            mock.patch.object(warmup, "document_executor", DocumentExecutor(max_workers=2, kind="thread")),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(warmup.document_executor.shutdown)
+
+    def test_loads_provider_and_workers(self):
+        worker = mock.Mock()
+        with mock.patch.object(warmup, "get_provider") as get_provider, \
+             mock.patch.object(warmup, "warm_worker", worker):
+            asyncio.run(warmup.warm_up(enabled=True))
+        get_provider.assert_called_once()
+        self.assertEqual(worker.call_count, 2)
+        self.assertTrue(warmup.is_ready())
+
+    def test_failure_still_marks_ready(self):
+        with mock.patch.object(warmup, "get_provider", side_effect=RuntimeError("bad key")), \
+             mock.patch.object(warmup, "warm_worker"):
+            asyncio.run(warmup.warm_up(enabled=True))
+        self.assertTrue(warmup.is_ready())
+
+    def test_disabled_is_ready_at_once(self):
+        with mock.patch.object(warmup, "get_provider") as get_provider:
+            asyncio.run(warmup.warm_up(enabled=False))
+        get_provider.assert_not_called()
+        self.assertTrue(warmup.is_ready())
+
+    def test_readiness_endpoint(self):
+        response = asyncio.run(main.readiness_check())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+        asyncio.run(warmup.warm_up(enabled=False))
+        self.assertEqual(asyncio.run(main.readiness_check()), {"status": "ready"})
+
+class TestLazyImports(unittest.TestCase):
+
+    def test_app_does_not_load_parsing_libraries(self):
+        code = (
+            "import sys, app.main; "
+            "print(sorted(m for m in ('pandas', 'pdfplumber', 'pdf2image', 'pytesseract', 'google.generativeai') if m in sys.modules))"
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "[]")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -85,7 +85,7 @@ const ParameterCard = ({ data }) => {
             {expanded && (
                 <div className="px-5 py-4 bg-gray-50 text-sm text-text-medium leading-relaxed border-t border-gray-100 animate-slide-up">
                     <p className="border-l-2 border-primary/30 pl-3">
-                        {explanation}
+                        {explanation ?? <span className="text-gray-400 italic">Generating explanation...</span>}
                     </p>
                 </div>
             )}
@@ -13,7 +13,7 @@ const RecommendationsPanel = ({ recommendations }) => {
                 <div>
                     <h3 className="text-lg font-bold text-gray-900 mb-2">Health Recommendations</h3>
                     <p className="text-gray-700 leading-relaxed text-sm md:text-base">
-                        {recommendations}
+                        {recommendations ?? <span className="text-gray-400 italic">Preparing recommendations...</span>}
                     </p>
                 </div>
             </div>
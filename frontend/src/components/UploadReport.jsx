@@ -74,16 +74,61 @@ const UploadReport = ({ onUploadSuccess, onTrendAnalysisSuccess, setLoading, set
             let endpoint = '';
 
             if (mode === 'single') {
-                endpoint = 'http://localhost:8000/api/upload';
+                endpoint = 'http://localhost:8000/api/upload/stream';
                 formData.append('file', files[0]);
 
-                const response = await axios.post(endpoint, formData, {
-                    headers: { 'Content-Type': 'multipart/form-data' },
-                });
+                const response = await fetch(endpoint, { method: 'POST', body: formData });
+                if (!response.ok) {
+                    const body = await response.json().catch(() => ({}));
+                    throw { response: { data: body } };
+                }
 
-                if (response.data.success) {
-                    onUploadSuccess(response.data);
-                } else {
+                // Results arrive as newline-delimited JSON: the report first,
+                // then explanations and recommendations as they are ready.
+                let results = null;
+                let failed = false;
+                const handleEvent = (event) => {
+                    if (event.type === 'report') {
+                        const { type, ...report } = event;
+                        results = { success: true, ...report, recommendations: null };
+                        setLoading(false);
+                    } else if (event.type === 'explanation') {
+                        const parameters = [...results.parameters];
+                        parameters[event.index] = { ...parameters[event.index], explanation: event.explanation };
+                        results = { ...results, parameters };
+                    } else if (event.type === 'recommendations') {
+                        results = { ...results, recommendations: event.recommendations };
+                    } else if (event.type === 'error') {
+                        failed = true;
+                        if (results) {
+                            // Nothing more will arrive, so drop the loading placeholders
+                            const parameters = results.parameters.map(p => ({ ...p, explanation: p.explanation ?? "Explanation unavailable." }));
+                            results = { ...results, parameters, recommendations: results.recommendations ?? "Recommendations unavailable." };
+                            onUploadSuccess(results);
+                        }
+                        // After onUploadSuccess, which clears the error
+                        setError(event.detail);
+                        return;
+                    } else {
+                        return;
+                    }
+                    onUploadSuccess(results);
+                };
+
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const lines = buffer.split('\n');
+                    buffer = lines.pop();
+                    lines.filter(line => line.trim()).forEach(line => handleEvent(JSON.parse(line)));
+                }
+                if (buffer.trim()) handleEvent(JSON.parse(buffer));
+
+                if (!results && !failed) {
                     setError("Analysis failed. Please try again.");
                 }
             } else {
@@ -105,7 +150,14 @@ const UploadReport = ({ onUploadSuccess, onTrendAnalysisSuccess, setLoading, set
 
         } catch (err) {
             console.error(err);
-            setError(err.response?.data?.detail || "An error occurred. Ensure backend is running.");
+            const detail = err.response?.data?.detail;
+            if (detail?.failed_files) {
+                // Trend analysis says which uploads could not be read
+                const failed = detail.failed_files.map(f => `${f.filename}: ${f.error}`).join('; ');
+                setError(failed ? `${detail.message} (${failed})` : detail.message);
+            } else {
+                setError(detail || "An error occurred. Ensure backend is running.");
+            }
         } finally {
             setUploading(false);
             setLoading(false);